@@ -1,319 +1,1127 @@
-from fastapi import FastAPI, HTTPException, Form, Depends
-from fastapi.security import OAuth2PasswordBearer
-from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine, Column, Integer, String, Text
-from sqlalchemy.orm import sessionmaker, declarative_base, Session
-from sqlalchemy.exc import OperationalError
-from passlib.context import CryptContext
-import uvicorn
-import json
-import os
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from typing import Generator, List
-from datetime import datetime, timezone  # إضافة timezone
-
-app = FastAPI(title="Financial Insights API", description="API for user authentication and financial data")
-
-# إعداد CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# إعداد قاعدة البيانات
-DATABASE_URL = "sqlite:///./users.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
-
-# تعريف النماذج (Tables)
-class User(Base):
-    __tablename__ = "users"
-    id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, unique=True, index=True)
-    email = Column(String, unique=True, index=True, nullable=False)
-    hashed_password = Column(String)
-    role = Column(String, default="Regular User")
-
-class Suggestion(Base):
-    __tablename__ = "suggestions"
-    __table_args__ = {'extend_existing': True}  # إصلاح InvalidRequestError
-    id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, index=True)
-    suggestion = Column(Text, nullable=False)
-    created_at = Column(String, default=lambda: datetime.now(timezone.utc).isoformat())  # إصلاح DeprecationWarning
-
-class Evaluation(Base):
-    __tablename__ = "evaluations"
-    id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, index=True)
-    report = Column(Text, nullable=False)
-    quality = Column(Integer, nullable=False)
-    created_at = Column(String, default=lambda: datetime.now(timezone.utc).isoformat())  # إصلاح DeprecationWarning
-
-# تهيئة قاعدة البيانات
-def init_db():
-    try:
-        # إنشاء الجداول إذا لم تكن موجودة
-        Base.metadata.create_all(bind=engine)
-        
-        with engine.connect() as connection:
-            # التحقق من وجود عمود role
-            result = connection.execute("PRAGMA table_info(users)")
-            columns = [col['name'] for col in result.fetchall()]
-            if 'role' not in columns:
-                connection.execute("ALTER TABLE users ADD COLUMN role TEXT DEFAULT 'Regular User'")
-                print("Added 'role' column to users table")
-            
-            # التحقق من وجود عمود email
-            if 'email' not in columns:
-                connection.execute("ALTER TABLE users ADD COLUMN email TEXT")
-                connection.execute("UPDATE users SET email = username || '@default.com' WHERE email IS NULL")
-                print("Added 'email' column to users table and set default emails")
-            
-            # التأكد من أن عمود email غير قابل للقيم الفارغة
-            connection.execute("CREATE TABLE temp_users AS SELECT id, username, email, hashed_password, role FROM users")
-            connection.execute("DROP TABLE users")
-            connection.execute("""
-                CREATE TABLE users (
-                    id INTEGER PRIMARY KEY,
-                    username TEXT UNIQUE,
-                    email TEXT UNIQUE NOT NULL,
-                    hashed_password TEXT,
-                    role TEXT DEFAULT 'Regular User'
-                )
-            """)
-            connection.execute("INSERT INTO users SELECT * FROM temp_users")
-            connection.execute("DROP TABLE temp_users")
-            print("Ensured 'email' column is NOT NULL")
-            
-    except Exception as e:
-        print(f"Error initializing database: {str(e)}")
-
-init_db()
-
-# إعدادات الأمان
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_db() -> Generator[Session, None, None]:
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-# نماذج Pydantic
-class UserCreate(BaseModel):
-    username: str
-    email: str
-    password: str
-    role: str
-
-class UserLogin(BaseModel):
-    username: str
-    password: str
-
-class UserResponse(BaseModel):
-    username: str
-    email: str
-    role: str
-
-class SuggestionCreate(BaseModel):
-    username: str
-    suggestion: str
-
-class EvaluationCreate(BaseModel):
-    username: str
-    report: str
-    quality: int
-
-# الوظائف (Endpoints)
-@app.post("/register")
-async def register(
-    username: str = Form(...),
-    email: str = Form(...),
-    password: str = Form(...),
-    role: str = Form(...),
-    db: Session = Depends(get_db)
-):
-    try:
-        if not username or not email or not password or not role:
-            raise HTTPException(status_code=400, detail="Missing required fields")
-        if role not in ["Regular User", "Expert", "Administrator"]:
-            raise HTTPException(status_code=400, detail="Invalid role. Must be 'Regular User', 'Expert', or 'Administrator'")
-       
-        if db.query(User).filter(User.username == username).first():
-            raise HTTPException(status_code=400, detail="Username already exists")
-        if db.query(User).filter(User.email == email).first():
-            raise HTTPException(status_code=400, detail="Email already exists")
-        hashed_password = get_password_hash(password)
-        new_user = User(username=username, email=email, hashed_password=hashed_password, role=role)
-        db.add(new_user)
-        db.commit()
-        return {"msg": "User registered successfully"}
-    except OperationalError as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Registration error: {str(e)}")
-
-@app.post("/login")
-async def login(username: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
-    try:
-        if not username or not password:
-            raise HTTPException(status_code=400, detail="Missing username or password")
-        user = db.query(User).filter(User.username == username).first()
-        if not user:
-            raise HTTPException(status_code=400, detail="Invalid username")
-        if not verify_password(password, user.hashed_password):
-            raise HTTPException(status_code=400, detail="Invalid password")
-        return {"msg": f"Welcome {username}", "role": user.role, "email": user.email}
-    except OperationalError as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Login error: {str(e)}")
-
-@app.get("/users", response_model=List[UserResponse])
-async def get_users(db: Session = Depends(get_db)):
-    try:
-        users = db.query(User).all()
-        return [{"username": user.username, "email": user.email, "role": user.role} for user in users]
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching users: {str(e)}")
-
-@app.put("/users/{username}")
-async def update_user_role(username: str, role: str, db: Session = Depends(get_db)):
-    try:
-        user = db.query(User).filter(User.username == username).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        if role not in ["Regular User", "Expert", "Administrator"]:
-            raise HTTPException(status_code=400, detail="Invalid role")
-        user.role = role
-        db.commit()
-        return {"msg": f"Role updated for {username}"}
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error updating user role: {str(e)}")
-
-@app.delete("/users/{username}")
-async def delete_user(username: str, db: Session = Depends(get_db)):
-    try:
-        user = db.query(User).filter(User.username == username).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        db.delete(user)
-        db.commit()
-        return {"msg": f"User {username} deleted successfully"}
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error deleting user: {str(e)}")
-
-@app.get("/data/cleaned")
-async def get_cleaned_data():
-    try:
-        file_path = r"C:\Users\Fa\Desktop\Streamlit-Authentication-main\cleaned.json"
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="Cleaned data file not found")
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return JSONResponse(content=data)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error loading cleaned data: {str(e)}")
-
-@app.get("/data/financial_phrasebank")
-async def get_financial_phrasebank_data():
-    try:
-        file_path = r"C:\Users\Fa\Desktop\Streamlit-Authentication-main\financial_phrasebank (2).json"
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="Financial phrasebank data file not found")
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return JSONResponse(content=data)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error loading financial phrasebank data: {str(e)}")
-
-@app.get("/data/apple")
-async def get_apple_data():
-    try:
-        file_path = r"C:\Users\Fa\Desktop\Streamlit-Authentication-main\stock_AAPL-1.json"
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="Apple data file not found")
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return JSONResponse(content=data)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error loading Apple data: {str(e)}")
-
-@app.get("/data/meta")
-async def get_meta_data():
-    try:
-        file_path = r"C:\Users\Fa\Desktop\Streamlit-Authentication-main\stock_META-1.json"
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="Meta data file not found")
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return JSONResponse(content=data)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error loading Meta data: {str(e)}")
-
-@app.get("/data/microsoft")
-async def get_microsoft_data():
-    try:
-        file_path = r"C:\Users\Fa\Desktop\Streamlit-Authentication-main\stock_MSFT-1.json"
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="Microsoft data file not found")
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return JSONResponse(content=data)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error loading Microsoft data: {str(e)}")
-
-@app.post("/suggestions")
-async def submit_suggestion(suggestion: SuggestionCreate, db: Session = Depends(get_db)):
-    try:
-        user = db.query(User).filter(User.username == suggestion.username).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        new_suggestion = Suggestion(username=suggestion.username, suggestion=suggestion.suggestion)
-        db.add(new_suggestion)
-        db.commit()
-        return {"msg": "Suggestion received and stored successfully"}
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error submitting suggestion: {str(e)}")
-
-@app.post("/evaluations")
-async def submit_evaluation(evaluation: EvaluationCreate, db: Session = Depends(get_db)):
-    try:
-        user = db.query(User).filter(User.username == evaluation.username).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        if not (1 <= evaluation.quality <= 5):
-            raise HTTPException(status_code=400, detail="Quality must be between 1 and 5")
-        new_evaluation = Evaluation(
-            username=evaluation.username,
-            report=evaluation.report,
-            quality=evaluation.quality
-        )
-        db.add(new_evaluation)
-        db.commit()
-        return {"msg": "Evaluation received and stored successfully"}
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error submitting evaluation: {str(e)}")
-
-if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8002)
+from fastapi import FastAPI, HTTPException, Form, Depends, Query, File, UploadFile
+from fastapi.security import OAuth2PasswordBearer
+from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import Column, Float, Index, Integer, String, Text, func, select, insert, or_, text
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.exc import IntegrityError, OperationalError
+import uvicorn
+import csv
+import io
+import asyncio
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from typing import AsyncGenerator, List
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone  # إضافة timezone
+import data_access
+import database
+import instrumentation
+import jobs
+import llm_scheduler
+import metrics
+import migrations
+import query_log
+import security
+import tracing
+import write_behind
+from security import hash_password_async, verify_password_async
+from security import create_session_token, decode_session_token, revoke_user_tokens, InvalidTokenError
+
+app = FastAPI(title="Financial Insights API", description="API for user authentication and financial data")
+
+# إعداد CORS
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+# مقاييس HTTP بصيغة Prometheus (عدد الطلبات، زمن الاستجابة، الطلبات الجارية، أحجام الحمولة) تُعرض في /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
+# إعداد قاعدة البيانات
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./users.db")
+# المحرك المتزامن يُستخدم للترحيلات فقط، والمسارات تستخدم المحرك غير المتزامن (aiosqlite)
+engine = database.make_engine(DATABASE_URL)
+async_engine = database.make_async_engine(DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+# التخزين المؤجل للاقتراحات والتقييمات (معطل افتراضياً): تُجمع الصفوف وتُكتب في معاملة واحدة لكل دفعة
+WRITE_BEHIND_ENABLED = os.environ.get("WRITE_BEHIND_ENABLED", "0").lower() in ("1", "true", "yes")
+WRITE_BEHIND_INTERVAL_MS = int(os.environ.get("WRITE_BEHIND_INTERVAL_MS", "200"))
+WRITE_BEHIND_MAX_ROWS = int(os.environ.get("WRITE_BEHIND_MAX_ROWS", "500"))
+# حد أقصى للصفوف المنتظرة (بما فيها المعاد محاولتها)؛ بعده يعيد الخادم 503 بدلاً من نمو الذاكرة
+WRITE_BEHIND_MAX_PENDING = int(os.environ.get("WRITE_BEHIND_MAX_PENDING", "10000"))
+FEEDBACK_BATCH_LIMIT = int(os.environ.get("FEEDBACK_BATCH_LIMIT", "1000"))
+USER_IMPORT_LIMIT = int(os.environ.get("USER_IMPORT_LIMIT", "5000"))
+feedback_buffer = None
+Base = declarative_base()
+
+# تعريف النماذج (Tables)
+class User(Base):
+    __tablename__ = "users"
+    # فهرس مركب لتصفية المستخدمين حسب الدور مع الترقيم حسب اسم المستخدم
+    __table_args__ = (Index("ix_users_role_username", "role", "username"),)
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String, unique=True, index=True)
+    email = Column(String, unique=True, index=True, nullable=False)
+    hashed_password = Column(String)
+    role = Column(String, default="Regular User")
+
+class Suggestion(Base):
+    __tablename__ = "suggestions"
+    __table_args__ = {'extend_existing': True}  # إصلاح InvalidRequestError
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String, index=True)
+    suggestion = Column(Text, nullable=False)
+    created_at = Column(String, default=lambda: datetime.now(timezone.utc).isoformat())  # إصلاح DeprecationWarning
+
+class Evaluation(Base):
+    __tablename__ = "evaluations"
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String, index=True)
+    report = Column(Text, nullable=False)
+    quality = Column(Integer, nullable=False)
+    created_at = Column(String, default=lambda: datetime.now(timezone.utc).isoformat())  # إصلاح DeprecationWarning
+
+# جداول التجميع: صف لكل (مستخدم، يوم)، و"*" تعني كل المستخدمين أو كل الأيام
+ROLLUP_ALL = "*"
+QUALITY_LEVELS = range(1, 6)
+
+class EvaluationRollup(Base):
+    __tablename__ = "evaluation_rollups"
+    username = Column(String, primary_key=True)
+    day = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    quality_sum = Column(Integer, nullable=False, default=0)
+    q1 = Column(Integer, nullable=False, default=0)
+    q2 = Column(Integer, nullable=False, default=0)
+    q3 = Column(Integer, nullable=False, default=0)
+    q4 = Column(Integer, nullable=False, default=0)
+    q5 = Column(Integer, nullable=False, default=0)
+
+class SuggestionRollup(Base):
+    __tablename__ = "suggestion_rollups"
+    username = Column(String, primary_key=True)
+    day = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+# سجل الاستعلامات والتقارير، مع فهرس نصي كامل (FTS5) في query_history_fts يُحدَّث عبر المشغلات
+class QueryHistory(Base):
+    __tablename__ = "query_history"
+    __table_args__ = (Index("ix_query_history_username_created_at", "username", "created_at"),)
+    id = Column(Integer, primary_key=True)
+    username = Column(String, nullable=False)
+    query = Column(Text, nullable=False)
+    answer = Column(Text, nullable=False)
+    tool = Column(String)
+    latency_ms = Column(Float)
+    created_at = Column(String, nullable=False, default=lambda: datetime.now(timezone.utc).isoformat())
+
+# نسخة من حالة مهام الاستعلام، حتى يجيب أي عامل (process) عن مهمة بدأها عامل آخر
+class QueryJob(Base):
+    __tablename__ = "query_jobs"
+    id = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    result = Column(Text)
+    error = Column(Text)
+    created_at = Column(Float, nullable=False)
+    started_at = Column(Float)
+    finished_at = Column(Float)
+    deadline = Column(Float, nullable=False)
+
+# إبطال رموز الجلسات، لتطبيقه في كل العمال وليس فقط في العامل الذي نفّذ التغيير
+class TokenRevocation(Base):
+    __tablename__ = "token_revocations"
+    username = Column(String, primary_key=True)
+    revoked_at = Column(Float, nullable=False)
+
+# تهيئة قاعدة البيانات عبر ترحيلات مرقمة (لا يتم نسخ الصفوف عندما يكون المخطط محدثاً)
+def init_db():
+    try:
+        for migration in migrations.migrate(engine, Base.metadata):
+            print(f"Applied migration {migration}")
+    except Exception as e:
+        print(f"Error initializing database: {str(e)}")
+
+init_db()
+
+# حساب المسؤول الأول: التسجيل الذاتي لا يمنح إلا دور "Regular User"، لذلك يُنشأ أول مسؤول عند التشغيل
+# من INITIAL_ADMIN_USERNAME و INITIAL_ADMIN_PASSWORD (و INITIAL_ADMIN_EMAIL اختيارياً) إذا لم يوجد أي مسؤول.
+# إذا كان اسم المستخدم مسجلاً مسبقاً يُرقّى وتُستبدل كلمة مروره وتُبطل رموزه القديمة
+INITIAL_ADMIN_USERNAME = os.environ.get("INITIAL_ADMIN_USERNAME", "")
+INITIAL_ADMIN_PASSWORD = os.environ.get("INITIAL_ADMIN_PASSWORD", "")
+INITIAL_ADMIN_EMAIL = os.environ.get("INITIAL_ADMIN_EMAIL", "")
+
+def ensure_initial_admin():
+    if not INITIAL_ADMIN_USERNAME or not INITIAL_ADMIN_PASSWORD:
+        return
+    try:
+        with engine.begin() as connection:
+            if connection.execute(select(User.id).where(User.role == "Administrator").limit(1)).first() is not None:
+                return
+            hashed_password = security.get_password_hash(INITIAL_ADMIN_PASSWORD)
+            existing = connection.execute(select(User.id).where(User.username == INITIAL_ADMIN_USERNAME)).first()
+            if existing is None:
+                connection.execute(insert(User).values(
+                    username=INITIAL_ADMIN_USERNAME,
+                    email=INITIAL_ADMIN_EMAIL or f"{INITIAL_ADMIN_USERNAME}@localhost",
+                    hashed_password=hashed_password,
+                    role="Administrator",
+                ))
+            else:
+                connection.execute(
+                    User.__table__.update().where(User.username == INITIAL_ADMIN_USERNAME)
+                    .values(hashed_password=hashed_password, role="Administrator")
+                )
+                statement = sqlite_insert(TokenRevocation).values(username=INITIAL_ADMIN_USERNAME, revoked_at=time.time())
+                connection.execute(statement.on_conflict_do_update(
+                    index_elements=[TokenRevocation.username], set_={"revoked_at": statement.excluded.revoked_at}
+                ))
+        print(f"Granted the Administrator role to {INITIAL_ADMIN_USERNAME}")
+    except IntegrityError:
+        # عامل آخر أنشأ الحساب في الوقت نفسه
+        pass
+    except Exception as e:
+        print(f"Error creating the initial administrator: {str(e)}")
+
+ensure_initial_admin()
+
+# إعدادات الأمان (التشفير يتم في security.py خارج حلقة الأحداث)
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+
+# محرك الاستعلامات يُبنى مرة واحدة عند أول مهمة، داخل عامل من مجمع المهام،
+# أو مسبقاً في الخلفية عند تسجيل الدخول (/query/warmup) أو عند التشغيل إذا فُعّل QUERY_ENGINE_PRELOAD
+QUERY_ENGINE_PRELOAD = os.environ.get("QUERY_ENGINE_PRELOAD", "0").lower() in ("1", "true", "yes")
+_router_engine = None
+_router_engine_lock = threading.Lock()
+_warmup_thread = None
+_warmup_lock = threading.Lock()
+
+def get_router_engine():
+    global _router_engine
+    with _router_engine_lock:
+        if _router_engine is None:
+            import query_engine
+            _router_engine = query_engine.initialize_query_engine(data_access.DATASET_PATHS)
+            if _router_engine is None:
+                raise RuntimeError("Query engine could not be initialized")
+        return _router_engine
+
+def warm_up_router_engine():
+    try:
+        get_router_engine()
+    except Exception as e:
+        print(f"Query engine warm-up failed: {str(e)}")
+
+def start_router_warmup() -> str:
+    """Build the query engine in a background thread unless it is built or being built; returns its state."""
+    global _warmup_thread
+    with _warmup_lock:
+        if _router_engine is not None:
+            return "ready"
+        if _warmup_thread is None or not _warmup_thread.is_alive():
+            _warmup_thread = threading.Thread(target=warm_up_router_engine, name="query-engine-warmup", daemon=True)
+            _warmup_thread.start()
+        return "warming"
+
+def execute_query(payload: dict) -> dict:
+    import query_engine
+    try:
+        result = query_engine.run_query_detailed(payload["query"], get_router_engine(), role=payload.get("role"))
+    except Exception as e:
+        query_log.record(payload["query"], role=payload.get("role"), error=str(e))
+        raise
+    query_log.record(payload["query"], role=payload.get("role"), result=result)
+    return result
+
+ACTIVE_JOB_STATUSES = (jobs.QUEUED, jobs.RUNNING)
+
+def persist_job(job: dict):
+    # يستقبل لقطة من مدير المهام عند كل تغيير في الحالة (في خيط منفصل وخارج قفله)؛
+    # لا يكتب فوق مهمة منتهية (مثلاً ألغاها عامل آخر)
+    values = dict(job, result=json.dumps(job["result"], default=str) if job["result"] is not None else None)
+    statement = sqlite_insert(QueryJob).values(**values)
+    statement = statement.on_conflict_do_update(
+        index_elements=[QueryJob.id],
+        set_={key: statement.excluded[key] for key in values if key != "id"},
+        where=QueryJob.status.in_(ACTIVE_JOB_STATUSES),
+    )
+    with engine.begin() as connection:
+        if job["status"] == jobs.QUEUED:
+            connection.execute(QueryJob.__table__.delete().where(QueryJob.finished_at < time.time() - jobs.JOB_RETENTION))
+        connection.execute(statement)
+
+QUERY_PERSIST_TIMEOUT = 5
+query_jobs = jobs.JobManager(execute_query, on_change=persist_job)
+
+@app.on_event("startup")
+async def start_write_behind():
+    global feedback_buffer
+    if WRITE_BEHIND_ENABLED:
+        feedback_buffer = write_behind.WriteBehindBuffer(
+            AsyncSessionLocal, store_feedback, interval_ms=WRITE_BEHIND_INTERVAL_MS, max_rows=WRITE_BEHIND_MAX_ROWS,
+            max_pending=WRITE_BEHIND_MAX_PENDING,
+        )
+        feedback_buffer.start()
+
+@app.on_event("startup")
+async def preload_query_engine():
+    if QUERY_ENGINE_PRELOAD:
+        start_router_warmup()
+
+# تحميل البيانات مسبقاً في الخلفية عند التشغيل، و/ready يعيد 503 حتى يكتمل.
+# مع gunicorn (preload_app) تكون البيانات محملة قبل إنشاء العمال فتُشارك بينهم (copy-on-write)
+DATA_PRELOAD = os.environ.get("DATA_PRELOAD", "1").lower() in ("1", "true", "yes")
+_data_preload = {"done": False, "errors": {}}
+
+def preload_datasets():
+    _data_preload["errors"] = data_access.preload()
+    _data_preload["done"] = True
+
+@app.on_event("startup")
+async def start_data_preload():
+    if DATA_PRELOAD:
+        threading.Thread(target=preload_datasets, name="data-preload", daemon=True).start()
+    else:
+        _data_preload["done"] = True
+
+def after_fork():
+    """Give a forked worker process its own database connection pools (called from gunicorn's post_fork hook)."""
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+
+@app.on_event("shutdown")
+async def shutdown_pools():
+    # تفريغ الصفوف المعلقة قبل إغلاق محرك قاعدة البيانات
+    if feedback_buffer is not None:
+        await feedback_buffer.stop()
+    query_jobs.shutdown()
+    security.shutdown()
+    await async_engine.dispose()
+
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def find_user(db: AsyncSession, username: str):
+    result = await db.execute(select(User).where(User.username == username))
+    return result.scalar_one_or_none()
+
+# التحقق من رمز الجلسة بدون الرجوع إلى قاعدة البيانات
+# الإبطالات التي سجلها عمال آخرون تُقرأ من قاعدة البيانات مرة كل REVOCATION_SYNC_SECONDS على الأكثر
+REVOCATION_SYNC_SECONDS = float(os.environ.get("REVOCATION_SYNC_SECONDS", "2"))
+# هامش لإعادة قراءة الإبطالات الحديثة، لأن عاملاً آخر قد يثبّت إبطالاً بطابع زمني أقدم مما قُرئ
+REVOCATION_SYNC_LOOKBACK = 60
+_revocation_sync = {"checked": 0.0, "seen": time.time() - security.SESSION_TTL}
+_revocation_sync_lock = threading.Lock()
+
+def sync_revocations():
+    now = time.monotonic()
+    if now - _revocation_sync["checked"] < REVOCATION_SYNC_SECONDS or not _revocation_sync_lock.acquire(blocking=False):
+        return
+    try:
+        with engine.connect() as connection:
+            rows = connection.execute(
+                select(TokenRevocation.username, TokenRevocation.revoked_at)
+                .where(TokenRevocation.revoked_at > _revocation_sync["seen"] - REVOCATION_SYNC_LOOKBACK)
+            ).all()
+        for username, revoked_at in rows:
+            revoke_user_tokens(username, revoked_at)
+            _revocation_sync["seen"] = max(_revocation_sync["seen"], revoked_at)
+        _revocation_sync["checked"] = now
+    except Exception as e:
+        print(f"Error syncing token revocations: {str(e)}")
+    finally:
+        _revocation_sync_lock.release()
+
+async def record_revocation(db: AsyncSession, username: str) -> float:
+    revoked_at = time.time()
+    statement = sqlite_insert(TokenRevocation).values(username=username, revoked_at=revoked_at)
+    await db.execute(statement.on_conflict_do_update(index_elements=[TokenRevocation.username], set_={"revoked_at": revoked_at}))
+    return revoked_at
+
+def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
+    sync_revocations()
+    try:
+        return decode_session_token(token)
+    except InvalidTokenError as e:
+        raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+
+def require_admin(current_user: dict = Depends(get_current_user)) -> dict:
+    if current_user["role"] != "Administrator":
+        raise HTTPException(status_code=403, detail="Administrator role required")
+    return current_user
+
+def can_act_for(username: str, current_user: dict) -> bool:
+    return current_user["sub"] == username or current_user["role"] == "Administrator"
+
+def require_same_user(username: str, current_user: dict):
+    if not can_act_for(username, current_user):
+        raise HTTPException(status_code=403, detail="Cannot act on behalf of another user")
+
+def rollup_keys(username: str, created_at: str) -> list:
+    day = created_at[:10]
+    return [(username, day), (username, ROLLUP_ALL), (ROLLUP_ALL, day), (ROLLUP_ALL, ROLLUP_ALL)]
+
+def upsert_rollup(model, counters: list) -> tuple:
+    """Build an INSERT .. ON CONFLICT DO UPDATE that adds ``counters`` to the existing rollup row."""
+    statement = sqlite_insert(model)
+    return statement.on_conflict_do_update(
+        index_elements=["username", "day"],
+        set_={name: getattr(model, name) + statement.excluded[name] for name in counters},
+    )
+
+async def update_rollups(db: AsyncSession, model, rows: List[dict]):
+    """Add ``rows`` to the rollup tables inside the caller's transaction."""
+    if model is Evaluation:
+        counters = ["count", "quality_sum"] + [f"q{level}" for level in QUALITY_LEVELS]
+        totals = defaultdict(lambda: dict.fromkeys(counters, 0))
+        for row in rows:
+            for key in rollup_keys(row["username"], row["created_at"]):
+                total = totals[key]
+                total["count"] += 1
+                total["quality_sum"] += row["quality"]
+                if row["quality"] in QUALITY_LEVELS:
+                    total[f"q{row['quality']}"] += 1
+        rollup = EvaluationRollup
+    elif model is Suggestion:
+        counters = ["count"]
+        totals = defaultdict(lambda: {"count": 0})
+        for row in rows:
+            for key in rollup_keys(row["username"], row["created_at"]):
+                totals[key]["count"] += 1
+        rollup = SuggestionRollup
+    else:
+        return
+    await db.execute(
+        upsert_rollup(rollup, counters),
+        [dict(total, username=username, day=day) for (username, day), total in totals.items()],
+    )
+
+# كل عمليات إدراج الاقتراحات والتقييمات تمر من هنا (مباشرة أو عبر التخزين المؤجل)، مع تحديث جداول التجميع في نفس المعاملة
+async def store_feedback(db: AsyncSession, model, rows: List[dict]):
+    await db.execute(insert(model), rows)
+    await update_rollups(db, model, rows)
+
+async def save_feedback(db: AsyncSession, model, rows: List[dict]) -> bool:
+    """Insert ``rows`` now, or queue them when write-behind is enabled. Returns True if queued."""
+    if feedback_buffer is not None:
+        await db.rollback()
+        try:
+            await feedback_buffer.add(model, rows)
+        except write_behind.BufferFullError as e:
+            raise HTTPException(status_code=503, detail=f"{str(e)}, try again later")
+        return True
+    await store_feedback(db, model, rows)
+    await db.commit()
+    return False
+
+def received_at() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+async def partition_feedback(db: AsyncSession, items: list, current_user: dict, to_row, validate=None):
+    """
+    Split a feedback batch into insertable rows and per-row rejections.
+    Args:
+        db (AsyncSession): Session used for the single user-existence query.
+        items (list): SuggestionCreate or EvaluationCreate payloads.
+        current_user (dict): Claims of the caller's session token.
+        to_row: Callable turning a payload into a column dict.
+        validate: Optional callable returning an error message for an invalid payload, or None.
+    Returns:
+        tuple: (rows, rejected) where rejected holds {"index", "detail"} entries.
+    """
+    result = await db.execute(select(User.username).where(User.username.in_({item.username for item in items})))
+    known = set(result.scalars())
+    rows, rejected = [], []
+    for index, item in enumerate(items):
+        if not can_act_for(item.username, current_user):
+            detail = "Cannot act on behalf of another user"
+        elif item.username not in known:
+            detail = "User not found"
+        else:
+            detail = validate(item) if validate else None
+        if detail:
+            rejected.append({"index": index, "detail": detail})
+        else:
+            rows.append(to_row(item))
+    return rows, rejected
+
+# نماذج Pydantic
+class UserCreate(BaseModel):
+    username: str
+    email: str
+    password: str
+    role: str
+
+class UserImportRow(BaseModel):
+    username: str = ""
+    email: str = ""
+    password: str = ""
+    role: str = "Regular User"
+
+class HistoryCreate(BaseModel):
+    query: str
+    answer: str
+    tool: str = None
+    latency_ms: float = None
+
+class QueryCreate(BaseModel):
+    query: str
+    timeout_seconds: float = None
+
+class UserLogin(BaseModel):
+    username: str
+    password: str
+
+class UserResponse(BaseModel):
+    username: str
+    email: str
+    role: str
+
+class SuggestionCreate(BaseModel):
+    username: str
+    suggestion: str
+
+class EvaluationCreate(BaseModel):
+    username: str
+    report: str
+    quality: int
+
+# الوظائف (Endpoints)
+@app.post("/register")
+async def register(
+    username: str = Form(...),
+    email: str = Form(...),
+    password: str = Form(...),
+    role: str = Form("Regular User"),
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        if not username or not email or not password:
+            raise HTTPException(status_code=400, detail="Missing required fields")
+        if role not in ["Regular User", "Expert", "Administrator"]:
+            raise HTTPException(status_code=400, detail="Invalid role. Must be 'Regular User', 'Expert', or 'Administrator'")
+        # التسجيل الذاتي ينشئ مستخدمين عاديين فقط؛ الأدوار الأعلى يمنحها مسؤول عبر PUT /users/{username}
+        if role != "Regular User":
+            raise HTTPException(status_code=403, detail="Only an administrator can grant the Expert or Administrator role")
+       
+        result = await db.execute(
+            select(User.username, User.email).where(or_(User.username == username, User.email == email))
+        )
+        existing = result.all()
+        if any(row.username == username for row in existing):
+            raise HTTPException(status_code=400, detail="Username already exists")
+        if existing:
+            raise HTTPException(status_code=400, detail="Email already exists")
+        # إنهاء المعاملة لإعادة الاتصال إلى المجمع أثناء التشفير
+        await db.rollback()
+        hashed_password = await hash_password_async(password)
+        new_user = User(username=username, email=email, hashed_password=hashed_password, role=role)
+        db.add(new_user)
+        await db.commit()
+        return {
+            "msg": "User registered successfully",
+            "role": role,
+            "access_token": create_session_token(username, role),
+            "token_type": "bearer",
+        }
+    except HTTPException:
+        await db.rollback()
+        raise
+    except OperationalError as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Registration error: {str(e)}")
+
+@app.post("/login")
+async def login(username: str = Form(...), password: str = Form(...), db: AsyncSession = Depends(get_db)):
+    try:
+        if not username or not password:
+            raise HTTPException(status_code=400, detail="Missing username or password")
+        user = await find_user(db, username)
+        if not user:
+            raise HTTPException(status_code=400, detail="Invalid username")
+        role, email, hashed_password = user.role, user.email, user.hashed_password
+        # إنهاء المعاملة لإعادة الاتصال إلى المجمع أثناء التحقق من كلمة المرور
+        await db.rollback()
+        if not await verify_password_async(password, hashed_password):
+            raise HTTPException(status_code=400, detail="Invalid password")
+        return {
+            "msg": f"Welcome {username}",
+            "role": role,
+            "email": email,
+            "access_token": create_session_token(username, role),
+            "token_type": "bearer",
+        }
+    except HTTPException:
+        raise
+    except OperationalError as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Login error: {str(e)}")
+
+USER_PAGE_LIMIT = 1000
+
+def prefix_upper_bound(prefix: str) -> str:
+    # أصغر نص أكبر من كل النصوص التي تبدأ بالبادئة، لتحويل البحث إلى نطاق يستخدم الفهرس بدلاً من LIKE
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+def filter_users(query, role: str = None, prefix: str = None):
+    if role:
+        query = query.where(User.role == role)
+    if prefix:
+        query = query.where(User.username >= prefix, User.username < prefix_upper_bound(prefix))
+    return query
+
+@app.get("/users", response_model=List[UserResponse])
+async def get_users(
+    limit: int = Query(None, ge=1, le=USER_PAGE_LIMIT),
+    after: str = None,
+    role: str = None,
+    prefix: str = None,
+    db: AsyncSession = Depends(get_db),
+    admin: dict = Depends(require_admin),
+):
+    """
+    List users ordered by username. Without ``limit`` every matching user is returned.
+    Pagination is keyset-based: pass the last username of a page as ``after`` to get the next one.
+    """
+    try:
+        query = filter_users(select(User.username, User.email, User.role), role, prefix)
+        if after:
+            query = query.where(User.username > after)
+        query = query.order_by(User.username)
+        if limit:
+            query = query.limit(limit)
+        result = await db.execute(query)
+        return [{"username": row.username, "email": row.email, "role": row.role} for row in result]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching users: {str(e)}")
+
+@app.get("/users/count")
+async def count_users(role: str = None, prefix: str = None, db: AsyncSession = Depends(get_db), admin: dict = Depends(require_admin)):
+    try:
+        result = await db.execute(filter_users(select(func.count()).select_from(User), role, prefix))
+        return {"count": result.scalar_one()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error counting users: {str(e)}")
+
+def validate_import_rows(rows: List[UserImportRow], taken_usernames: set, taken_emails: set) -> list:
+    """Return {"index", "username", "detail"} errors; rows repeating an earlier row in the batch are rejected too."""
+    errors = []
+    seen_usernames, seen_emails = set(), set()
+    for index, row in enumerate(rows):
+        if not row.username or not row.email or not row.password or not row.role:
+            detail = "Missing required fields"
+        elif row.role not in ["Regular User", "Expert", "Administrator"]:
+            detail = "Invalid role. Must be 'Regular User', 'Expert', or 'Administrator'"
+        elif row.username in taken_usernames or row.username in seen_usernames:
+            detail = "Username already exists"
+        elif row.email in taken_emails or row.email in seen_emails:
+            detail = "Email already exists"
+        else:
+            seen_usernames.add(row.username)
+            seen_emails.add(row.email)
+            continue
+        errors.append({"index": index, "username": row.username, "detail": detail})
+    return errors
+
+async def import_users(db: AsyncSession, rows: List[UserImportRow]) -> dict:
+    """
+    Create the valid users in ``rows`` in one transaction.
+    Uniqueness is checked with a single query against the whole batch, and passwords
+    are hashed across the import process pool.
+    Returns:
+        dict: {"imported": count, "errors": per-row errors with the 0-based row index}.
+    """
+    if not rows:
+        raise HTTPException(status_code=400, detail="No users to import")
+    if len(rows) > USER_IMPORT_LIMIT:
+        raise HTTPException(status_code=413, detail=f"Import exceeds {USER_IMPORT_LIMIT} users")
+    try:
+        result = await db.execute(
+            select(User.username, User.email).where(or_(
+                User.username.in_({row.username for row in rows}),
+                User.email.in_({row.email for row in rows}),
+            ))
+        )
+        existing = result.all()
+        errors = validate_import_rows(rows, {r.username for r in existing}, {r.email for r in existing})
+        failed = {error["index"] for error in errors}
+        valid = [row for index, row in enumerate(rows) if index not in failed]
+        # إنهاء المعاملة لإعادة الاتصال إلى المجمع أثناء التشفير
+        await db.rollback()
+        hashes = await security.hash_passwords_parallel([row.password for row in valid])
+        if valid:
+            await db.execute(insert(User), [
+                {"username": row.username, "email": row.email, "hashed_password": hashed, "role": row.role}
+                for row, hashed in zip(valid, hashes)
+            ])
+            await db.commit()
+        return {"imported": len(valid), "errors": errors}
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Users were created concurrently with the import; nothing was imported")
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Import error: {str(e)}")
+
+@app.post("/users/import")
+async def import_users_json(users: List[UserImportRow], db: AsyncSession = Depends(get_db), admin: dict = Depends(require_admin)):
+    return await import_users(db, users)
+
+@app.post("/users/import/csv")
+async def import_users_csv(file: UploadFile = File(...), db: AsyncSession = Depends(get_db), admin: dict = Depends(require_admin)):
+    """Import users from a CSV file with a header row: username,email,password[,role]."""
+    try:
+        reader = csv.DictReader(io.StringIO((await file.read()).decode("utf-8-sig")))
+        rows = [
+            UserImportRow(**{key.strip(): value.strip() for key, value in record.items() if key and value and value.strip()})
+            for record in reader
+        ]
+    except (UnicodeDecodeError, csv.Error, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid CSV file: {str(e)}")
+    return await import_users(db, rows)
+
+@app.put("/users/{username}")
+async def update_user_role(username: str, role: str, db: AsyncSession = Depends(get_db), admin: dict = Depends(require_admin)):
+    try:
+        user = await find_user(db, username)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        if role not in ["Regular User", "Expert", "Administrator"]:
+            raise HTTPException(status_code=400, detail="Invalid role")
+        user.role = role
+        revoked_at = await record_revocation(db, username)
+        await db.commit()
+        revoke_user_tokens(username, revoked_at)
+        return {"msg": f"Role updated for {username}"}
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error updating user role: {str(e)}")
+
+@app.delete("/users/{username}")
+async def delete_user(username: str, db: AsyncSession = Depends(get_db), admin: dict = Depends(require_admin)):
+    try:
+        user = await find_user(db, username)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        await db.delete(user)
+        revoked_at = await record_revocation(db, username)
+        await db.commit()
+        revoke_user_tokens(username, revoked_at)
+        return {"msg": f"User {username} deleted successfully"}
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error deleting user: {str(e)}")
+
+@app.get("/data/cleaned")
+async def get_cleaned_data():
+    try:
+        return JSONResponse(content=await run_in_threadpool(data_access.get_records, "cleaned"))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Cleaned data file not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error loading cleaned data: {str(e)}")
+
+@app.get("/data/financial_phrasebank")
+async def get_financial_phrasebank_data():
+    try:
+        return JSONResponse(content=await run_in_threadpool(data_access.get_records, "financial_phrasebank"))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Financial phrasebank data file not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error loading financial phrasebank data: {str(e)}")
+
+@app.get("/data/apple")
+async def get_apple_data():
+    try:
+        return JSONResponse(content={"Apple": await run_in_threadpool(data_access.get_records, "Apple")})
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Apple data file not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error loading Apple data: {str(e)}")
+
+@app.get("/data/meta")
+async def get_meta_data():
+    try:
+        return JSONResponse(content={"Meta": await run_in_threadpool(data_access.get_records, "Meta")})
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Meta data file not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error loading Meta data: {str(e)}")
+
+@app.get("/data/microsoft")
+async def get_microsoft_data():
+    try:
+        return JSONResponse(content={"Microsoft": await run_in_threadpool(data_access.get_records, "Microsoft")})
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Microsoft data file not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error loading Microsoft data: {str(e)}")
+
+def suggestion_row(suggestion: SuggestionCreate) -> dict:
+    return {"username": suggestion.username, "suggestion": suggestion.suggestion, "created_at": received_at()}
+
+def evaluation_row(evaluation: EvaluationCreate) -> dict:
+    return {"username": evaluation.username, "report": evaluation.report, "quality": evaluation.quality, "created_at": received_at()}
+
+def check_quality(evaluation: EvaluationCreate):
+    if not (1 <= evaluation.quality <= 5):
+        return "Quality must be between 1 and 5"
+    return None
+
+def check_batch_size(items: list):
+    if not items:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(items) > FEEDBACK_BATCH_LIMIT:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {FEEDBACK_BATCH_LIMIT} records")
+
+@app.post("/suggestions")
+async def submit_suggestion(suggestion: SuggestionCreate, db: AsyncSession = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    require_same_user(suggestion.username, current_user)
+    try:
+        user = await find_user(db, suggestion.username)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        if await save_feedback(db, Suggestion, [suggestion_row(suggestion)]):
+            return {"msg": "Suggestion received and queued for storage"}
+        return {"msg": "Suggestion received and stored successfully"}
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error submitting suggestion: {str(e)}")
+
+@app.post("/suggestions/batch")
+async def submit_suggestions_batch(suggestions: List[SuggestionCreate], db: AsyncSession = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    check_batch_size(suggestions)
+    try:
+        rows, rejected = await partition_feedback(db, suggestions, current_user, suggestion_row)
+        queued = await save_feedback(db, Suggestion, rows) if rows else False
+        return {"accepted": len(rows), "rejected": rejected, "queued": queued}
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error submitting suggestions: {str(e)}")
+
+@app.post("/evaluations")
+async def submit_evaluation(evaluation: EvaluationCreate, db: AsyncSession = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    require_same_user(evaluation.username, current_user)
+    try:
+        user = await find_user(db, evaluation.username)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        error = check_quality(evaluation)
+        if error:
+            raise HTTPException(status_code=400, detail=error)
+        if await save_feedback(db, Evaluation, [evaluation_row(evaluation)]):
+            return {"msg": "Evaluation received and queued for storage"}
+        return {"msg": "Evaluation received and stored successfully"}
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error submitting evaluation: {str(e)}")
+
+@app.post("/evaluations/batch")
+async def submit_evaluations_batch(evaluations: List[EvaluationCreate], db: AsyncSession = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    check_batch_size(evaluations)
+    try:
+        rows, rejected = await partition_feedback(db, evaluations, current_user, evaluation_row, validate=check_quality)
+        queued = await save_feedback(db, Evaluation, rows) if rows else False
+        return {"accepted": len(rows), "rejected": rejected, "queued": queued}
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error submitting evaluations: {str(e)}")
+
+def evaluation_summary(rollup) -> dict:
+    count = rollup.count if rollup else 0
+    quality_sum = rollup.quality_sum if rollup else 0
+    return {
+        "count": count,
+        "mean_quality": round(quality_sum / count, 3) if count else None,
+        "histogram": {str(level): getattr(rollup, f"q{level}") if rollup else 0 for level in QUALITY_LEVELS},
+    }
+
+@app.get("/stats/feedback")
+async def feedback_stats(
+    username: str = ROLLUP_ALL,
+    days: int = Query(14, ge=0, le=366),
+    db: AsyncSession = Depends(get_db),
+    admin: dict = Depends(require_admin),
+):
+    """
+    Evaluation and suggestion statistics read from the rollup tables.
+    ``username="*"`` covers all users. Totals are primary-key lookups and the
+    ``daily`` series is a key range of at most ``days`` rows per table.
+    """
+    try:
+        evaluations = await db.get(EvaluationRollup, (username, ROLLUP_ALL))
+        suggestions = await db.get(SuggestionRollup, (username, ROLLUP_ALL))
+        today = datetime.now(timezone.utc).date()
+        first_day = (today - timedelta(days=max(days - 1, 0))).isoformat()
+        daily = {}
+        if days:
+            result = await db.execute(select(EvaluationRollup).where(
+                EvaluationRollup.username == username,
+                EvaluationRollup.day.between(first_day, today.isoformat()),
+            ))
+            for rollup in result.scalars():
+                daily[rollup.day] = dict(evaluation_summary(rollup), suggestions=0)
+            result = await db.execute(select(SuggestionRollup.day, SuggestionRollup.count).where(
+                SuggestionRollup.username == username,
+                SuggestionRollup.day.between(first_day, today.isoformat()),
+            ))
+            for day, count in result:
+                daily.setdefault(day, dict(evaluation_summary(None), suggestions=0))["suggestions"] = count
+        return {
+            "username": username,
+            "evaluations": evaluation_summary(evaluations),
+            "suggestions": {"count": suggestions.count if suggestions else 0},
+            "daily": [dict(stats, day=day) for day, stats in sorted(daily.items())],
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error loading feedback statistics: {str(e)}")
+
+HISTORY_FIELDS = "h.id, h.username, h.query, h.answer, h.tool, h.latency_ms, h.created_at"
+
+def fts_match_expression(terms: str) -> str:
+    # كل كلمة تُقتبس لتجنب أخطاء صياغة FTS5 مع مدخلات مثل JSONPath، وآخر كلمة تطابق كبادئة
+    words = re.findall(r"\w+", terms)
+    if not words:
+        return ""
+    return " ".join(f'"{word}"' for word in words[:-1]) + f' "{words[-1]}"*'
+
+@app.post("/history")
+async def save_history(entry: HistoryCreate, db: AsyncSession = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    if not entry.query.strip() or not entry.answer.strip():
+        raise HTTPException(status_code=400, detail="Query and answer are required")
+    try:
+        history = QueryHistory(
+            username=current_user["sub"],
+            query=entry.query,
+            answer=entry.answer,
+            tool=entry.tool,
+            latency_ms=entry.latency_ms,
+        )
+        db.add(history)
+        await db.commit()
+        return {"msg": "Query saved to history", "id": history.id}
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error saving query history: {str(e)}")
+
+@app.get("/history/search")
+async def search_history(
+    q: str = "",
+    all_users: bool = False,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Full-text search over past queries and answers, best matches first.
+    Without search terms the most recent entries are returned. Experts and
+    administrators may pass ``all_users=true`` to search everyone's history.
+    """
+    if all_users and current_user["role"] not in ["Expert", "Administrator"]:
+        raise HTTPException(status_code=403, detail="Expert or Administrator role required to search all history")
+    params = {"limit": limit}
+    scope = ""
+    if not all_users:
+        scope = "AND h.username = :username"
+        params["username"] = current_user["sub"]
+    match = fts_match_expression(q)
+    try:
+        if match:
+            params["match"] = match
+            result = await db.execute(text(
+                f"SELECT {HISTORY_FIELDS}, snippet(query_history_fts, 1, '**', '**', ' … ', 24) AS snippet "
+                "FROM query_history_fts JOIN query_history h ON h.id = query_history_fts.rowid "
+                f"WHERE query_history_fts MATCH :match {scope} "
+                "ORDER BY bm25(query_history_fts) LIMIT :limit"
+            ), params)
+        else:
+            result = await db.execute(text(
+                f"SELECT {HISTORY_FIELDS}, NULL AS snippet FROM query_history h "
+                f"WHERE 1 = 1 {scope} ORDER BY h.created_at DESC LIMIT :limit"
+            ), params)
+        return [dict(row._mapping) for row in result]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching query history: {str(e)}")
+
+QUERY_STREAM_INTERVAL = 0.5
+
+@app.get("/stats/queries")
+async def query_stats(limit: int = Query(5000, ge=1, le=100000), admin: dict = Depends(require_admin)):
+    """Latency percentiles, stage breakdown and token spend per tool, from the last ``limit`` traces."""
+    try:
+        traces = await run_in_threadpool(tracing.read_traces, None, limit)
+        return {"traces": len(traces), "tools": tracing.summarize(traces)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error loading query statistics: {str(e)}")
+
+# القيم اللحظية تُقرأ عند كل جمع للمقاييس وعند كل لقطة يكتبها العامل (مع METRICS_MULTIPROC_DIR)
+def refresh_gauges():
+    instrumentation.set_gauge("query_jobs_pending", query_jobs.pending)
+    instrumentation.set_gauge("feedback_rows_buffered", feedback_buffer.pending if feedback_buffer is not None else 0)
+    for key, value in llm_scheduler.scheduler.stats().items():
+        instrumentation.set_gauge(f"llm_scheduler_{key}", value)
+
+instrumentation.add_collector(refresh_gauges)
+
+# مع عدة عمال (gunicorn أو uvicorn --workers) يكتب كل عامل لقطة من مقاييسه في METRICS_MULTIPROC_DIR،
+# فيجيب أي عامل عن /metrics بمجموع كل العمال بدلاً من عداداته وحده
+@app.on_event("startup")
+async def start_metrics_snapshots():
+    instrumentation.start_snapshots()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint: HTTP, database, dataset cache, query job and LLM scheduler metrics, summed over the workers."""
+    return PlainTextResponse(instrumentation.render_prometheus(), media_type=metrics.CONTENT_TYPE)
+
+def job_from_row(row: QueryJob) -> dict:
+    job = {column: getattr(row, column) for column in ("id", "owner", "status", "error", "created_at", "started_at", "finished_at", "deadline")}
+    job["result"] = json.loads(row.result) if row.result else None
+    # مهمة تجاوزت موعدها (أو توقف العامل الذي يشغلها) تظهر منتهية المهلة
+    if job["status"] in ACTIVE_JOB_STATUSES and time.time() > job["deadline"]:
+        job.update(status=jobs.TIMED_OUT, error="Query exceeded its deadline")
+    return job
+
+async def get_query_job(job_id: str, current_user: dict) -> dict:
+    # الحالة تُقرأ من قاعدة البيانات، فأي عامل يجيب عن أي مهمة
+    async with AsyncSessionLocal() as db:
+        row = await db.get(QueryJob, job_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Query job not found")
+    require_same_user(row.owner, current_user)
+    return job_from_row(row)
+
+@app.post("/query", status_code=202)
+async def submit_query(request: QueryCreate, current_user: dict = Depends(get_current_user)):
+    """Queue a query for the worker pool; poll GET /query/{job_id} or stream /query/{job_id}/events for the result."""
+    if not request.query.strip():
+        raise HTTPException(status_code=400, detail="Query is empty")
+    if request.timeout_seconds is not None and request.timeout_seconds <= 0:
+        raise HTTPException(status_code=400, detail="timeout_seconds must be positive")
+    try:
+        job = await run_in_threadpool(
+            query_jobs.submit,
+            current_user["sub"],
+            {"query": request.query.strip(), "role": current_user["role"]},
+            timeout=request.timeout_seconds,
+        )
+    except jobs.QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    # المهمة تُسجَّل في قاعدة البيانات قبل الرد، فيجدها أي عامل يُستطلع لاحقاً
+    await run_in_threadpool(query_jobs.wait_notified, QUERY_PERSIST_TIMEOUT)
+    return job.to_dict()
+
+@app.post("/query/warmup", status_code=202)
+async def warm_up_query_engine(current_user: dict = Depends(get_current_user)):
+    """Start building the query engine in the background (the dashboard calls this after login)."""
+    return {"status": start_router_warmup()}
+
+@app.get("/query/{job_id}")
+async def get_query(job_id: str, current_user: dict = Depends(get_current_user)):
+    return await get_query_job(job_id, current_user)
+
+@app.delete("/query/{job_id}")
+async def cancel_query(job_id: str, current_user: dict = Depends(get_current_user)):
+    await get_query_job(job_id, current_user)
+    # يُلغى محلياً إن كانت المهمة في هذا العامل، وإلا يُسجَّل الإلغاء وتُهمل نتيجتها عند انتهائها
+    await run_in_threadpool(query_jobs.cancel, job_id)
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            QueryJob.__table__.update()
+            .where(QueryJob.id == job_id, QueryJob.status.in_(ACTIVE_JOB_STATUSES))
+            .values(status=jobs.CANCELLED, error="Cancelled by user", finished_at=time.time())
+        )
+        await db.commit()
+    return await get_query_job(job_id, current_user)
+
+@app.get("/query/{job_id}/events")
+async def stream_query(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Server-sent events: one ``data:`` message per status change, ending when the job finishes."""
+    await get_query_job(job_id, current_user)
+
+    async def events():
+        last_status = None
+        while True:
+            try:
+                job = await get_query_job(job_id, current_user)
+            except HTTPException:
+                return
+            if job["status"] != last_status:
+                last_status = job["status"]
+                yield f"data: {json.dumps(job)}\n\n"
+            if job["status"] in jobs.FINISHED:
+                return
+            await asyncio.sleep(QUERY_STREAM_INTERVAL)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/health")
+async def health():
+    """Liveness: the worker process is up and serving."""
+    return {"status": "ok", "pid": os.getpid()}
+
+@app.get("/ready")
+async def ready(db: AsyncSession = Depends(get_db)):
+    """Readiness: datasets preloaded and the database reachable (503 until then)."""
+    try:
+        await db.execute(text("SELECT 1"))
+        database_ok = True
+    except Exception:
+        database_ok = False
+    body = {
+        "ready": _data_preload["done"] and database_ok,
+        "pid": os.getpid(),
+        "database": database_ok,
+        "datasets": {name: data_access.get_cached(name) is not None for name in data_access.DATASET_FILES},
+        "dataset_errors": _data_preload["errors"],
+        "query_engine": "ready" if _router_engine is not None else "warming" if _warmup_thread is not None and _warmup_thread.is_alive() else "cold",
+    }
+    return JSONResponse(content=body, status_code=200 if body["ready"] else 503)
+
+if __name__ == "__main__":
+    # BACKEND_WORKERS > 1 يشغّل عدة عمليات؛ يجب أن تشترك في مفتاح توقيع الرموز (انظر gunicorn_conf.py للتحميل المسبق)
+    BACKEND_WORKERS = int(os.environ.get("BACKEND_WORKERS", "1"))
+    if BACKEND_WORKERS > 1:
+        os.environ.setdefault("SESSION_SECRET", secrets.token_urlsafe(32))
+        uvicorn.run("backend:app", host="0.0.0.0", port=8002, workers=BACKEND_WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8002)
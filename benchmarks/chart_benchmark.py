@@ -0,0 +1,97 @@
+"""
+Chart downsampling benchmark.
+
+Builds the Stock Comparison line chart (one Close series per ticker) and the
+Stock Analysis volume chart from synthetic daily histories of growing length,
+once from the full series and once through downsampling.py, and reports the
+points plotted, the time to build and serialize the figure, and the size of the
+JSON payload Streamlit sends to the browser. The downsampled payload should stay
+flat as the history grows, while the full one grows with it.
+
+    python -m benchmarks.chart_benchmark --years 1 5 20 --tickers 3 --json charts.json
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+import pandas as pd
+
+import downsampling
+from benchmarks.harness import write_json
+
+
+def synthetic_history(days, seed):
+    """A random-walk daily OHLCV frame with ``days`` rows."""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, days)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    spread = np.abs(rng.normal(0, 0.01, days)) * close
+    return pd.DataFrame({
+        "Date": pd.date_range("2000-01-03", periods=days, freq="B"),
+        "Open": open_,
+        "High": np.maximum(open_, close) + spread,
+        "Low": np.minimum(open_, close) - spread,
+        "Close": close,
+        "Volume": rng.integers(1_000_000, 5_000_000, days),
+    })
+
+
+def build_charts(histories, budget):
+    """Build and serialize both charts; return (points plotted, payload bytes)."""
+    import plotly.express as px
+
+    lines = []
+    for ticker, frame in histories.items():
+        frame = frame[["Date", "Close"]]
+        if budget:
+            frame = downsampling.downsample_line(frame, "Date", "Close", budget)
+        lines.append(frame.assign(Company=ticker))
+    comparison = pd.concat(lines, ignore_index=True)
+    volume = next(iter(histories.values()))
+    if budget:
+        volume = downsampling.bucket_ohlcv(volume, budget)
+    figures = [
+        px.line(comparison, x="Date", y="Close", color="Company"),
+        px.bar(volume, x="Date", y="Volume"),
+    ]
+    return len(comparison) + len(volume), sum(len(figure.to_json()) for figure in figures)
+
+
+def measure(histories, budget, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        points, payload = build_charts(histories, budget)
+        timings.append(time.perf_counter() - start)
+    return {
+        "points": points,
+        "build_ms": round(statistics.median(timings) * 1000, 1),
+        "payload_kb": round(payload / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 5, 20], help="History lengths to test")
+    parser.add_argument("--tickers", type=int, default=3, help="Series in the comparison chart")
+    parser.add_argument("--budget", type=int, default=downsampling.CHART_POINT_BUDGET, help="Points per series")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (median reported)")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'history':<10}{'rows':>8}{'mode':>8}{'points':>9}{'build ms':>11}{'payload KB':>12}")
+    for years in args.years:
+        days = years * 252
+        histories = {f"T{i}": synthetic_history(days, seed=i) for i in range(args.tickers)}
+        rows = {"full": measure(histories, None, args.repeat), "budget": measure(histories, args.budget, args.repeat)}
+        results[f"{years}y"] = dict(rows, rows=days * args.tickers)
+        for mode, row in rows.items():
+            print(f"{years}y{'':<8}{days * args.tickers:>8}{mode:>8}{row['points']:>9}{row['build_ms']:>11}{row['payload_kb']:>12}")
+    if args.json:
+        write_json(args.json, {"config": vars(args), "results": results})
+
+
+if __name__ == "__main__":
+    main()
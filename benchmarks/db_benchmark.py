@@ -0,0 +1,123 @@
+"""
+Concurrent read/write benchmark for the SQLite configuration.
+
+Runs the same mix against two throwaway databases: one with SQLite's defaults
+(rollback journal, synchronous=FULL, no mmap) and one with the tuned settings
+from database.py (WAL, synchronous=NORMAL, mmap, busy timeout, sized pool).
+Reader threads look users up by name like /users and /login do; writer threads
+insert-and-commit feedback rows like /suggestions and /evaluations do.
+
+    python -m benchmarks.db_benchmark --readers 8 --writers 4 --seconds 5
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from sqlalchemy import text
+
+import database
+from benchmarks.harness import summarize, print_report, write_json
+
+
+CONFIGS = {
+    "default (DELETE, FULL)": {"journal_mode": "DELETE", "synchronous": "FULL", "mmap_size": 0, "busy_timeout": 5000},
+    "tuned (WAL, NORMAL)": database.DEFAULT_PRAGMAS,
+}
+
+
+def seed(engine, users):
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT UNIQUE, email TEXT, role TEXT)"))
+        connection.execute(text("CREATE TABLE suggestions (id INTEGER PRIMARY KEY, username TEXT, suggestion TEXT, created_at TEXT)"))
+        connection.execute(
+            text("INSERT INTO users (username, email, role) VALUES (:u, :e, 'Regular User')"),
+            [{"u": f"user_{i}", "e": f"user_{i}@bench.local"} for i in range(users)],
+        )
+
+
+def run_mix(engine, readers, writers, seconds, users):
+    stop = time.monotonic() + seconds
+    results = {"read": [], "write": []}
+    lock = threading.Lock()
+
+    def reader(index):
+        local = []
+        with engine.connect() as connection:
+            i = index
+            while time.monotonic() < stop:
+                start = time.perf_counter()
+                ok = True
+                try:
+                    connection.execute(text("SELECT id, email, role FROM users WHERE username = :u"), {"u": f"user_{i % users}"}).fetchone()
+                    connection.execute(text("SELECT username, email, role FROM users LIMIT 50")).fetchall()
+                    connection.rollback()
+                except Exception:
+                    ok = False
+                local.append((time.perf_counter() - start, ok))
+                i += 7
+        with lock:
+            results["read"].extend(local)
+
+    def writer(index):
+        local = []
+        i = 0
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            ok = True
+            try:
+                with engine.begin() as connection:
+                    connection.execute(text("SELECT id FROM users WHERE username = :u"), {"u": f"user_{i % users}"}).fetchone()
+                    connection.execute(
+                        text("INSERT INTO suggestions (username, suggestion, created_at) VALUES (:u, :s, :t)"),
+                        {"u": f"user_{i % users}", "s": f"suggestion {index}-{i}", "t": time.time()},
+                    )
+            except Exception:
+                ok = False
+            local.append((time.perf_counter() - start, ok))
+            i += 1
+        with lock:
+            results["write"].extend(local)
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {kind: summarize(samples, elapsed) for kind, samples in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    rows = {}
+    for label, pragmas in CONFIGS.items():
+        workdir = tempfile.mkdtemp(prefix="db-bench-")
+        try:
+            engine = database.make_engine(f"sqlite:///{os.path.join(workdir, 'bench.db')}", pragmas=pragmas,
+                                          pool_size=args.readers + args.writers)
+            seed(engine, args.users)
+            for kind, summary in run_mix(engine, args.readers, args.writers, args.seconds, args.users).items():
+                rows[f"{label} {kind}"] = summary
+            engine.dispose()
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(f"SQLite read/write mix ({args.readers} readers, {args.writers} writers, {args.seconds}s)", rows)
+    if args.json:
+        write_json(args.json, {"config": vars(args), "results": rows})
+
+
+if __name__ == "__main__":
+    main()
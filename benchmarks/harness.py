@@ -0,0 +1,145 @@
+"""
+Helpers shared by the local benchmarks: booting the backend against a temporary
+SQLite database, driving requests concurrently and summarizing latencies.
+"""
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import requests
+
+from instrumentation import percentile
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+_local = threading.local()
+
+
+def thread_session():
+    """Return a keep-alive session owned by the calling thread, so clients do not share a pool."""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.trust_env = False
+        _local.session = session
+    return session
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(base_url, process, timeout=60):
+    """Poll the backend until it answers, raising if the process exits or ``timeout`` passes."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Backend exited with code {process.returncode} during startup")
+        try:
+            requests.get(f"{base_url}/openapi.json", timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"Backend did not become ready within {timeout}s")
+
+
+@contextmanager
+def backend_server(env=None, args=()):
+    """
+    Run backend.py under uvicorn on a free port with a throwaway database.
+    Args:
+        env (dict, optional): Extra environment variables for the server.
+        args (tuple): Extra uvicorn command-line arguments.
+    Yields:
+        str: Base URL of the running server.
+    """
+    workdir = tempfile.mkdtemp(prefix="backend-bench-")
+    port = free_port()
+    server_env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'users.db')}",
+        "DATA_DIR": os.environ.get("DATA_DIR", REPO_ROOT),
+        **(env or {}),
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", *args],
+        cwd=REPO_ROOT,
+        env=server_env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_ready(base_url, process)
+        yield base_url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_concurrently(task, jobs, concurrency):
+    """
+    Run ``task(job)`` for every job on ``concurrency`` threads.
+    ``task`` returns True on success. Returns (list of (latency_seconds, ok), elapsed_seconds).
+    """
+    def timed(job):
+        start = time.perf_counter()
+        try:
+            ok = task(job)
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed, jobs))
+    return results, time.perf_counter() - start
+
+
+def summarize(results, elapsed):
+    """Turn (latency, ok) pairs into throughput and latency percentiles in milliseconds."""
+    latencies = [latency for latency, _ in results]
+    errors = sum(1 for _, ok in results if not ok)
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "requests": len(results),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(results) / elapsed, 2) if elapsed else None,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(max(latencies) if latencies else None),
+    }
+
+
+def print_report(title, rows):
+    """Print ``rows`` (dict of label -> summary) as a table."""
+    print(title)
+    print(f"{'case':<34}{'reqs':>7}{'err':>6}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for label, row in rows.items():
+        print(f"{label:<34}{row['requests']:>7}{row['errors']:>6}{row['throughput_rps'] or 0:>10}"
+              f"{row['p50_ms'] or 0:>10}{row['p95_ms'] or 0:>10}{row['p99_ms'] or 0:>10}")
+
+
+def write_json(path, payload):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2)
@@ -0,0 +1,237 @@
+"""
+Mixed-traffic HTTP load test for the backend.
+
+Boots backend.py against a temporary SQLite database (see harness.backend_server),
+registers a pool of regular users (the administrator is created by the backend
+from INITIAL_ADMIN_USERNAME/PASSWORD), then drives each scenario for a fixed time
+with concurrent clients. Every client picks its next request from the scenario's
+weighted mix:
+- login:      POST /login with a random account
+- data:       GET one of the /data/* downloads
+- suggestion: POST /suggestions as the signed-in user
+- evaluation: POST /evaluations as the signed-in user
+- users:      GET /users?limit=50 as the administrator
+
+Throughput and p50/p95/p99 latency are reported per scenario and route. Write
+the results with --json and pass that file back as --baseline on a later run to
+compare: a route whose p95 grows or whose throughput drops by more than
+--tolerance percent is reported as a regression and the exit status is 1.
+--workers runs the server with several uvicorn worker processes sharing one
+SESSION_SECRET, to compare single- and multi-process throughput.
+
+    python -m benchmarks.load_test --duration 15 --json baseline.json
+    python -m benchmarks.load_test --duration 15 --baseline baseline.json
+"""
+import argparse
+import json
+import random
+import secrets
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from benchmarks.harness import backend_server, thread_session, run_concurrently, summarize, print_report, write_json
+
+
+SCENARIOS = {
+    "mixed": {"login": 1, "data": 3, "suggestion": 2, "evaluation": 2, "users": 2},
+    "login-storm": {"login": 1},
+    "read-heavy": {"data": 6, "users": 3, "login": 1},
+    "write-heavy": {"suggestion": 5, "evaluation": 5},
+}
+DATA_ROUTES = ["/data/apple", "/data/meta", "/data/microsoft", "/data/cleaned", "/data/financial_phrasebank"]
+# Created by the backend at startup (INITIAL_ADMIN_USERNAME/PASSWORD), since /register only makes regular users.
+ADMIN_ACCOUNT = ("load_admin", "admin-password")
+# Fields compared with the baseline; True means a higher value is worse.
+COMPARED_FIELDS = {"p95_ms": True, "throughput_rps": False}
+
+
+class LoadClient:
+    """Issues one request of a given kind against the server; returns (route label, ok)."""
+
+    def __init__(self, base_url, accounts, tokens, admin_token):
+        self.base_url = base_url
+        self.accounts = accounts
+        self.tokens = tokens
+        self.admin_token = admin_token
+
+    def login(self, rng):
+        username, password = rng.choice(self.accounts)
+        response = thread_session().post(f"{self.base_url}/login", data={"username": username, "password": password})
+        return "POST /login", response.ok
+
+    def data(self, rng):
+        route = rng.choice(DATA_ROUTES)
+        response = thread_session().get(f"{self.base_url}{route}")
+        # The body is read in full, so the timing covers the download and not just the headers.
+        return f"GET {route}", response.ok and len(response.content) > 0
+
+    def _feedback(self, rng, route, payload):
+        username, _ = rng.choice(self.accounts)
+        response = thread_session().post(
+            f"{self.base_url}{route}",
+            json={"username": username, **payload},
+            headers={"Authorization": f"Bearer {self.tokens[username]}"},
+        )
+        return f"POST {route}", response.ok
+
+    def suggestion(self, rng):
+        return self._feedback(rng, "/suggestions", {"suggestion": f"Load test suggestion {rng.random():.6f}"})
+
+    def evaluation(self, rng):
+        return self._feedback(rng, "/evaluations", {"report": "Load test report", "quality": rng.randint(1, 5)})
+
+    def users(self, rng):
+        response = thread_session().get(
+            f"{self.base_url}/users", params={"limit": 50},
+            headers={"Authorization": f"Bearer {self.admin_token}"},
+        )
+        return "GET /users", response.ok
+
+
+def setup_accounts(base_url, count, concurrency):
+    """
+    Register ``count`` regular users and log in the administrator seeded by backend_server
+    (/register only creates regular users); return (accounts, tokens, admin token).
+    """
+    accounts = [(f"load_user_{i}", f"password-{i}") for i in range(count)]
+    tokens = {}
+
+    def register(account):
+        username, password = account
+        response = thread_session().post(f"{base_url}/register", data={
+            "username": username, "email": f"{username}@bench.local", "password": password,
+        })
+        response.raise_for_status()
+        tokens[username] = response.json()["access_token"]
+        return True
+
+    results, _ = run_concurrently(register, accounts, concurrency)
+    if not all(ok for _, ok in results):
+        raise RuntimeError("Could not register the load test accounts")
+    username, password = ADMIN_ACCOUNT
+    response = thread_session().post(f"{base_url}/login", data={"username": username, "password": password})
+    response.raise_for_status()
+    return accounts, tokens, response.json()["access_token"]
+
+
+def run_scenario(client, mix, duration, concurrency, seed):
+    """
+    Drive ``mix`` (request kind -> weight) on ``concurrency`` clients for ``duration`` seconds.
+    Returns:
+        dict: route label -> (list of (latency_seconds, ok), elapsed_seconds).
+    """
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    results = defaultdict(list)
+    lock = threading.Lock()
+    start = time.perf_counter()
+    stop = start + duration
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        local = defaultdict(list)
+        while time.perf_counter() < stop:
+            kind = rng.choices(kinds, weights)[0]
+            began = time.perf_counter()
+            try:
+                route, ok = getattr(client, kind)(rng)
+            except Exception:
+                route, ok = kind, False
+            local[route].append((time.perf_counter() - began, ok))
+        with lock:
+            for route, samples in local.items():
+                results[route].extend(samples)
+        return True
+
+    run_concurrently(worker, range(concurrency), concurrency)
+    elapsed = time.perf_counter() - start
+    return {route: (samples, elapsed) for route, samples in results.items()}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare ``results`` with a baseline run of the same shape.
+    Returns:
+        list: (scenario, route, field, baseline value, current value, change %, regressed) for every compared value.
+    """
+    rows = []
+    for scenario, routes in results.items():
+        for route, row in routes.items():
+            before = baseline.get(scenario, {}).get(route)
+            if not before:
+                continue
+            for field, higher_is_worse in COMPARED_FIELDS.items():
+                old, new = before.get(field), row.get(field)
+                if not old or new is None:
+                    continue
+                change = (new - old) / old * 100
+                regressed = change > tolerance if higher_is_worse else change < -tolerance
+                rows.append((scenario, route, field, old, new, round(change, 1), regressed))
+    return rows
+
+
+def print_comparison(rows, tolerance):
+    print(f"Comparison with baseline (tolerance {tolerance:g}%)")
+    print(f"{'scenario':<14}{'route':<34}{'field':<16}{'baseline':>10}{'current':>10}{'change %':>10}")
+    for scenario, route, field, old, new, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{scenario:<14}{route:<34}{field:<16}{old:>10}{new:>10}{change:>10}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Scenario to run; repeat for several (default: all)")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients")
+    parser.add_argument("--users", type=int, default=20, help="Regular user accounts to create")
+    parser.add_argument("--rounds", type=int, default=10, help="BCRYPT_ROUNDS for the server")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the request mix")
+    parser.add_argument("--workers", type=int, default=1, help="Server worker processes")
+    parser.add_argument("--write-behind", action="store_true", help="Run the server with WRITE_BEHIND_ENABLED=1")
+    parser.add_argument("--json", help="Write the results to this file (usable as a baseline)")
+    parser.add_argument("--baseline", help="Compare with the results of an earlier --json run")
+    parser.add_argument("--tolerance", type=float, default=20, help="Allowed p95/throughput change in percent")
+    args = parser.parse_args()
+
+    env = {
+        "BCRYPT_ROUNDS": str(args.rounds), "TRACE_LOG_ENABLED": "0", "QUERY_LOG_ENABLED": "0",
+        "INITIAL_ADMIN_USERNAME": ADMIN_ACCOUNT[0], "INITIAL_ADMIN_PASSWORD": ADMIN_ACCOUNT[1],
+    }
+    if args.write_behind:
+        env["WRITE_BEHIND_ENABLED"] = "1"
+    server_args = ()
+    if args.workers > 1:
+        env["SESSION_SECRET"] = secrets.token_urlsafe(32)
+        server_args = ("--workers", str(args.workers))
+    scenarios = args.scenario or list(SCENARIOS)
+
+    results = {}
+    with backend_server(env=env, args=server_args) as base_url:
+        accounts, tokens, admin_token = setup_accounts(base_url, args.users, args.concurrency)
+        client = LoadClient(base_url, accounts, tokens, admin_token)
+        for seed, scenario in enumerate(scenarios, start=args.seed):
+            routes = run_scenario(client, SCENARIOS[scenario], args.duration, args.concurrency, seed)
+            rows = {route: summarize(samples, elapsed) for route, (samples, elapsed) in sorted(routes.items())}
+            all_samples = [sample for samples, _ in routes.values() for sample in samples]
+            elapsed = max((elapsed for _, elapsed in routes.values()), default=args.duration)
+            rows["total"] = summarize(all_samples, elapsed)
+            results[scenario] = rows
+            print_report(f"Scenario {scenario} ({args.duration:g}s, concurrency={args.concurrency}, workers={args.workers})", rows)
+            print()
+
+    if args.json:
+        write_json(args.json, {"config": vars(args), "results": results})
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        rows = compare(results, baseline, args.tolerance)
+        print_comparison(rows, args.tolerance)
+        if any(row[-1] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
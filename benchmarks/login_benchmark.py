@@ -0,0 +1,58 @@
+"""
+Login throughput benchmark.
+
+Boots the backend against a temporary database, registers a pool of users and
+then fires concurrent /login requests, reporting throughput and tail latency.
+
+    python -m benchmarks.login_benchmark --users 20 --requests 400 --concurrency 32
+"""
+import argparse
+import random
+
+from benchmarks.harness import backend_server, thread_session, run_concurrently, summarize, print_report, write_json
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="Distinct accounts to sign in with")
+    parser.add_argument("--requests", type=int, default=400, help="Total /login requests")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients")
+    parser.add_argument("--rounds", type=int, default=12, help="BCRYPT_ROUNDS for the server")
+    parser.add_argument("--hash-workers", type=int, default=None, help="HASH_WORKERS for the server")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    env = {"BCRYPT_ROUNDS": str(args.rounds)}
+    if args.hash_workers:
+        env["HASH_WORKERS"] = str(args.hash_workers)
+
+    with backend_server(env=env) as base_url:
+        accounts = [(f"bench_user_{i}", f"password-{i}") for i in range(args.users)]
+
+        def register(account):
+            username, password = account
+            response = thread_session().post(f"{base_url}/register", data={
+                "username": username, "email": f"{username}@bench.local", "password": password, "role": "Regular User",
+            })
+            return response.ok
+
+        def login(account):
+            username, password = account
+            response = thread_session().post(f"{base_url}/login", data={"username": username, "password": password})
+            return response.ok
+
+        register_results, register_elapsed = run_concurrently(register, accounts, args.concurrency)
+        jobs = [random.choice(accounts) for _ in range(args.requests)]
+        login_results, login_elapsed = run_concurrently(login, jobs, args.concurrency)
+
+    rows = {
+        "register": summarize(register_results, register_elapsed),
+        "login": summarize(login_results, login_elapsed),
+    }
+    print_report(f"Login benchmark (bcrypt rounds={args.rounds}, concurrency={args.concurrency})", rows)
+    if args.json:
+        write_json(args.json, {"config": vars(args), "results": rows})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Replay logged queries through the query pipeline and report per-stage latency and memory.
+
+By default the LLM and embedding model are the deterministic stand-ins from
+offline_models.py (QUERY_ENGINE_OFFLINE=1), so this runs without network access
+and measures our own pipeline overhead: dataset loading, engine construction and
+indexing (startup), then the per-query routing, retrieval, JSONPath and synthesis
+stages as traced by tracing.py. Pass --live to use the real providers instead.
+The trace log is off unless --trace-log is given.
+
+Queries come from the query log written by the backend (QUERY_LOG_ENABLED=1, see
+query_log.py) or, when there is none, from a small built-in sample.
+
+    python -m benchmarks.replay_queries --repeat 3 --json replay.json
+"""
+import argparse
+import os
+import resource
+import sys
+import time
+from collections import defaultdict
+
+from benchmarks.harness import REPO_ROOT, write_json
+from instrumentation import percentile
+
+
+DEFAULT_QUERIES = [
+    "$.Microsoft[?(@.Date == '2024-06-14')].Close",
+    "$.Apple[0:5].Close",
+    "What was Apple's highest closing price?",
+    "How did Meta's trading volume change over time?",
+    "Which phrases in the phrasebank have a negative sentiment about profit?",
+    "What credit stage are most companies in?",
+    "Summarize Microsoft's recent stock performance",
+]
+
+
+def rss_mb():
+    """Current resident set size in MB (Linux), falling back to the peak."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def load_queries(path):
+    import query_log
+
+    if path and os.path.exists(path):
+        queries = [entry["query"] for entry in query_log.load(path) if entry.get("query")]
+        if queries:
+            return queries, path
+    return DEFAULT_QUERIES, "built-in sample"
+
+
+def stats(values):
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "count": len(values),
+        "mean_ms": ms(sum(values) / len(values)) if values else None,
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "max_ms": ms(max(values) if values else None),
+    }
+
+
+def main():
+    import query_log
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", default=query_log.QUERY_LOG_PATH, help="Query log to replay (JSON Lines)")
+    parser.add_argument("--limit", type=int, default=0, help="Replay at most this many distinct log entries")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay the query set this many times")
+    parser.add_argument("--live", action="store_true", help="Use OpenRouter and bge-small instead of the stand-ins")
+    parser.add_argument("--trace-log", action="store_true", help="Also append every replayed query to the trace log")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    if not args.live:
+        os.environ["QUERY_ENGINE_OFFLINE"] = "1"
+    if not args.trace_log:
+        os.environ["TRACE_LOG_ENABLED"] = "0"
+    os.environ.setdefault("DATA_DIR", REPO_ROOT)
+    queries, source = load_queries(args.log)
+    if args.limit:
+        queries = queries[:args.limit]
+
+    memory = {"baseline_rss_mb": round(rss_mb(), 1)}
+    start = time.perf_counter()
+    import data_access
+    import query_engine
+    import tracing
+    import_seconds = time.perf_counter() - start
+    memory["after_import_rss_mb"] = round(rss_mb(), 1)
+
+    start = time.perf_counter()
+    for name in ("cleaned", "financial_phrasebank", *data_access.STOCK_DATASETS):
+        data_access.load_dataset(name)
+    data_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    router_engine = query_engine.initialize_query_engine(data_access.DATASET_PATHS)
+    startup_seconds = time.perf_counter() - start
+    memory["after_startup_rss_mb"] = round(rss_mb(), 1)
+    if router_engine is None:
+        raise SystemExit("Query engine failed to initialize")
+
+    samples = defaultdict(list)
+    tokens = {"prompt": 0, "completion": 0}
+    failures = 0
+    for _ in range(args.repeat):
+        for query in queries:
+            start = time.perf_counter()
+            try:
+                result = query_engine.run_query_detailed(query, router_engine)
+            except Exception as e:
+                failures += 1
+                print(f"Query failed: {query!r}: {e}")
+                continue
+            samples["total"].append(time.perf_counter() - start)
+            for stage in tracing.STAGES:
+                samples[stage].append(result["stages_ms"][stage] / 1000)
+            tokens["prompt"] += result["tokens"]["prompt"]
+            tokens["completion"] += result["tokens"]["completion"]
+    memory["after_replay_rss_mb"] = round(rss_mb(), 1)
+    memory["peak_rss_mb"] = round(peak_rss_mb(), 1)
+
+    rows = {
+        "import": stats([import_seconds]),
+        "data_load": stats([data_seconds]),
+        "startup": stats([startup_seconds]),
+        **{stage: stats(samples[stage]) for stage in tracing.STAGES + ["total"]},
+    }
+    mode = "live" if args.live else "offline"
+    print(f"Query replay ({mode}, {len(queries)} queries from {source}, x{args.repeat}, {failures} failed)")
+    print(f"{'stage':<12}{'n':>6}{'mean ms':>11}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'max ms':>11}")
+    for stage, row in rows.items():
+        print(f"{stage:<12}{row['count']:>6}{row['mean_ms'] or 0:>11}{row['p50_ms'] or 0:>11}"
+              f"{row['p95_ms'] or 0:>11}{row['p99_ms'] or 0:>11}{row['max_ms'] or 0:>11}")
+    print("memory: " + ", ".join(f"{key}={value}" for key, value in memory.items()))
+    print(f"tokens: prompt={tokens['prompt']}, completion={tokens['completion']}")
+    if args.json:
+        write_json(args.json, {
+            "config": dict(vars(args), mode=mode, source=source, queries=len(queries)),
+            "failures": failures,
+            "stages": rows,
+            "memory": memory,
+            "tokens": tokens,
+        })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Dashboard startup benchmark.
+
+Every measurement runs in a fresh interpreter so import caches are cold:
+- import: time to import each heavy module the dashboard or the query path uses
+  (modules that are not installed are reported as unavailable);
+- login page: time for the first run of fr.py until the Sign Up/Log In tabs are
+  rendered, as a new browser session sees it (Streamlit itself is already imported
+  by the server, so it is imported before the clock starts);
+- dashboard: time for the first run after login (the default Financial Query page).
+For the page runs the heavy modules still absent from ``sys.modules`` afterwards
+are listed, which shows what the login page no longer pays for.
+
+The pages talk to a backend booted on a throwaway database (see harness.backend_server)
+unless --no-backend is given.
+
+    python -m benchmarks.startup_benchmark --repeat 3 --json startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from contextlib import nullcontext
+
+from benchmarks.harness import REPO_ROOT, backend_server, write_json
+
+
+IMPORT_MODULES = [
+    "streamlit", "pandas", "plotly.express", "requests", "data_access",
+    "llama_index.core", "query_engine", "torch",
+]
+HEAVY_MODULES = [
+    "pandas", "data_access", "plotly.express", "llama_index.core", "query_engine", "torch", "sentence_transformers",
+]
+
+IMPORT_SNIPPET = """
+import json, time
+start = time.perf_counter()
+try:
+    import {module}
+except Exception as e:
+    print(json.dumps({{"error": f"{{type(e).__name__}}: {{e}}"}}))
+else:
+    print(json.dumps({{"seconds": time.perf_counter() - start}}))
+"""
+
+PAGE_SNIPPET = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+state = json.loads(sys.argv[1])
+start = time.perf_counter()
+app = AppTest.from_file("fr.py", default_timeout=float(sys.argv[2]))
+for key, value in state.items():
+    app.session_state[key] = value
+app.run()
+print(json.dumps({
+    "seconds": time.perf_counter() - start,
+    "exceptions": [str(exception.value) for exception in app.exception],
+    "tabs": [tab.label for tab in app.tabs],
+    "not_imported": [name for name in json.loads(sys.argv[3]) if name not in sys.modules],
+}))
+"""
+
+LOGGED_IN_STATE = {
+    "logged_in": True, "username": "bench_admin", "email": "bench_admin@bench.local",
+    "role": "Administrator", "token": None, "page": "dashboard",
+}
+
+
+def run_snippet(snippet, args=(), env=None):
+    """Run ``snippet`` in a fresh interpreter from the repository root and decode the JSON it prints last."""
+    completed = subprocess.run(
+        [sys.executable, "-c", snippet, *args], cwd=REPO_ROOT, env={**os.environ, **(env or {})},
+        capture_output=True, text=True,
+    )
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        raise RuntimeError(f"Benchmark subprocess failed:\n{completed.stderr[-2000:]}")
+    return json.loads(lines[-1])
+
+
+def median_ms(values):
+    return round(statistics.median(values) * 1000, 1) if values else None
+
+
+def measure_imports(repeat):
+    results = {}
+    for module in IMPORT_MODULES:
+        runs = [run_snippet(IMPORT_SNIPPET.format(module=module)) for _ in range(repeat)]
+        errors = [run["error"] for run in runs if "error" in run]
+        results[module] = {"median_ms": median_ms([run["seconds"] for run in runs if "seconds" in run])}
+        if errors:
+            results[module]["unavailable"] = errors[0]
+    return results
+
+
+def measure_page(state, repeat, timeout, env):
+    runs = [run_snippet(PAGE_SNIPPET, [json.dumps(state), str(timeout), json.dumps(HEAVY_MODULES)], env) for _ in range(repeat)]
+    return {
+        "median_ms": median_ms([run["seconds"] for run in runs]),
+        "runs_ms": [round(run["seconds"] * 1000, 1) for run in runs],
+        "exceptions": runs[-1]["exceptions"],
+        "tabs": runs[-1]["tabs"],
+        "not_imported": runs[-1]["not_imported"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh-process runs per measurement")
+    parser.add_argument("--timeout", type=float, default=60, help="Script run timeout in seconds")
+    parser.add_argument("--no-backend", action="store_true", help="Do not boot a backend for the page runs")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    imports = measure_imports(args.repeat)
+    server = nullcontext(None) if args.no_backend else backend_server(env={"TRACE_LOG_ENABLED": "0"})
+    with server as base_url:
+        env = {"DATA_DIR": os.environ.get("DATA_DIR", REPO_ROOT)}
+        if base_url:
+            env["API_URL"] = base_url
+        pages = {
+            "login page": measure_page({}, args.repeat, args.timeout, env),
+            "dashboard": measure_page(LOGGED_IN_STATE, args.repeat, args.timeout, env),
+        }
+
+    print(f"Cold import times (median of {args.repeat} fresh processes)")
+    for module, row in imports.items():
+        value = f"{row['median_ms']} ms" if row["median_ms"] is not None else f"unavailable ({row['unavailable']})"
+        print(f"  {module:<22}{value}")
+    print("First script run in a new session")
+    for page, row in pages.items():
+        print(f"  {page:<22}{row['median_ms']} ms (runs: {row['runs_ms']})")
+        print(f"  {'':<22}not imported afterwards: {', '.join(row['not_imported']) or 'none'}")
+        if row["exceptions"]:
+            print(f"  {'':<22}exceptions: {row['exceptions']}")
+    if args.json:
+        write_json(args.json, {"config": vars(args), "imports": imports, "pages": pages})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Columnar, memory-mapped storage for the stock and credit-stage datasets.
+
+Each dataset is converted once from its JSON source into a directory holding one
+NumPy ``.npy`` file per column plus a ``_meta.json`` manifest. Readers open the
+columns with ``mmap_mode="r"``, so loading a dataset maps the files instead of
+re-parsing JSON, and the pages are shared by every process reading the store.
+
+Build or refresh the store with:
+
+    python columnar.py [SOURCE_DIR]
+"""
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+
+COLUMNAR_DIR = os.environ.get(
+    "COLUMNAR_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "columnar")
+)
+MANIFEST_NAME = "_meta.json"
+FORMAT_VERSION = 1
+
+STOCK_SOURCES = {
+    "Apple": "stock_AAPL-1.json",
+    "Meta": "stock_META-1.json",
+    "Microsoft": "stock_MSFT-1.json",
+}
+CLEANED_SOURCE = "cleaned.json"
+DATE_COLUMNS = {"Date"}
+
+
+def _dataset_dir(name):
+    return os.path.join(COLUMNAR_DIR, name)
+
+
+def _source_signature(source_path):
+    stat = os.stat(source_path)
+    return {"path": os.path.abspath(source_path), "mtime": stat.st_mtime, "size": stat.st_size}
+
+
+def _column_to_array(column, values):
+    """Convert a list of JSON values to a typed NumPy array; returns (array, kind)."""
+    present = [v for v in values if v is not None]
+    if column in DATE_COLUMNS:
+        return np.array(values, dtype="datetime64[ns]"), "date"
+    if present and all(isinstance(v, bool) for v in present):
+        return np.array([bool(v) for v in values], dtype=np.bool_), "bool"
+    if present and all(isinstance(v, int) and not isinstance(v, bool) for v in present):
+        if len(present) == len(values):
+            return np.array(values, dtype=np.int64), "int"
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64), "float"
+    if present and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64), "float"
+    return np.array(["" if v is None else str(v) for v in values], dtype=np.str_), "str"
+
+
+def write_dataset(name, records, source_path=None):
+    """
+    Write a list of flat records to the columnar store under ``name``.
+    Args:
+        name (str): Dataset name, e.g. "Apple" or "cleaned".
+        records (list): List of dicts sharing the same keys.
+        source_path (str, optional): JSON file the records came from, used for staleness checks.
+    Returns:
+        str: Directory the dataset was written to.
+    """
+    target = _dataset_dir(name)
+    os.makedirs(target, exist_ok=True)
+
+    columns = []
+    for record in records:
+        for key in record:
+            if key not in columns:
+                columns.append(key)
+
+    manifest = {
+        "version": FORMAT_VERSION,
+        "rows": len(records),
+        "columns": [],
+        "source": _source_signature(source_path) if source_path and os.path.exists(source_path) else None,
+    }
+    for index, column in enumerate(columns):
+        array, kind = _column_to_array(column, [record.get(column) for record in records])
+        file_name = f"c{index}.npy"
+        tmp_path = os.path.join(target, file_name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, array, allow_pickle=False)
+        os.replace(tmp_path, os.path.join(target, file_name))
+        manifest["columns"].append({"name": column, "file": file_name, "kind": kind})
+
+    # The manifest is written last so readers never see a half-written dataset.
+    tmp_manifest = os.path.join(target, MANIFEST_NAME + ".tmp")
+    with open(tmp_manifest, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_manifest, os.path.join(target, MANIFEST_NAME))
+    return target
+
+
+def _read_manifest(name):
+    path = os.path.join(_dataset_dir(name), MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != FORMAT_VERSION:
+        return None
+    return manifest
+
+
+def is_fresh(name, source_path=None):
+    """Return True if ``name`` exists in the store and is not older than ``source_path``."""
+    manifest = _read_manifest(name)
+    if manifest is None:
+        return False
+    if not source_path or not os.path.exists(source_path) or not manifest.get("source"):
+        return True
+    current = _source_signature(source_path)
+    return current["mtime"] == manifest["source"]["mtime"] and current["size"] == manifest["source"]["size"]
+
+
+def open_dataset(name, source_path=None):
+    """
+    Memory-map every column of a stored dataset.
+    Args:
+        name (str): Dataset name.
+        source_path (str, optional): JSON source; if it changed since ingest the store is ignored.
+    Returns:
+        tuple or None: (dict of column name -> read-only array, dict of column name -> kind),
+        or None if the dataset is missing or stale.
+    """
+    if not is_fresh(name, source_path):
+        return None
+    manifest = _read_manifest(name)
+    arrays, kinds = {}, {}
+    for column in manifest["columns"]:
+        path = os.path.join(_dataset_dir(name), column["file"])
+        arrays[column["name"]] = np.load(path, mmap_mode="r", allow_pickle=False)
+        kinds[column["name"]] = column["kind"]
+    return arrays, kinds
+
+
+def read_frame(name, source_path=None):
+    """
+    Return the dataset as a DataFrame backed by the mapped columns, or None if unavailable.
+    Numeric, boolean and date columns stay views of the mapped files: each is wrapped in its
+    own Series, so pandas keeps one block per column instead of consolidating them into a
+    copy. Text columns are converted to pandas strings and therefore copied.
+    """
+    opened = open_dataset(name, source_path)
+    if opened is None:
+        return None
+    arrays, _ = opened
+    index = pd.RangeIndex(len(next(iter(arrays.values()))) if arrays else 0)
+    columns = {column: pd.Series(array, index=index, copy=False) for column, array in arrays.items()}
+    return pd.DataFrame(columns, index=index, copy=False)
+
+
+def read_records(name, source_path=None):
+    """Return the dataset as JSON-compatible records (dates as YYYY-MM-DD), or None if unavailable."""
+    opened = open_dataset(name, source_path)
+    if opened is None:
+        return None
+    arrays, kinds = opened
+    columns = []
+    for column, array in arrays.items():
+        if kinds[column] == "date":
+            columns.append(np.datetime_as_string(array, unit="D").tolist())
+        elif kinds[column] == "float":
+            columns.append([None if v != v else v for v in array.tolist()])
+        else:
+            columns.append(array.tolist())
+    names = list(arrays)
+    return [dict(zip(names, row)) for row in zip(*columns)]
+
+
+def ingest(source_dir):
+    """
+    Convert the stock OHLCV files and cleaned.json found in ``source_dir`` into the columnar store.
+    Args:
+        source_dir (str): Directory containing the JSON sources.
+    Returns:
+        list: Names of the datasets written.
+    """
+    written = []
+    for company, file_name in STOCK_SOURCES.items():
+        path = os.path.join(source_dir, file_name)
+        if not os.path.exists(path):
+            print(f"Skipping {company}: {path} not found")
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            raw_data = json.load(f)
+        records = raw_data[company] if isinstance(raw_data, dict) and company in raw_data else raw_data
+        # Bars are stored in date order so readers can use them without re-sorting.
+        records = sorted(records, key=lambda record: record.get("Date") or "")
+        write_dataset(company, records, source_path=path)
+        written.append(company)
+
+    path = os.path.join(source_dir, CLEANED_SOURCE)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            write_dataset("cleaned", json.load(f), source_path=path)
+        written.append("cleaned")
+    else:
+        print(f"Skipping cleaned: {path} not found")
+    return written
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(os.path.abspath(__file__))
+    datasets = ingest(source)
+    print(f"Wrote {', '.join(datasets) or 'nothing'} to {COLUMNAR_DIR}")
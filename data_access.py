@@ -0,0 +1,273 @@
+"""
+Shared data access for the dashboard, the query engine and the API.
+
+Each dataset is loaded, validated and parsed at most once per process and then
+served from an in-process cache. Stock and credit-stage data are read from the
+columnar store when it is available (see columnar.py) and from the JSON sources
+otherwise. Data fetched from the backend API can be registered with ``prime`` so
+that every consumer in the process shares the same parsed copy. A dataset that no
+source could provide is remembered as failed too (``record_failure``), so callers
+fall back to sample data without retrying every source until its backoff expires.
+
+Configuration (environment variables):
+    DATA_DIR            Directory holding the JSON sources
+    DATA_RETRY_SECONDS  First backoff after a failed load, doubled per consecutive failure
+                        up to DATA_RETRY_MAX_SECONDS (default 30)
+"""
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import columnar
+import http_client
+import instrumentation
+
+
+DATA_DIR = os.environ.get("DATA_DIR", r"C:\Users\Fa\Desktop\Streamlit-Authentication-main")
+DATASET_FILES = {
+    "Apple": "stock_AAPL-1.json",
+    "Meta": "stock_META-1.json",
+    "Microsoft": "stock_MSFT-1.json",
+    "cleaned": "cleaned.json",
+    "financial_phrasebank": "financial_phrasebank (2).json",
+}
+DATASET_PATHS = {name: os.path.join(DATA_DIR, file_name) for name, file_name in DATASET_FILES.items()}
+STOCK_DATASETS = ("Apple", "Meta", "Microsoft")
+API_ENDPOINTS = {
+    "Apple": "/data/apple",
+    "Meta": "/data/meta",
+    "Microsoft": "/data/microsoft",
+    "cleaned": "/data/cleaned",
+    "financial_phrasebank": "/data/financial_phrasebank",
+}
+
+REQUIRED_STOCK_COLUMNS = ['Date', 'Close', 'Open', 'High', 'Low', 'Volume']
+REQUIRED_CLEANED_COLUMNS = ['Credit Expiration', 'Current Stage', 'DPD']
+REQUIRED_PHRASEBANK_COLUMNS = ['Text', 'Sentiment']
+
+DATA_RETRY_SECONDS = float(os.environ.get("DATA_RETRY_SECONDS", "30"))
+DATA_RETRY_MAX_SECONDS = 600
+
+
+class Dataset:
+    """
+    A parsed dataset. ``frame`` and ``records`` come from the same parse; for the
+    financial phrasebank ``texts`` and ``sentiments`` hold the pre-split arrays that
+    back the frame's columns.
+    """
+
+    def __init__(self, name, frame, source, records=None, texts=None, sentiments=None):
+        self.name = name
+        self.frame = frame
+        self.source = source
+        self.texts = texts
+        self.sentiments = sentiments
+        self._records = records
+        self._records_lock = threading.Lock()
+
+    @property
+    def records(self):
+        """JSON-compatible records, in the same shape the API serves them."""
+        if self._records is None:
+            with self._records_lock:
+                if self._records is None:
+                    self._records = columnar.read_records(self.name) if self.source == "columnar" else None
+                    if self._records is None:
+                        self._records = self.frame.to_dict("records")
+        return self._records
+
+
+_cache = {}
+_failures = {}  # name -> (monotonic time of the next retry, consecutive failures)
+_locks = {name: threading.Lock() for name in DATASET_FILES}
+
+
+def _stock_frame(name, df):
+    missing_columns = [col for col in REQUIRED_STOCK_COLUMNS if col not in df.columns]
+    if missing_columns:
+        raise ValueError(f"Missing required columns in {name} data: {', '.join(missing_columns)}")
+    if not pd.api.types.is_datetime64_any_dtype(df['Date']):
+        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+    if df['Date'].isna().all():
+        raise ValueError(f"Invalid date format in {name} data")
+    # Columnar data is stored sorted, so skip the copying dropna/sort when it is already clean.
+    if df['Date'].isna().any():
+        df = df.dropna(subset=['Date'])
+    if not df['Date'].is_monotonic_increasing:
+        df = df.sort_values('Date')
+    return df
+
+
+def parse_dataset(name, raw, source):
+    """
+    Validate and parse raw JSON data (as read from disk or returned by the API).
+    Args:
+        name (str): Dataset name, one of DATASET_FILES.
+        raw: Decoded JSON value.
+        source (str): Where the data came from, e.g. "api" or "json".
+    Returns:
+        Dataset: The parsed dataset.
+    Raises:
+        ValueError: If the data is missing required columns or labels.
+    """
+    if name in STOCK_DATASETS:
+        records = raw[name] if isinstance(raw, dict) and name in raw else raw
+        return Dataset(name, _stock_frame(name, pd.DataFrame(records)), source, records=records)
+    if name == "cleaned":
+        df = pd.DataFrame(raw)
+        missing_columns = [col for col in REQUIRED_CLEANED_COLUMNS if col not in df.columns]
+        if missing_columns:
+            raise ValueError(f"Missing required columns in cleaned data: {', '.join(missing_columns)}")
+        return Dataset(name, df, source, records=raw)
+    if name == "financial_phrasebank":
+        texts = np.empty(len(raw), dtype=object)
+        sentiments = np.empty(len(raw), dtype=object)
+        for i, item in enumerate(raw):
+            text, sep, sentiment = item.rpartition('@')
+            if not sep or not sentiment:
+                raise ValueError("Some entries in financial_phrasebank data are missing sentiment labels")
+            texts[i] = text
+            sentiments[i] = sentiment
+        df = pd.DataFrame({"Text": texts, "Sentiment": sentiments}, copy=False)
+        return Dataset(name, df, source, records=raw, texts=texts, sentiments=sentiments)
+    raise ValueError(f"Unknown dataset: {name}")
+
+
+def _load_from_disk(name):
+    path = DATASET_PATHS[name]
+    if name in STOCK_DATASETS or name == "cleaned":
+        df = columnar.read_frame(name, path)
+        if df is not None:
+            if name in STOCK_DATASETS:
+                df = _stock_frame(name, df)
+            return Dataset(name, df, "columnar")
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"File not found: {path}")
+    with open(path, 'r', encoding='utf-8') as f:
+        raw = json.load(f)
+    return parse_dataset(name, raw, "json")
+
+
+def get_cached(name):
+    """Return the cached dataset for ``name`` or None if it has not been loaded yet."""
+    return _cache.get(name)
+
+
+def load_dataset(name):
+    """
+    Return the dataset for ``name``, loading it from disk the first time it is requested.
+    Raises:
+        FileNotFoundError: If neither the columnar store nor the JSON source exists.
+        ValueError: If the data fails validation.
+    """
+    dataset = _cache.get(name)
+    if dataset is not None:
+        instrumentation.increment("dataset_cache_requests", dataset=name, result="hit")
+        return dataset
+    with _locks[name]:
+        dataset = _cache.get(name)
+        if dataset is None:
+            instrumentation.increment("dataset_cache_requests", dataset=name, result="miss")
+            with instrumentation.timer("dataset_load_seconds", dataset=name):
+                dataset = _load_from_disk(name)
+            _cache[name] = dataset
+            _failures.pop(name, None)
+        else:
+            instrumentation.increment("dataset_cache_requests", dataset=name, result="hit")
+        return dataset
+
+
+def preload(names=None):
+    """
+    Load every dataset and its records into the cache, e.g. before forking worker processes so they share it.
+    Returns:
+        dict: Dataset name -> error message, for the datasets that could not be loaded.
+    """
+    errors = {}
+    for name in names or DATASET_FILES:
+        try:
+            load_dataset(name).records
+        except Exception as e:
+            errors[name] = str(e)
+    return errors
+
+
+def store(dataset):
+    """Make ``dataset`` the cached copy for its name; returns it."""
+    with _locks[dataset.name]:
+        _cache[dataset.name] = dataset
+        _failures.pop(dataset.name, None)
+    return dataset
+
+
+def prime(name, raw, source="api"):
+    """Parse ``raw`` and make it the cached copy of ``name``; returns the Dataset."""
+    return store(parse_dataset(name, raw, source))
+
+
+def fetch_from_api(name, client=None, timeout=None, cache=True):
+    """
+    Fetch ``name`` from the backend.
+    Args:
+        name (str): Dataset name.
+        client (http_client.BackendClient, optional): Client to use; defaults to the shared client.
+        timeout (float, optional): Request timeout in seconds; defaults to the client's timeout.
+        cache (bool): Whether to make the result the cached copy.
+    Returns:
+        Dataset: The parsed dataset.
+    """
+    client = client or http_client.get_client()
+    response = client.get(API_ENDPOINTS[name], timeout=timeout)
+    response.raise_for_status()
+    if cache:
+        return prime(name, response.json())
+    return parse_dataset(name, response.json(), "api")
+
+
+def record_failure(name):
+    """
+    Remember that no source could provide ``name``.
+    Returns:
+        float: Seconds before the dataset should be tried again.
+    """
+    with _locks[name]:
+        failures = _failures.get(name, (0, 0))[1]
+        delay = min(DATA_RETRY_SECONDS * 2 ** failures, DATA_RETRY_MAX_SECONDS)
+        _failures[name] = (time.monotonic() + delay, failures + 1)
+    return delay
+
+
+def retry_after(name):
+    """Return the seconds left before a failed ``name`` should be tried again, or None if it may be loaded now."""
+    failure = _failures.get(name)
+    if failure is None:
+        return None
+    remaining = failure[0] - time.monotonic()
+    return remaining if remaining > 0 else None
+
+
+def clear_cache(name=None):
+    """Drop one cached dataset and its failure backoff, or all of them when ``name`` is None."""
+    if name is None:
+        _cache.clear()
+        _failures.clear()
+    else:
+        _cache.pop(name, None)
+        _failures.pop(name, None)
+
+
+def get_frame(name):
+    return load_dataset(name).frame
+
+
+def get_records(name):
+    return load_dataset(name).records
+
+
+def get_phrases():
+    """Return the (texts, sentiments) arrays of the financial phrasebank."""
+    dataset = load_dataset("financial_phrasebank")
+    return dataset.texts, dataset.sentiments
@@ -0,0 +1,137 @@
+"""
+Engine construction for the backend database.
+
+SQLite's defaults (rollback journal, synchronous=FULL, no memory-mapped I/O) make
+every writer block every reader. ``make_engine`` applies tuned pragmas to each new
+connection and sizes the connection pool explicitly, so feedback writes and
+``/users`` reads can proceed concurrently under WAL. ``make_async_engine`` builds
+the same configuration on aiosqlite for the async route handlers. Both engines
+time every statement into the ``db_query_seconds`` histogram (see instrumentation.py),
+labelled by statement kind (SELECT, INSERT, ...).
+
+Configuration (environment variables):
+    DB_JOURNAL_MODE     SQLite journal mode (default WAL)
+    DB_SYNCHRONOUS      SQLite synchronous level (default NORMAL)
+    DB_MMAP_SIZE        Bytes of the database file to memory-map (default 268435456)
+    DB_BUSY_TIMEOUT_MS  How long to wait on a locked database (default 5000)
+    DB_POOL_SIZE        Connections kept open in the pool (default 10)
+    DB_MAX_OVERFLOW     Extra connections allowed under burst (default 20)
+    DB_POOL_TIMEOUT     Seconds to wait for a free connection (default 30)
+"""
+import os
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
+
+import instrumentation
+
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": os.environ.get("DB_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("DB_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.environ.get("DB_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "busy_timeout": int(os.environ.get("DB_BUSY_TIMEOUT_MS", "5000")),
+    "foreign_keys": "ON",
+}
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "20"))
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+
+
+def _is_memory_url(url):
+    return url in ("sqlite://", "sqlite:///:memory:") or ":memory:" in url
+
+
+def install_pragmas(engine, pragmas):
+    """Run ``PRAGMA key=value`` for every pragma on each new DBAPI connection of ``engine``."""
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for key, value in pragmas.items():
+                cursor.execute(f"PRAGMA {key}={value}")
+        finally:
+            cursor.close()
+
+
+def install_query_metrics(engine):
+    """Observe the duration of every statement ``engine`` executes as ``db_query_seconds``."""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info["query_start"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        instrumentation.observe("db_query_seconds", seconds, operation=operation)
+
+    @event.listens_for(engine, "handle_error")
+    def _drop_timer(context):
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+
+def async_url(url):
+    """Return the async-driver form of ``url`` (sqlite:// -> sqlite+aiosqlite://)."""
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+
+def engine_options(url, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT, busy_timeout_ms=None,
+                   asynchronous=False):
+    """Return the ``create_engine`` keyword arguments for ``url`` (pool class, sizing, connect args)."""
+    if not url.startswith("sqlite"):
+        return {"pool_size": pool_size, "max_overflow": max_overflow, "pool_timeout": pool_timeout, "pool_pre_ping": True}
+    busy_timeout_ms = DEFAULT_PRAGMAS["busy_timeout"] if busy_timeout_ms is None else busy_timeout_ms
+    connect_args = {"check_same_thread": False, "timeout": busy_timeout_ms / 1000}
+    if _is_memory_url(url):
+        return {"connect_args": connect_args, "poolclass": StaticPool}
+    return {
+        "connect_args": connect_args,
+        "poolclass": AsyncAdaptedQueuePool if asynchronous else QueuePool,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": pool_timeout,
+    }
+
+
+def make_engine(url, pragmas=None, **pool_options):
+    """
+    Create a SQLAlchemy engine with tuned pragmas and an explicitly sized pool.
+    Args:
+        url (str): Database URL, e.g. "sqlite:///./users.db".
+        pragmas (dict, optional): SQLite pragmas to apply per connection; defaults to DEFAULT_PRAGMAS.
+        **pool_options: pool_size, max_overflow and pool_timeout overrides.
+    Returns:
+        sqlalchemy.engine.Engine: The configured engine.
+    """
+    pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+    engine = create_engine(url, **engine_options(url, busy_timeout_ms=pragmas.get("busy_timeout"), **pool_options))
+    if url.startswith("sqlite") and pragmas:
+        install_pragmas(engine, pragmas)
+    install_query_metrics(engine)
+    return engine
+
+
+def make_async_engine(url, pragmas=None, **pool_options):
+    """
+    Create an async engine (aiosqlite for SQLite) with the same pragmas and pool sizing as ``make_engine``.
+    Args:
+        url (str): Database URL in its sync form; the driver is swapped by ``async_url``.
+        pragmas (dict, optional): SQLite pragmas to apply per connection; defaults to DEFAULT_PRAGMAS.
+        **pool_options: pool_size, max_overflow and pool_timeout overrides.
+    Returns:
+        sqlalchemy.ext.asyncio.AsyncEngine: The configured engine.
+    """
+    pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+    options = engine_options(url, busy_timeout_ms=pragmas.get("busy_timeout"), asynchronous=True, **pool_options)
+    engine = create_async_engine(async_url(url), **options)
+    if url.startswith("sqlite") and pragmas:
+        install_pragmas(engine.sync_engine, pragmas)
+    install_query_metrics(engine.sync_engine)
+    return engine
@@ -0,0 +1,104 @@
+"""
+Downsampling of long price series for the dashboard charts.
+
+Charts are drawn from the full history but never with more than a fixed number
+of points, so their cost in the browser and in the figure payload does not grow
+with the length of the history or the number of tickers:
+- price lines use Largest-Triangle-Three-Buckets (LTTB), which keeps the first
+  and last points and, per bucket, the point that best preserves the visual
+  shape (peaks, troughs and trend changes survive, unlike plain striding);
+- OHLCV bars are aggregated over equal-width buckets of consecutive rows (only
+  the last one may be shorter): first Open, max High, min Low, last Close and
+  summed Volume, dated by the bucket's first day. ``Days`` counts the rows of
+  each bucket, so charts can show Volume / Days, the mean daily volume.
+Series already within the budget are returned unchanged.
+
+Configuration (environment variables):
+    CHART_POINT_BUDGET  Maximum points per chart series (default 1000)
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+
+CHART_POINT_BUDGET = int(os.environ.get("CHART_POINT_BUDGET", "1000"))
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Select the points of a line to keep with Largest-Triangle-Three-Buckets.
+    Args:
+        x (array-like): Increasing x values (numbers or datetimes).
+        y (array-like): y values, without NaNs.
+        threshold (int): Number of points to keep.
+    Returns:
+        numpy.ndarray: Sorted row positions of the kept points.
+    """
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype("datetime64[ns]").astype(np.int64)
+    x = x.astype(np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # Bucket i covers rows bounds[i]:bounds[i + 1] of the interior points; the first and last points stay.
+    bounds = (np.arange(threshold - 1) * ((n - 2) / (threshold - 2))).astype(np.int64) + 1
+    bounds[-1] = n - 1
+    # Each bucket is scored against the average point of the next one (the last point for the final bucket).
+    sizes = np.diff(bounds)
+    avg_x = np.append(np.add.reduceat(x[1:n - 1], bounds[:-1] - 1) / sizes, x[-1])[1:]
+    avg_y = np.append(np.add.reduceat(y[1:n - 1], bounds[:-1] - 1) / sizes, y[-1])[1:]
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0] = a = 0
+    for i in range(threshold - 2):
+        start, end = bounds[i], bounds[i + 1]
+        xs, ys = x[start:end], y[start:end]
+        areas = np.abs((x[a] - avg_x[i]) * (ys - y[a]) - (x[a] - xs) * (avg_y[i] - y[a]))
+        a = start + areas.argmax()
+        kept[i + 1] = a
+    kept[-1] = n - 1
+    return kept
+
+
+def downsample_line(frame, x, y, max_points=CHART_POINT_BUDGET):
+    """
+    Reduce ``frame`` to at most ``max_points`` rows chosen by LTTB on the ``x``/``y`` columns.
+    Rows with a missing ``y`` are dropped; ``frame`` must be sorted by ``x``.
+    """
+    frame = frame.dropna(subset=[y])
+    if len(frame) <= max_points:
+        return frame
+    return frame.iloc[lttb_indices(frame[x].to_numpy(), frame[y].to_numpy(), max_points)]
+
+
+def bucket_ohlcv(frame, max_points=CHART_POINT_BUDGET, date_column="Date"):
+    """
+    Aggregate consecutive rows of a date-sorted OHLCV frame into at most ``max_points`` buckets of
+    the same number of rows (the last bucket may hold fewer). Only the Open/High/Low/Close/Volume
+    columns present in ``frame`` are aggregated.
+    Returns:
+        pandas.DataFrame: One row per bucket, with a ``Days`` column counting the rows it covers
+        (``frame`` itself when it is already within the budget).
+    """
+    n = len(frame)
+    if n <= max_points:
+        return frame
+    # Equal widths: a mix of 1- and 2-row buckets would make summed volume zigzag.
+    starts = np.arange(0, n, -(-n // max_points))
+    ends = np.append(starts[1:], n)
+    buckets = {date_column: frame[date_column].to_numpy()[starts]}
+    reducers = {
+        "Open": lambda values: values[starts],
+        "High": lambda values: np.maximum.reduceat(values, starts),
+        "Low": lambda values: np.minimum.reduceat(values, starts),
+        "Close": lambda values: values[ends - 1],
+        "Volume": lambda values: np.add.reduceat(values, starts),
+    }
+    for column, reduce in reducers.items():
+        if column in frame:
+            buckets[column] = reduce(frame[column].to_numpy())
+    buckets["Days"] = ends - starts
+    return pd.DataFrame(buckets)
@@ -0,0 +1,323 @@
+"""
+Shared embedding worker: hosts the embedding model once per machine and micro-batches requests.
+
+Without it every backend worker and every Streamlit process that builds the query
+engine loads its own copy of bge-small. Run this process once and point the others
+at it with EMBEDDING_SERVICE_URL; ``query_engine.build_embed_model`` then uses a
+thin client (``query_engine.RemoteEmbedding``) instead of loading the model.
+
+Requests from all callers are queued and grouped into one model call per batch:
+a batch starts with the first waiting request and takes whatever else arrives
+within EMBED_BATCH_WINDOW_MS, up to EMBED_MAX_BATCH texts. Query and document
+texts are embedded separately, since bge prefixes queries with an instruction:
+queries get the instruction applied here and then go through the same batched
+model call as documents (see ``query_formatter``). Batches run one at a time on
+a single model thread; requests arriving meanwhile form the next batch. A batch
+that fails, for whatever reason, fails only the requests in it.
+
+    python embedding_service.py                      # http://127.0.0.1:8003
+    EMBEDDING_SERVICE_SOCKET=/tmp/embed.sock python embedding_service.py
+
+API:
+    POST /embed    {"texts": [...], "kind": "text" | "query"} -> {"embeddings": [[...], ...]}
+    GET  /health   model name, embedding dimension and batch statistics
+    GET  /metrics  Prometheus metrics (batch sizes, batch latency)
+
+Configuration (environment variables):
+    EMBEDDING_MODEL            Hugging Face model name (default BAAI/bge-small-en-v1.5);
+                               QUERY_ENGINE_OFFLINE=1 uses offline_models.HashEmbedding
+    EMBEDDING_SERVICE_HOST     Bind address (default 127.0.0.1)
+    EMBEDDING_SERVICE_PORT     Port (default 8003)
+    EMBEDDING_SERVICE_SOCKET   Unix socket path; overrides host and port
+    EMBED_BATCH_WINDOW_MS      How long a batch waits for more requests (default 5)
+    EMBED_MAX_BATCH            Texts per model call (default 64)
+    EMBEDDING_SERVICE_URL      (clients) http://host:port or unix:///path/to.sock
+    EMBEDDING_SERVICE_TIMEOUT  (clients) Request timeout in seconds (default 30)
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+
+import instrumentation
+import metrics
+
+
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "BAAI/bge-small-en-v1.5")
+EMBEDDING_SERVICE_HOST = os.environ.get("EMBEDDING_SERVICE_HOST", "127.0.0.1")
+EMBEDDING_SERVICE_PORT = int(os.environ.get("EMBEDDING_SERVICE_PORT", "8003"))
+EMBEDDING_SERVICE_SOCKET = os.environ.get("EMBEDDING_SERVICE_SOCKET")
+EMBED_BATCH_WINDOW_MS = float(os.environ.get("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_MAX_BATCH = int(os.environ.get("EMBED_MAX_BATCH", "64"))
+EMBEDDING_SERVICE_URL = os.environ.get("EMBEDDING_SERVICE_URL")
+EMBEDDING_SERVICE_TIMEOUT = float(os.environ.get("EMBEDDING_SERVICE_TIMEOUT", "30"))
+KINDS = ("text", "query")
+
+instrumentation.set_buckets("embedding_batch_texts", (1, 2, 4, 8, 16, 32, 64, 128, 256))
+
+
+def load_model():
+    """Load the embedding model this service hosts (same choice as query_engine.build_embed_model)."""
+    if os.environ.get("QUERY_ENGINE_OFFLINE", "0").lower() in ("1", "true", "yes"):
+        from offline_models import HashEmbedding
+        return HashEmbedding()
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+    return HuggingFaceEmbedding(model_name=EMBEDDING_MODEL)
+
+
+def query_formatter(model, probe="Which company had the highest closing price last month?"):
+    """
+    Find how ``model`` turns a query into the text it embeds, so queries can be batched like documents.
+    Args:
+        model: The embedding model.
+        probe (str): Query used to check the candidate formats.
+    Returns:
+        callable or None: ``format(query) -> text`` whose batched text embedding matches
+        ``model.get_query_embedding(query)``, or None if no candidate matches (queries are then
+        embedded one by one through the query API).
+    """
+    candidates = [lambda text: text]
+    try:
+        from llama_index.embeddings.huggingface.utils import get_query_instruct_for_model_name
+    except ImportError:
+        pass
+    else:
+        instruction = getattr(model, "query_instruction", None) or get_query_instruct_for_model_name(
+            getattr(model, "model_name", None)
+        )
+        if instruction:
+            # Older llama-index versions join instruction and query with a space, newer ones prepend it as is.
+            candidates = [lambda text: f"{instruction} {text}".strip(), lambda text: instruction + text]
+    expected = model.get_query_embedding(probe)
+    for candidate in candidates:
+        vector = model.get_text_embedding_batch([candidate(probe)])[0]
+        if len(vector) == len(expected) and max(abs(a - b) for a, b in zip(vector, expected)) < 1e-4:
+            return candidate
+    return None
+
+
+def model_embed(model, kind, texts, format_query=None):
+    """
+    Embed a batch with ``model`` in one batched model call. Queries are first formatted with
+    ``format_query`` (see ``query_formatter``); without it they are embedded one by one through
+    the query API, which applies the query instruction itself.
+    """
+    if kind == "query":
+        if format_query is None:
+            return [model.get_query_embedding(text) for text in texts]
+        texts = [format_query(text) for text in texts]
+    return model.get_text_embedding_batch(texts)
+
+
+class MicroBatcher:
+    def __init__(self, embed, window_ms=EMBED_BATCH_WINDOW_MS, max_batch=EMBED_MAX_BATCH):
+        """
+        Args:
+            embed: ``embed(kind, texts) -> list of vectors``, called on a single worker thread.
+            window_ms (float): How long a batch waits for more requests after the first one.
+            max_batch (int): Texts per ``embed`` call, except that one request is never split.
+        """
+        self.embed = embed
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.batches = 0
+        self.texts = 0
+        self._queue = None
+        self._task = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-model")
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while not self._queue.empty():
+            _fail([self._queue.get_nowait()], RuntimeError("Embedding service is shutting down"))
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def submit(self, kind, texts):
+        """Queue ``texts`` for the next batch and wait for their vectors."""
+        if self._task.done():
+            # Never expected (``_run`` survives failing batches), but a dead loop would hang every caller.
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((kind, texts, future))
+        return await future
+
+    async def _collect(self, batch):
+        """Wait for a first request, then gather more into ``batch`` until the window closes or it is full."""
+        batch.append(await self._queue.get())
+        size = len(batch[0][1])
+        deadline = time.monotonic() + self.window
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            size += len(item[1])
+
+    async def _run(self):
+        while True:
+            batch = []
+            try:
+                await self._collect(batch)
+                await self._embed_batch(batch)
+            except asyncio.CancelledError:
+                _fail(batch, RuntimeError("Embedding service is shutting down"))
+                raise
+            except Exception as e:
+                print(f"Embedding batch failed: {e}")
+                _fail(batch, e)
+
+    async def _embed_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        for kind in KINDS:
+            items = [(texts, future) for item_kind, texts, future in batch if item_kind == kind and not future.done()]
+            if not items:
+                continue
+            texts = [text for item_texts, _ in items for text in item_texts]
+            start = time.perf_counter()
+            try:
+                vectors = await loop.run_in_executor(self._executor, self.embed, kind, texts)
+                if len(vectors) != len(texts):
+                    raise RuntimeError(f"Model returned {len(vectors)} vectors for {len(texts)} texts")
+            except Exception as e:
+                _fail([(kind, item_texts, future) for item_texts, future in items], e)
+                continue
+            instrumentation.observe("embedding_batch_seconds", time.perf_counter() - start, kind=kind)
+            instrumentation.observe("embedding_batch_texts", len(texts), kind=kind)
+            self.batches += 1
+            self.texts += len(texts)
+            offset = 0
+            for item_texts, future in items:
+                if not future.done():
+                    future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+
+def _fail(batch, error):
+    """Fail the requests of ``batch`` that have not been answered yet."""
+    for _, _, future in batch:
+        if not future.done():
+            future.set_exception(error)
+
+
+class EmbedRequest(BaseModel):
+    texts: List[str]
+    kind: str = "text"
+
+
+app = FastAPI(title="Embedding Service", description="Shared, micro-batched embedding model")
+model = None
+dimension = None
+batched_queries = False
+batcher = None
+
+
+@app.on_event("startup")
+async def start_batcher():
+    global model, dimension, batched_queries, batcher
+    # Loading the model can take a while; keep the event loop free meanwhile.
+    model = await asyncio.to_thread(load_model)
+    dimension = len(await asyncio.to_thread(model.get_text_embedding, "dimension probe"))
+    format_query = await asyncio.to_thread(query_formatter, model)
+    batched_queries = format_query is not None
+    if not batched_queries:
+        print("Query instruction not recognised; queries are embedded one by one")
+    batcher = MicroBatcher(lambda kind, texts: model_embed(model, kind, texts, format_query))
+    batcher.start()
+
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    if batcher is not None:
+        await batcher.stop()
+
+
+@app.post("/embed")
+async def embed(request: EmbedRequest):
+    if request.kind not in KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {', '.join(KINDS)}")
+    if not request.texts:
+        return {"embeddings": []}
+    try:
+        return {"embeddings": await batcher.submit(request.kind, request.texts)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Embedding failed: {str(e)}")
+
+
+@app.get("/health")
+async def health():
+    return {
+        "model": getattr(model, "model_name", type(model).__name__),
+        "dimension": dimension,
+        "batched_queries": batched_queries,
+        "batches": batcher.batches,
+        "texts": batcher.texts,
+        "mean_batch_texts": round(batcher.texts / batcher.batches, 2) if batcher.batches else None,
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(instrumentation.render_prometheus(), media_type=metrics.CONTENT_TYPE)
+
+
+class ServiceClient:
+    """Keep-alive HTTP client for the embedding service, over TCP or a Unix socket."""
+
+    def __init__(self, url=None, timeout=EMBEDDING_SERVICE_TIMEOUT):
+        """
+        Args:
+            url (str, optional): http://host:port or unix:///path/to.sock; defaults to EMBEDDING_SERVICE_URL.
+            timeout (float): Request timeout in seconds.
+        """
+        url = url or EMBEDDING_SERVICE_URL
+        if not url:
+            raise ValueError("No embedding service URL configured (set EMBEDDING_SERVICE_URL)")
+        if url.startswith("unix://"):
+            transport = httpx.HTTPTransport(uds=url[len("unix://"):])
+            self._client = httpx.Client(transport=transport, base_url="http://embedding-service", timeout=timeout)
+        else:
+            self._client = httpx.Client(base_url=url.rstrip("/"), timeout=timeout)
+
+    def embed(self, texts, kind="text"):
+        """Return one vector per text."""
+        if not texts:
+            return []
+        response = self._client.post("/embed", json={"texts": list(texts), "kind": kind})
+        response.raise_for_status()
+        return response.json()["embeddings"]
+
+    def health(self):
+        response = self._client.get("/health")
+        response.raise_for_status()
+        return response.json()
+
+    def close(self):
+        self._client.close()
+
+
+if __name__ == "__main__":
+    if EMBEDDING_SERVICE_SOCKET:
+        uvicorn.run(app, uds=EMBEDDING_SERVICE_SOCKET)
+    else:
+        uvicorn.run(app, host=EMBEDDING_SERVICE_HOST, port=EMBEDDING_SERVICE_PORT)
@@ -1,878 +1,1212 @@
-import streamlit as st
-import requests
-import plotly.express as px
-import pandas as pd
-import json
-import os
-from datetime import datetime, timedelta
-
-
-try:
-    from query_engine import initialize_query_engine, run_query
-except ImportError as e:
-    st.error(f"Failed to import query_engine: {e}. Query Interface will be disabled.")
-    initialize_query_engine = lambda x: None
-    run_query = lambda x, y: "Query Interface is disabled due to import error."
-
-
-st.set_page_config(page_title="Financial Insights Dashboard", layout="wide")
-
-
-st.markdown("""
-<style>
-@import url('https://fonts.googleapis.com/css2?family=Roboto:wght@300;400;700&display=swap');
-.stApp {
-    background-color: #F3F4F6;
-    font-family: 'Roboto', sans-serif;
-}
-.auth-container {
-    background: #FFFFFF;
-    padding: 2rem;
-    border-radius: 12px;
-    box-shadow: 0 4px 12px rgba(0, 0, 0, 0.1);
-    max-width: 400px;
-    margin: 3rem auto;
-    text-align: center;
-}
-.main-title {
-    text-align: center;
-    font-size: 2.5rem;
-    font-weight: 700;
-    color: #1E3A8A;
-    margin-bottom: 1rem;
-}
-.logo {
-    display: block;
-    margin: 0 auto 1rem;
-    max-width: 100px;
-}
-.stTabs [data-baseweb="tab-list"] {
-    gap: 1rem;
-    justify-content: center;
-}
-.stTabs [data-baseweb="tab"] {
-    background-color: #FFFFFF;
-    color: #1E3A8A;
-    font-weight: 400;
-    font-size: 1rem;
-    padding: 0.5rem 1rem;
-    border-radius: 8px;
-    transition: all 0.3s ease;
-}
-.stTabs [data-baseweb="tab"][aria-selected="true"] {
-    background-color: #1E3A8A;
-    color: #FFFFFF;
-}
-.stTabs [data-baseweb="tab"]:hover {
-    background-color: #E5E7EB;
-}
-.stTextInput > div > div > input {
-    background-color: #FFFFFF;
-    border: 1px solid #D1D5DB;
-    border-radius: 8px;
-    padding: 0.7rem;
-    color: #1E3A8A;
-    font-size: 0.95rem;
-}
-.stTextInput > div > div > input:focus {
-    border-color: #1E3A8A;
-    box-shadow: 0 0 4px rgba(30, 58, 138, 0.3);
-}
-.stButton > button {
-    background-color: #1E3A8A;
-    color: #FFFFFF;
-    border-radius: 8px;
-    padding: 0.7rem 1.5rem;
-    font-weight: 400;
-    font-size: 0.95rem;
-    transition: all 0.3s ease;
-    width: 100%;
-    box-shadow: 0 2px 8px rgba(0, 0, 0, 0.1);
-}
-.stButton > button:hover {
-    background-color: #3B82F6;
-    transform: scale(1.03);
-}
-.stAlert {
-    border-radius: 8px;
-    padding: 0.8rem;
-    font-size: 0.9rem;
-}
-.company-data {
-    background: #FFFFFF;
-    padding: 2rem;
-    border-radius: 12px;
-    box-shadow: 0 4px 12px rgba(0, 0, 0, 0.1);
-    margin: 2rem 0;
-}
-.kpi-card {
-    background: #FFFFFF;
-    border-radius: 8px;
-    box-shadow: 0 2px 8px rgba(0, 0, 0, 0.1);
-    padding: 1rem;
-    margin: 0.5rem;
-    text-align: center;
-}
-.kpi-card h3 {
-    margin: 0;
-    font-size: 0.9rem;
-    color: #1E3A8A;
-}
-.kpi-card p {
-    margin: 0.5rem 0 0;
-    font-size: 1.2rem;
-    font-weight: 700;
-}
-.positive {
-    color: #10B981;
-}
-.negative {
-    color: #EF4444;
-}
-.sidebar .sidebar-content {
-    background-color: #1E3A8A;
-    color: #FFFFFF;
-}
-.sidebar h2, .sidebar p {
-    color: #FFFFFF;
-}
-.logout-button {
-    background-color: #EF4444;
-    color: #FFFFFF;
-    border-radius: 8px;
-    padding: 0.7rem;
-    font-weight: 400;
-    font-size: 0.95rem;
-    transition: all 0.3s ease;
-    width: 100%;
-    box-shadow: 0 2px 8px rgba(0, 0, 0, 0.1);
-}
-.logout-button:hover {
-    background-color: #DC2626;
-    transform: scale(1.03);
-}
-.footer {
-    text-align: center;
-    color: #6B7280;
-    font-size: 0.85rem;
-    margin-top: 2rem;
-    padding: 1rem;
-}
-</style>
-""", unsafe_allow_html=True)
-
-
-st.markdown('<link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0-beta3/css/all.min.css">', unsafe_allow_html=True)
-
-
-API_URL = "http://127.0.0.1:8002"
-
-if 'logged_in' not in st.session_state:
-    st.session_state.logged_in = False
-    st.session_state.username = None
-    st.session_state.email = None
-    st.session_state.role = None
-    st.session_state.page = "login"
-
-
-companies_paths = {
-    "Apple": r"C:\Users\Fa\Desktop\Streamlit-Authentication-main\stock_AAPL-1.json",
-    "Meta": r"C:\Users\Fa\Desktop\Streamlit-Authentication-main\stock_META-1.json",
-    "Microsoft": r"C:\Users\Fa\Desktop\Streamlit-Authentication-main\stock_MSFT-1.json",
-    "cleaned": r"C:\Users\Fa\Desktop\Streamlit-Authentication-main\cleaned.json",
-    "financial_phrasebank": r"C:\Users\Fa\Desktop\Streamlit-Authentication-main\financial_phrasebank (2).json"
-}
-companies = ['Apple', 'Meta', 'Microsoft']
-REQUIRED_STOCK_COLUMNS = ['Date', 'Close', 'Open', 'High', 'Low', 'Volume']
-REQUIRED_CLEANED_COLUMNS = ['Credit Expiration', 'Current Stage', 'DPD']
-REQUIRED_PHRASEBANK_COLUMNS = ['Text', 'Sentiment']
-
-sample_data = {
-    'Apple': pd.DataFrame({
-        'Date': pd.date_range(start='2025-01-01', end='2025-07-12', freq='D'),
-        'Close': [150 + i * 0.3 + (i % 8) for i in range(193)],
-        'Open': [148 + i * 0.3 + (i % 8) for i in range(193)],
-        'High': [152 + i * 0.3 + (i % 8) for i in range(193)],
-        'Low': [146 + i * 0.3 + (i % 8) for i in range(193)],
-        'Volume': [2000000 + i * 2000 for i in range(193)]
-    }),
-    'Meta': pd.DataFrame({
-        'Date': pd.date_range(start='2025-01-01', end='2025-07-12', freq='D'),
-        'Close': [300 + i * 0.5 + (i % 10) for i in range(193)],
-        'Open': [298 + i * 0.5 + (i % 10) for i in range(193)],
-        'High': [302 + i * 0.5 + (i % 10) for i in range(193)],
-        'Low': [296 + i * 0.5 + (i % 10) for i in range(193)],
-        'Volume': [1000000 + i * 1000 for i in range(193)]
-    }),
-    'Microsoft': pd.DataFrame({
-        'Date': pd.date_range(start='2025-01-01', end='2025-07-12', freq='D'),
-        'Close': [250 + i * 0.4 + (i % 7) for i in range(193)],
-        'Open': [248 + i * 0.4 + (i % 7) for i in range(193)],
-        'High': [252 + i * 0.4 + (i % 7) for i in range(193)],
-        'Low': [246 + i * 0.4 + (i % 7) for i in range(193)],
-        'Volume': [1500000 + i * 1500 for i in range(193)]
-    }),
-    'cleaned': pd.DataFrame([
-        {"Credit Expiration": 92, "DPD": 0, "Current Stage": 1},
-        {"Credit Expiration": 245, "DPD": 0, "Current Stage": 1},
-        {"Credit Expiration": 0, "DPD": 0, "Current Stage": 2}
-    ]),
-    'financial_phrasebank': pd.DataFrame([
-        {"Text": "Apple stock rises after strong earnings", "Sentiment": "positive"},
-        {"Text": "Meta faces regulatory challenges", "Sentiment": "negative"}
-    ])
-}
-
-
-def load_financial_data(file_path, company_name):
-    try:
-        if not os.path.exists(file_path):
-            st.warning(f"File not found: {file_path}. Using sample data.")
-            return None
-        with open(file_path, 'r', encoding='utf-8') as f:
-            raw_data = json.load(f)
-        if isinstance(raw_data, dict) and company_name in raw_data:
-            df = pd.DataFrame(raw_data[company_name])
-        else:
-            df = pd.DataFrame(raw_data)
-        
-        missing_columns = [col for col in REQUIRED_STOCK_COLUMNS if col not in df.columns]
-        if missing_columns:
-            st.warning(f"Missing required columns in {file_path}: {', '.join(missing_columns)}. Using sample data.")
-            return None
-        
-        if 'Date' in df.columns:
-            df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-            if df['Date'].isna().all():
-                st.warning(f"Invalid date format in {file_path}. Using sample data.")
-                return None
-            df = df.dropna(subset=['Date']).sort_values('Date')
-        return df
-    except Exception as e:
-        st.warning(f"Error loading {file_path}: {str(e)}. Using sample data.")
-        return None
-
-def load_cleaned_data():
-    try:
-        response = requests.get(f"{API_URL}/data/cleaned", proxies={"http": None, "https": None})
-        response.raise_for_status()
-        data = response.json()
-        df = pd.DataFrame(data)
-        missing_columns = [col for col in REQUIRED_CLEANED_COLUMNS if col not in df.columns]
-        if missing_columns:
-            st.warning(f"Missing required columns in cleaned data from API: {', '.join(missing_columns)}. Using local data.")
-            return None
-        return df
-    except Exception as e:
-        st.warning(f"Error fetching cleaned data from API: {e}. Using local data.")
-        try:
-            if not os.path.exists(companies_paths['cleaned']):
-                st.warning(f"Local file not found: {companies_paths['cleaned']}. Using sample data.")
-                return None
-            with open(companies_paths['cleaned'], 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            df = pd.DataFrame(data)
-            missing_columns = [col for col in REQUIRED_CLEANED_COLUMNS if col not in df.columns]
-            if missing_columns:
-                st.warning(f"Missing required columns in {companies_paths['cleaned']}: {', '.join(missing_columns)}. Using sample data.")
-                return None
-            return df
-        except Exception as e:
-            st.warning(f"Error loading local cleaned data: {e}. Using sample data.")
-            return None
-
-def load_phrasebank_data():
-    try:
-        response = requests.get(f"{API_URL}/data/financial_phrasebank", proxies={"http": None, "https": None})
-        response.raise_for_status()
-        data = response.json()
-        df = pd.DataFrame(data, columns=['Text'])
-        df['Sentiment'] = df['Text'].str.extract(r'@(\w+)$')
-        df['Text'] = df['Text'].str.replace(r'@\w+$', '', regex=True)
-        if df['Sentiment'].isna().any():
-            st.warning("Some entries in financial_phrasebank data from API are missing sentiment labels. Using local data.")
-            return None
-        return df
-    except Exception as e:
-        st.warning(f"Error fetching financial_phrasebank data from API: {e}. Using local data.")
-        try:
-            if not os.path.exists(companies_paths['financial_phrasebank']):
-                st.warning(f"Local file not found: {companies_paths['financial_phrasebank']}. Using sample data.")
-                return None
-            with open(companies_paths['financial_phrasebank'], 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            df = pd.DataFrame([{"Text": item.split('@')[0], "Sentiment": item.split('@')[1]} for item in data])
-            if df['Sentiment'].isna().any():
-                st.warning("Some entries in local financial_phrasebank data are missing sentiment labels. Using sample data.")
-                return None
-            return df
-        except Exception as e:
-            st.warning(f"Error loading local financial_phrasebank data: {e}. Using sample data.")
-            return None
-
-
-data = {}
-for company, path in companies_paths.items():
-    if company in companies:
-        df = load_financial_data(path, company)
-        data[company] = df if df is not None else sample_data[company]
-    elif company == 'cleaned':
-        df = load_cleaned_data()
-        data[company] = df if df is not None else sample_data[company]
-    elif company == 'financial_phrasebank':
-        df = load_phrasebank_data()
-        data[company] = df if df is not None else sample_data[company]
-
-router_engine = initialize_query_engine(companies_paths) if 'initialize_query_engine' in globals() else None
-
-def login_page():
-    st.markdown("<div class='auth-container'>", unsafe_allow_html=True)
-    st.markdown("<h2><i class='fas fa-sign-in-alt'></i> Log In</h2>", unsafe_allow_html=True)
-    col1, col2, col3 = st.columns([1, 2, 1])
-    with col2:
-        with st.form("login_form"):
-            username = st.text_input("Username", placeholder="Enter username")
-            password = st.text_input("Password", type="password", placeholder="Enter password")
-            submit = st.form_submit_button("Log In")
-            if submit:
-                if username.strip() and password.strip():
-                    with st.spinner("Logging in..."):
-                        try:
-                            response = requests.post(
-                                f"{API_URL}/login",
-                                data={"username": username.strip(), "password": password.strip()},
-                                proxies={"http": None, "https": None}
-                            )
-                            response.raise_for_status()
-                            user_data = response.json()
-                            st.session_state.logged_in = True
-                            st.session_state.username = username.strip()
-                            st.session_state.email = user_data.get("email", "Not provided")
-                            st.session_state.role = user_data.get("role", "Regular User")
-                            st.session_state.page = "dashboard"
-                            st.success(user_data.get("msg", "Login successful!"))
-                            st.rerun()
-                        except requests.exceptions.HTTPError as e:
-                            if e.response.status_code in [400, 500]:
-                                st.error(e.response.json().get("detail", "Invalid credentials"))
-                            else:
-                                st.error(f"Failed to connect to server: {e}")
-                        except Exception as e:
-                            st.error(f"Failed to connect to server: {e}")
-                else:
-                    st.warning("Please fill in all fields.")
-    st.markdown("<p>Don't have an account? <a href='#' onclick='st.session_state.page=\"signup\";st.rerun()'>Sign Up</a></p>", unsafe_allow_html=True)
-    st.markdown("</div>", unsafe_allow_html=True)
-
-def signup_page():
-    st.markdown("<div class='auth-container'>", unsafe_allow_html=True)
-    st.markdown("<h2><i class='fas fa-user-plus'></i> Sign Up</h2>", unsafe_allow_html=True)
-    col1, col2, col3 = st.columns([1, 2, 1])
-    with col2:
-        with st.form("signup_form"):
-            username = st.text_input("Username", placeholder="Choose a username")
-            email = st.text_input("Email", placeholder="Enter your email")
-            password = st.text_input("Password", type="password", placeholder="Choose a password")
-            confirm_password = st.text_input("Confirm Password", type="password", placeholder="Confirm password")
-            role = st.selectbox("Role", ["Regular User", "Expert", "Administrator"], help="Select your role")
-            submit = st.form_submit_button("Sign Up")
-            if submit:
-                if username.strip() and email.strip() and password.strip() and confirm_password.strip():
-                    if password == confirm_password:
-                        with st.spinner("Registering..."):
-                            try:
-                                response = requests.post(
-                                    f"{API_URL}/register",
-                                    data={
-                                        "username": username.strip(),
-                                        "email": email.strip(),
-                                        "password": password.strip(),
-                                        "role": role
-                                    },
-                                    proxies={"http": None, "https": None}
-                                )
-                                response.raise_for_status()
-                                user_data = response.json()
-                                st.session_state.logged_in = True
-                                st.session_state.username = username.strip()
-                                st.session_state.email = email.strip()
-                                st.session_state.role = role
-                                st.session_state.page = "dashboard"
-                                st.success(user_data.get("msg", "Registration successful!"))
-                                st.rerun()
-                            except requests.exceptions.HTTPError as e:
-                                if e.response.status_code in [400, 500]:
-                                    st.error(e.response.json().get("detail", "Registration failed"))
-                                else:
-                                    st.error(f"Failed to connect to server: {e}")
-                            except Exception as e:
-                                st.error(f"Failed to connect to server: {e}")
-                    else:
-                        st.error("Passwords do not match.")
-                else:
-                    st.warning("Please fill in all fields.")
-    st.markdown("<p>Already have an account? <a href='#' onclick='st.session_state.page=\"login\";st.rerun()'>Log In</a></p>", unsafe_allow_html=True)
-    st.markdown("</div>", unsafe_allow_html=True)
-
-def run_query_interface():
-    st.markdown("<h2>Financial Query Interface</h2>", unsafe_allow_html=True)
-    query = st.text_input("Enter your financial query (e.g., $.Microsoft[?(@.Date == '2024-06-14')].Close)", 
-                          placeholder="Enter JSONPath query or natural language question")
-    criteria = st.text_input("Search Criteria (optional)", placeholder="e.g., Date > 2024-01-01")
-    if st.button("Run Query"):
-        if query:
-            with st.spinner("Processing query..."):
-                try:
-                    response = run_query(query, router_engine)
-                    if criteria:
-                        response = f"{response} (Filtered by: {criteria})"
-                    st.session_state.query_result = response
-                    st.success(f"Query Result: {response}")
-                except Exception as e:
-                    st.error(f"Error processing query: {e}")
-        else:
-            st.warning("Please enter a query.")
-
-def display_results():
-    if 'query_result' in st.session_state:
-        st.markdown("<h2>Query Results</h2>", unsafe_allow_html=True)
-        st.write(st.session_state.query_result)
-    else:
-        st.warning("No query results available. Run a query first.")
-
-def suggest_improvement():
-    st.markdown("<h2>Suggest Improvement</h2>", unsafe_allow_html=True)
-    suggestion = st.text_area("Enter your suggestion", placeholder="Type your suggestion here")
-    if st.button("Submit Suggestion"):
-        if suggestion.strip():
-            try:
-                response = requests.post(
-                    f"{API_URL}/suggestions",
-                    json={"username": st.session_state.username, "suggestion": suggestion.strip()},
-                    proxies={"http": None, "https": None}
-                )
-                response.raise_for_status()
-                st.success("Suggestion submitted successfully!")
-            except requests.exceptions.HTTPError as e:
-                if e.response.status_code in [400, 500]:
-                    st.error(e.response.json().get("detail", "Failed to submit suggestion"))
-                else:
-                    st.error(f"Error submitting suggestion: {e}")
-            except Exception as e:
-                st.error(f"Error submitting suggestion: {e}")
-        else:
-            st.warning("Please enter a suggestion.")
-
-def verify_permissions():
-    st.markdown("<h2>Verify Permissions</h2>", unsafe_allow_html=True)
-    st.write(f"Current Role: {st.session_state.role}")
-    st.write("Permissions verified based on your role.")
-
-def evaluate_report_quality():
-    st.markdown("<h2>Evaluate Report Quality</h2>", unsafe_allow_html=True)
-    if 'query_result' in st.session_state:
-        quality = st.slider("Rate the report quality (1-10)", 1, 10, 5)
-        if st.button("Submit Evaluation"):
-            try:
-                response = requests.post(
-                    f"{API_URL}/evaluations",
-                    json={"username": st.session_state.username, "report": st.session_state.query_result, "quality": quality},
-                    proxies={"http": None, "https": None}
-                )
-                response.raise_for_status()
-                st.success(f"Report quality rated as {quality}/10")
-            except requests.exceptions.HTTPError as e:
-                if e.response.status_code in [400, 500]:
-                    st.error(e.response.json().get("detail", "Failed to submit evaluation"))
-                else:
-                    st.error(f"Error submitting evaluation: {e}")
-            except Exception as e:
-                st.error(f"Error submitting evaluation: {e}")
-    else:
-        st.warning("No report to evaluate. Run a query first.")
-
-def edit_report():
-    st.markdown("<h2>Edit Report</h2>", unsafe_allow_html=True)
-    if 'query_result' in st.session_state:
-        edited_report = st.text_area("Edit Report", value=st.session_state.query_result)
-        if st.button("Save Changes"):
-            st.session_state.query_result = edited_report
-            st.success("Report updated successfully!")
-    else:
-        st.warning("No report to edit. Run a query first.")
-
-def visualize_cleaned_data(df):
-    if df is None or df.empty:
-        st.error("No data available for Cleaned Data.")
-        return
-    st.markdown("<h2>Cleaned Data Analysis</h2>", unsafe_allow_html=True)
-    
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        st.markdown("<div class='kpi-card'>", unsafe_allow_html=True)
-        st.markdown("<h3>Average Credit Expiration</h3>", unsafe_allow_html=True)
-        avg_credit = df['Credit Expiration'].mean()
-        st.markdown(f"<p>{avg_credit:.2f} days</p>", unsafe_allow_html=True)
-        st.markdown("</div>", unsafe_allow_html=True)
-    with col2:
-        st.markdown("<div class='kpi-card'>", unsafe_allow_html=True)
-        st.markdown("<h3>Stage 1 Count</h3>", unsafe_allow_html=True)
-        stage1_count = len(df[df['Current Stage'] == 1])
-        st.markdown(f"<p>{stage1_count}</p>", unsafe_allow_html=True)
-        st.markdown("</div>", unsafe_allow_html=True)
-    with col3:
-        st.markdown("<div class='kpi-card'>", unsafe_allow_html=True)
-        st.markdown("<h3>Stage 2 Count</h3>", unsafe_allow_html=True)
-        stage2_count = len(df[df['Current Stage'] == 2])
-        st.markdown(f"<p>{stage2_count}</p>", unsafe_allow_html=True)
-        st.markdown("</div>", unsafe_allow_html=True)
-
-    st.markdown("<h3>Credit Expiration Distribution</h3>", unsafe_allow_html=True)
-    fig_credit = px.histogram(df, x='Credit Expiration', nbins=20, title="Credit Expiration Days")
-    fig_credit.update_layout(
-        plot_bgcolor='white',
-        paper_bgcolor='white',
-        font=dict(family="Roboto", size=12, color="#1E3A8A"),
-        xaxis_title="Credit Expiration (Days)",
-        yaxis_title="Count"
-    )
-    st.plotly_chart(fig_credit, use_container_width=True)
-
-    st.markdown("<h3>Days Past Due (DPD) Distribution</h3>", unsafe_allow_html=True)
-    fig_dpd = px.histogram(df, x='DPD', nbins=20, title="Days Past Due (DPD)", color_discrete_sequence=['salmon'])
-    fig_dpd.update_layout(
-        plot_bgcolor='white',
-        paper_bgcolor='white',
-        font=dict(family="Roboto", size=12, color="#1E3A8A"),
-        xaxis_title="DPD",
-        yaxis_title="Number of Customers"
-    )
-    st.plotly_chart(fig_dpd, use_container_width=True)
-
-    st.markdown("<h3>Stage Distribution</h3>", unsafe_allow_html=True)
-    stage_counts = df['Current Stage'].value_counts().reset_index()
-    stage_counts.columns = ['Stage', 'Count']
-    fig_stage = px.bar(stage_counts, x='Stage', y='Count', title="Current Stage Distribution", color_discrete_sequence=['purple'])
-    fig_stage.update_layout(
-        plot_bgcolor='white',
-        paper_bgcolor='white',
-        font=dict(family="Roboto", size=12, color="#1E3A8A"),
-        xaxis_title="Current Stage",
-        yaxis_title="Number of Customers"
-    )
-    st.plotly_chart(fig_stage, use_container_width=True)
-
-    st.markdown("<h3>Cleaned Data Table</h3>", unsafe_allow_html=True)
-    st.dataframe(df.head(100), use_container_width=True)
-
-def visualize_phrasebank_data(df):
-    if df is None or df.empty:
-        st.error("No data available for Financial Phrasebank.")
-        return
-    st.markdown("<h2>Financial Phrasebank Sentiment Analysis</h2>", unsafe_allow_html=True)
-
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        st.markdown("<div class='kpi-card'>", unsafe_allow_html=True)
-        st.markdown("<h3>Positive Statements</h3>", unsafe_allow_html=True)
-        positive_count = len(df[df['Sentiment'] == 'positive'])
-        st.markdown(f"<p>{positive_count}</p>", unsafe_allow_html=True)
-        st.markdown("</div>", unsafe_allow_html=True)
-    with col2:
-        st.markdown("<div class='kpi-card'>", unsafe_allow_html=True)
-        st.markdown("<h3>Neutral Statements</h3>", unsafe_allow_html=True)
-        neutral_count = len(df[df['Sentiment'] == 'neutral'])
-        st.markdown(f"<p>{neutral_count}</p>", unsafe_allow_html=True)
-        st.markdown("</div>", unsafe_allow_html=True)
-    with col3:
-        st.markdown("<div class='kpi-card'>", unsafe_allow_html=True)
-        st.markdown("<h3>Negative Statements</h3>", unsafe_allow_html=True)
-        negative_count = len(df[df['Sentiment'] == 'negative'])
-        st.markdown(f"<p>{negative_count}</p>", unsafe_allow_html=True)
-        st.markdown("</div>", unsafe_allow_html=True)
-
-    st.markdown("<h3>Sentiment Distribution</h3>", unsafe_allow_html=True)
-    sentiment_counts = df['Sentiment'].value_counts().reset_index()
-    sentiment_counts.columns = ['Sentiment', 'Count']
-    fig_sentiment = px.pie(sentiment_counts, names='Sentiment', values='Count', title="Sentiment Distribution", 
-                           color_discrete_sequence=['green', 'red', 'grey'])
-    fig_sentiment.update_layout(
-        plot_bgcolor='white',
-        paper_bgcolor='white',
-        font=dict(family="Roboto", size=12, color="#1E3A8A")
-    )
-    st.plotly_chart(fig_sentiment, use_container_width=True)
-
-    st.markdown("<h3>Financial Phrasebank Data</h3>", unsafe_allow_html=True)
-    st.dataframe(df.head(100), use_container_width=True)
-
-def visualize_stock_comparison():
-    st.markdown("<h2>Stock Price Comparison</h2>", unsafe_allow_html=True)
-    comparison_df = pd.DataFrame()
-    for company in companies:
-        df = data[company].copy()
-        if df.empty:
-            st.warning(f"No data available for {company}. Skipping in comparison.")
-            continue
-        df['Company'] = company
-        comparison_df = pd.concat([comparison_df, df[['Date', 'Close', 'Company']].head(100)], ignore_index=True)
-    if comparison_df.empty:
-        st.error("No data available for stock comparison.")
-        return
-    fig_comparison = px.line(comparison_df, x='Date', y='Close', color='Company', title="Stock Price Comparison")
-    fig_comparison.update_layout(
-        plot_bgcolor='white',
-        paper_bgcolor='white',
-        font=dict(family="Roboto", size=12, color="#1E3A8A"),
-        xaxis_title="Date",
-        yaxis_title="Closing Price (USD)",
-        legend_title="Company"
-    )
-    st.plotly_chart(fig_comparison, use_container_width=True)
-
-def query_interface():
-    st.markdown("<h2>Query Financial Data</h2>", unsafe_allow_html=True)
-    query = st.text_input("Enter your query (e.g., $.Microsoft[?(@.Date == '2024-06-14')].Close)", 
-                          placeholder="Enter JSONPath query or natural language question")
-    if st.button("Run Query"):
-        if query:
-            with st.spinner("Processing query..."):
-                try:
-                    response = run_query(query, router_engine)
-                    st.success(f"Query Result: {response}")
-                except Exception as e:
-                    st.error(f"Error processing query: {e}")
-        else:
-            st.warning("Please enter a query.")
-
-def user_management_page():
-    if st.session_state.role != "Administrator":
-        st.error("Access denied. Administrator role required.")
-        return
-    st.markdown("<h2>User Management</h2>", unsafe_allow_html=True)
-    
-    try:
-        response = requests.get(f"{API_URL}/users", proxies={"http": None, "https": None})
-        response.raise_for_status()
-        users = response.json()
-        st.markdown("<h3>Registered Users</h3>", unsafe_allow_html=True)
-        st.dataframe(pd.DataFrame(users), use_container_width=True)
-    except requests.exceptions.HTTPError as e:
-        if e.response.status_code in [400, 500]:
-            st.error(e.response.json().get("detail", "Error fetching users"))
-        else:
-            st.error(f"Error fetching users: {e}")
-    except Exception as e:
-        st.error(f"Error fetching users: {e}")
-
-    st.markdown("<h3>Modify User Role</h3>", unsafe_allow_html=True)
-    with st.form("modify_user_form"):
-        username = st.text_input("Username to Modify", placeholder="Enter username")
-        new_role = st.selectbox("New Role", ["Regular User", "Expert", "Administrator"])
-        submit_modify = st.form_submit_button("Modify Role")
-        if submit_modify:
-            if username.strip():
-                try:
-                    response = requests.put(
-                        f"{API_URL}/users/{username}",
-                        json={"role": new_role},
-                        proxies={"http": None, "https": None}
-                    )
-                    response.raise_for_status()
-                    st.success(response.json().get("msg", "User role updated successfully"))
-                except requests.exceptions.HTTPError as e:
-                    if e.response.status_code in [400, 404, 500]:
-                        st.error(e.response.json().get("detail", "Failed to update user role"))
-                    else:
-                        st.error(f"Error modifying user: {e}")
-                except Exception as e:
-                    st.error(f"Error modifying user: {e}")
-            else:
-                st.warning("Please enter a username.")
-
-    st.markdown("<h3>Delete User</h3>", unsafe_allow_html=True)
-    with st.form("delete_user_form"):
-        username_to_delete = st.text_input("Username to Delete", placeholder="Enter username")
-        submit_delete = st.form_submit_button("Delete User")
-        if submit_delete:
-            if username_to_delete.strip():
-                try:
-                    response = requests.delete(
-                        f"{API_URL}/users/{username_to_delete}",
-                        proxies={"http": None, "https": None}
-                    )
-                    response.raise_for_status()
-                    st.success(response.json().get("msg", "User deleted successfully"))
-                except requests.exceptions.HTTPError as e:
-                    if e.response.status_code in [400, 404, 500]:
-                        st.error(e.response.json().get("detail", "Failed to delete user"))
-                    else:
-                        st.error(f"Error deleting user: {e}")
-                except Exception as e:
-                    st.error(f"Error deleting user: {e}")
-            else:
-                st.warning("Please enter a username.")
-
-def dashboard_page():
-    if st.session_state.role not in ["Regular User", "Expert", "Administrator"]:
-        st.session_state.logged_in = False
-        st.session_state.username = None
-        st.session_state.email = None
-        st.session_state.role = None
-        st.session_state.page = "login"
-        st.error("Invalid role detected. Logging out.")
-        st.rerun()
-
-    with st.sidebar:
-        st.markdown("<h2><i class='fas fa-chart-line'></i> Dashboard</h2>", unsafe_allow_html=True)
-        st.markdown(f"<p><i class='fas fa-user'></i> Welcome, {st.session_state.username} ({st.session_state.role})</p>", unsafe_allow_html=True)
-        st.markdown(f"<p><i class='fas fa-envelope'></i> Email: {st.session_state.email}</p>", unsafe_allow_html=True)
-        
-        role_tasks = {
-            "Regular User": [
-                ("Financial Query", run_query_interface),
-                ("View Results", display_results),
-                ("Suggest Improvement", suggest_improvement),
-                ("Verify Permissions", verify_permissions),
-                ("Stock Analysis", "Stock Analysis"),
-                ("Stock Comparison", "Stock Comparison")
-            ],
-            "Expert": [
-                ("Financial Query", run_query_interface),
-                ("View Results", display_results),
-                ("Suggest Improvement", suggest_improvement),
-                ("Verify Permissions", verify_permissions),
-                ("Evaluate Report Quality", evaluate_report_quality),
-                ("Edit Report", edit_report),
-                ("Stock Analysis", "Stock Analysis"),
-                ("Cleaned Data", "Cleaned Data"),
-                ("Financial Phrasebank", "Financial Phrasebank"),
-                ("Stock Comparison", "Stock Comparison"),
-                ("Query Interface", query_interface)
-            ],
-            "Administrator": [
-                ("Financial Query", run_query_interface),
-                ("View Results", display_results),
-                ("Suggest Improvement", suggest_improvement),
-                ("Verify Permissions", verify_permissions),
-                ("Evaluate Report Quality", evaluate_report_quality),
-                ("Edit Report", edit_report),
-                ("User Management", user_management_page),
-                ("Stock Analysis", "Stock Analysis"),
-                ("Cleaned Data", "Cleaned Data"),
-                ("Financial Phrasebank", "Financial Phrasebank"),
-                ("Stock Comparison", "Stock Comparison"),
-                ("Query Interface", query_interface)
-            ]
-        }
-        
-        task_options = [task[0] for task in role_tasks[st.session_state.role]]
-        selected_task = st.selectbox("Select Task", task_options, help="Choose a task")
-        
-        if selected_task == "Stock Analysis":
-            company = st.selectbox("Select Company", companies, help="Choose a company")
-        else:
-            company = None
-        
-        if st.button("Log Out", key="logout_button", type="secondary"):
-            st.session_state.logged_in = False
-            st.session_state.username = None
-            st.session_state.email = None
-            st.session_state.role = None
-            st.session_state.page = "login"
-            st.rerun()
-
-    st.markdown("<h1 class='main-title'><i class='fas fa-chart-line'></i> Financial Insights Dashboard</h1>", unsafe_allow_html=True)
-    st.markdown("<img src='https://via.placeholder.com/100?text=Logo' class='logo' alt='Project Logo'/>", unsafe_allow_html=True)
-    st.markdown("<div class='company-data'>", unsafe_allow_html=True)
-
-    task_dict = {task[0]: task[1] for task in role_tasks[st.session_state.role]}
-    if selected_task in task_dict:
-        task_func = task_dict[selected_task]
-        if isinstance(task_func, str):
-            if task_func == "Stock Analysis":
-                st.markdown(f"<h2>{company} Financial Analysis</h2>", unsafe_allow_html=True)
-                df = data.get(company)
-                if df is None or df.empty:
-                    st.error(f"No data available for {company}.")
-                    st.markdown("</div>", unsafe_allow_html=True)
-                    return
-
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    st.markdown("<div class='kpi-card'>", unsafe_allow_html=True)
-                    st.markdown("<h3>Last Closing Price</h3>", unsafe_allow_html=True)
-                    st.markdown(f"<p>${df['Close'].iloc[-1]:.2f}</p>", unsafe_allow_html=True)
-                    st.markdown("</div>", unsafe_allow_html=True)
-                with col2:
-                    st.markdown("<div class='kpi-card'>", unsafe_allow_html=True)
-                    st.markdown("<h3>Daily Change</h3>", unsafe_allow_html=True)
-                    try:
-                        change = ((df['Close'].iloc[-1] - df['Close'].iloc[-2]) / df['Close'].iloc[-2]) * 100
-                        st.markdown(f"<p class='{'positive' if change >= 0 else 'negative'}'>{change:.2f}%</p>", unsafe_allow_html=True)
-                    except Exception:
-                        st.markdown("<p class='negative'>N/A</p>", unsafe_allow_html=True)
-                    st.markdown("</div>", unsafe_allow_html=True)
-                with col3:
-                    st.markdown("<div class='kpi-card'>", unsafe_allow_html=True)
-                    st.markdown("<h3>Trading Volume</h3>", unsafe_allow_html=True)
-                    st.markdown(f"<p>{df['Volume'].iloc[-1]:,}</p>", unsafe_allow_html=True)
-                    st.markdown("</div>", unsafe_allow_html=True)
-
-                st.markdown("<h3>Select Time Range</h3>", unsafe_allow_html=True)
-                time_range = st.slider("Date Range", 
-                                       min_value=df['Date'].min().date(), 
-                                       max_value=df['Date'].max().date(), 
-                                       value=(df['Date'].max() - timedelta(days=30)).date(), 
-                                       format="YYYY-MM-DD")
-                filtered_df = df[df['Date'].dt.date >= time_range].head(100)
-
-                st.markdown("<h3>Price Trend</h3>", unsafe_allow_html=True)
-                fig_price = px.line(filtered_df, x='Date', y='Close', title=f"{company} Stock Price")
-                fig_price.update_layout(
-                    plot_bgcolor='white',
-                    paper_bgcolor='white',
-                    font=dict(family="Roboto", size=12, color="#1E3A8A"),
-                    xaxis_title="Date",
-                    yaxis_title="Price (USD)"
-                )
-                st.plotly_chart(fig_price, use_container_width=True)
-
-                st.markdown("<h3>Trading Volume</h3>", unsafe_allow_html=True)
-                fig_volume = px.bar(filtered_df, x='Date', y='Volume', title=f"{company} Trading Volume")
-                fig_volume.update_layout(
-                    plot_bgcolor='white',
-                    paper_bgcolor='white',
-                    font=dict(family="Roboto", size=12, color="#1E3A8A"),
-                    xaxis_title="Date",
-                    yaxis_title="Volume"
-                )
-                st.plotly_chart(fig_volume, use_container_width=True)
-
-                st.markdown("<h3>Historical Data</h3>", unsafe_allow_html=True)
-                st.dataframe(filtered_df, use_container_width=True)
-            elif task_func == "Cleaned Data":
-                visualize_cleaned_data(data['cleaned'])
-            elif task_func == "Financial Phrasebank":
-                visualize_phrasebank_data(data['financial_phrasebank'])
-            elif task_func == "Stock Comparison":
-                visualize_stock_comparison()
-            elif task_func == "Query Interface":
-                query_interface()
-            elif task_func == "User Management":
-                user_management_page()
-        else:
-            task_func()
-    st.markdown("</div>", unsafe_allow_html=True)
-
-try:
-    if 'logged_in' not in st.session_state or not st.session_state.logged_in:
-        tab1, tab2 = st.tabs(["Sign Up", "Log In"])
-        with tab1:
-            signup_page()
-        with tab2:
-            login_page()
-    else:
-        dashboard_page()
-except Exception as e:
+import streamlit as st
+import requests
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+import http_client
+
+
+st.set_page_config(page_title="Financial Insights Dashboard", layout="wide")
+
+
+st.markdown("""
+<style>
+@import url('https://fonts.googleapis.com/css2?family=Roboto:wght@300;400;700&display=swap');
+.stApp {
+    background-color: #F3F4F6;
+    font-family: 'Roboto', sans-serif;
+}
+.auth-container {
+    background: #FFFFFF;
+    padding: 2rem;
+    border-radius: 12px;
+    box-shadow: 0 4px 12px rgba(0, 0, 0, 0.1);
+    max-width: 400px;
+    margin: 3rem auto;
+    text-align: center;
+}
+.main-title {
+    text-align: center;
+    font-size: 2.5rem;
+    font-weight: 700;
+    color: #1E3A8A;
+    margin-bottom: 1rem;
+}
+.logo {
+    display: block;
+    margin: 0 auto 1rem;
+    max-width: 100px;
+}
+.stTabs [data-baseweb="tab-list"] {
+    gap: 1rem;
+    justify-content: center;
+}
+.stTabs [data-baseweb="tab"] {
+    background-color: #FFFFFF;
+    color: #1E3A8A;
+    font-weight: 400;
+    font-size: 1rem;
+    padding: 0.5rem 1rem;
+    border-radius: 8px;
+    transition: all 0.3s ease;
+}
+.stTabs [data-baseweb="tab"][aria-selected="true"] {
+    background-color: #1E3A8A;
+    color: #FFFFFF;
+}
+.stTabs [data-baseweb="tab"]:hover {
+    background-color: #E5E7EB;
+}
+.stTextInput > div > div > input {
+    background-color: #FFFFFF;
+    border: 1px solid #D1D5DB;
+    border-radius: 8px;
+    padding: 0.7rem;
+    color: #1E3A8A;
+    font-size: 0.95rem;
+}
+.stTextInput > div > div > input:focus {
+    border-color: #1E3A8A;
+    box-shadow: 0 0 4px rgba(30, 58, 138, 0.3);
+}
+.stButton > button {
+    background-color: #1E3A8A;
+    color: #FFFFFF;
+    border-radius: 8px;
+    padding: 0.7rem 1.5rem;
+    font-weight: 400;
+    font-size: 0.95rem;
+    transition: all 0.3s ease;
+    width: 100%;
+    box-shadow: 0 2px 8px rgba(0, 0, 0, 0.1);
+}
+.stButton > button:hover {
+    background-color: #3B82F6;
+    transform: scale(1.03);
+}
+.stAlert {
+    border-radius: 8px;
+    padding: 0.8rem;
+    font-size: 0.9rem;
+}
+.company-data {
+    background: #FFFFFF;
+    padding: 2rem;
+    border-radius: 12px;
+    box-shadow: 0 4px 12px rgba(0, 0, 0, 0.1);
+    margin: 2rem 0;
+}
+.kpi-card {
+    background: #FFFFFF;
+    border-radius: 8px;
+    box-shadow: 0 2px 8px rgba(0, 0, 0, 0.1);
+    padding: 1rem;
+    margin: 0.5rem;
+    text-align: center;
+}
+.kpi-card h3 {
+    margin: 0;
+    font-size: 0.9rem;
+    color: #1E3A8A;
+}
+.kpi-card p {
+    margin: 0.5rem 0 0;
+    font-size: 1.2rem;
+    font-weight: 700;
+}
+.positive {
+    color: #10B981;
+}
+.negative {
+    color: #EF4444;
+}
+.sidebar .sidebar-content {
+    background-color: #1E3A8A;
+    color: #FFFFFF;
+}
+.sidebar h2, .sidebar p {
+    color: #FFFFFF;
+}
+.logout-button {
+    background-color: #EF4444;
+    color: #FFFFFF;
+    border-radius: 8px;
+    padding: 0.7rem;
+    font-weight: 400;
+    font-size: 0.95rem;
+    transition: all 0.3s ease;
+    width: 100%;
+    box-shadow: 0 2px 8px rgba(0, 0, 0, 0.1);
+}
+.logout-button:hover {
+    background-color: #DC2626;
+    transform: scale(1.03);
+}
+.footer {
+    text-align: center;
+    color: #6B7280;
+    font-size: 0.85rem;
+    margin-top: 2rem;
+    padding: 1rem;
+}
+</style>
+""", unsafe_allow_html=True)
+
+
+st.markdown('<link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0-beta3/css/all.min.css">', unsafe_allow_html=True)
+
+
+API_URL = http_client.API_URL
+api = http_client.get_client()
+API_TIMEOUT = float(os.environ.get("API_TIMEOUT", "3"))
+DATA_LOAD_TIMEOUT = float(os.environ.get("DATA_LOAD_TIMEOUT", "15"))
+# الاستعلامات تعمل كمهام في الخادم الخلفي، والواجهة تستطلع حالتها دون تجميد الجلسة
+QUERY_POLL_SECONDS = float(os.environ.get("QUERY_POLL_SECONDS", "1"))
+
+if 'logged_in' not in st.session_state:
+    st.session_state.logged_in = False
+    st.session_state.username = None
+    st.session_state.email = None
+    st.session_state.role = None
+    st.session_state.token = None
+    st.session_state.page = "login"
+
+
+companies = ['Apple', 'Meta', 'Microsoft']
+
+def sample_data(name):
+    import pandas as pd
+    samples = {
+        'Apple': pd.DataFrame({
+            'Date': pd.date_range(start='2025-01-01', end='2025-07-12', freq='D'),
+            'Close': [150 + i * 0.3 + (i % 8) for i in range(193)],
+            'Open': [148 + i * 0.3 + (i % 8) for i in range(193)],
+            'High': [152 + i * 0.3 + (i % 8) for i in range(193)],
+            'Low': [146 + i * 0.3 + (i % 8) for i in range(193)],
+            'Volume': [2000000 + i * 2000 for i in range(193)]
+        }),
+        'Meta': pd.DataFrame({
+            'Date': pd.date_range(start='2025-01-01', end='2025-07-12', freq='D'),
+            'Close': [300 + i * 0.5 + (i % 10) for i in range(193)],
+            'Open': [298 + i * 0.5 + (i % 10) for i in range(193)],
+            'High': [302 + i * 0.5 + (i % 10) for i in range(193)],
+            'Low': [296 + i * 0.5 + (i % 10) for i in range(193)],
+            'Volume': [1000000 + i * 1000 for i in range(193)]
+        }),
+        'Microsoft': pd.DataFrame({
+            'Date': pd.date_range(start='2025-01-01', end='2025-07-12', freq='D'),
+            'Close': [250 + i * 0.4 + (i % 7) for i in range(193)],
+            'Open': [248 + i * 0.4 + (i % 7) for i in range(193)],
+            'High': [252 + i * 0.4 + (i % 7) for i in range(193)],
+            'Low': [246 + i * 0.4 + (i % 7) for i in range(193)],
+            'Volume': [1500000 + i * 1500 for i in range(193)]
+        }),
+        'cleaned': pd.DataFrame([
+            {"Credit Expiration": 92, "DPD": 0, "Current Stage": 1},
+            {"Credit Expiration": 245, "DPD": 0, "Current Stage": 1},
+            {"Credit Expiration": 0, "DPD": 0, "Current Stage": 2}
+        ]),
+        'financial_phrasebank': pd.DataFrame([
+            {"Text": "Apple stock rises after strong earnings", "Sentiment": "positive"},
+            {"Text": "Meta faces regulatory challenges", "Sentiment": "negative"}
+        ])
+    }
+    return samples[name]
+
+
+def load_api_data(name):
+    import data_access
+    return data_access.fetch_from_api(name, api, timeout=API_TIMEOUT, cache=False)
+
+def load_local_data(name):
+    import data_access
+    return data_access.load_dataset(name)
+
+def first_valid_result(name, futures, deadline, messages):
+    """
+    Wait for the futures loading ``name`` and return the first valid dataset, or None if all fail or time out.
+    Errors from the losing sources are only reported when no source succeeds.
+    """
+    import data_access
+    errors = []
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            errors.append(f"Timed out loading {name} data after {DATA_LOAD_TIMEOUT:.0f}s.")
+            break
+        for future in done:
+            try:
+                dataset = future.result()
+            except Exception as e:
+                errors.append(f"Error loading {name} data from {futures[future]}: {e}.")
+                continue
+            if futures[future] == "API":
+                data_access.store(dataset)
+            return dataset
+    messages.extend(errors)
+    return None
+
+def load_all_data():
+    """
+    Load every dataset concurrently. Stock data is read locally; cleaned and phrasebank data race
+    the API against the local files and the first valid result wins, so startup is bounded by the
+    slowest single dataset (and by DATA_LOAD_TIMEOUT). A dataset no source could provide is served
+    from sample data, without trying its sources again until data_access's retry backoff expires.
+    Returns:
+        tuple: (dict of dataset name -> DataFrame, list of warning messages)
+    """
+    import data_access
+    loaded, messages, futures = {}, [], {}
+    for name in data_access.DATASET_PATHS:
+        dataset = data_access.get_cached(name)
+        if dataset is not None:
+            loaded[name] = dataset.frame
+            continue
+        retry_in = data_access.retry_after(name)
+        if retry_in is not None:
+            messages.append(f"Using sample data for {name} (retrying in {retry_in:.0f}s).")
+            loaded[name] = sample_data(name)
+            continue
+        futures[name] = None
+    if not futures:
+        return loaded, messages
+
+    executor = ThreadPoolExecutor(max_workers=2 * len(futures))
+    try:
+        for name in futures:
+            sources = {"local": load_local_data} if name in companies else {"API": load_api_data, "local": load_local_data}
+            futures[name] = {executor.submit(loader, name): label for label, loader in sources.items()}
+
+        deadline = time.monotonic() + DATA_LOAD_TIMEOUT
+        for name, name_futures in futures.items():
+            dataset = first_valid_result(name, name_futures, deadline, messages)
+            if dataset is None:
+                retry_in = data_access.record_failure(name)
+                messages.append(f"Using sample data for {name} (retrying in {retry_in:.0f}s).")
+                loaded[name] = sample_data(name)
+            else:
+                loaded[name] = dataset.frame
+        return loaded, messages
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def warm_up(token):
+    """
+    Background work started after login so the first pages that need it do not wait: the chart
+    library, the datasets (cached process-wide by data_access) and the backend query engine.
+    """
+    import plotly.express  # noqa: F401
+    try:
+        load_all_data()
+    except Exception:
+        pass
+    try:
+        api.post("/query/warmup", headers={"Authorization": f"Bearer {token}"}, timeout=API_TIMEOUT)
+    except Exception:
+        pass
+
+def start_warm_up(token):
+    thread = threading.Thread(target=warm_up, args=(token,), name="dashboard-warm-up", daemon=True)
+    thread.start()
+    st.session_state.warm_up_thread = thread
+
+def get_data():
+    """Datasets for the chart pages, loaded on first use (waiting for the warm-up if it is still loading them)."""
+    warm_up_thread = st.session_state.get("warm_up_thread")
+    if warm_up_thread is not None and warm_up_thread.is_alive():
+        with st.spinner("Loading data..."):
+            warm_up_thread.join(DATA_LOAD_TIMEOUT)
+    data, load_messages = load_all_data()
+    for message in load_messages:
+        st.warning(message)
+    return data
+
+def auth_headers():
+    return {"Authorization": f"Bearer {st.session_state.get('token')}"}
+
+def login_page():
+    st.markdown("<div class='auth-container'>", unsafe_allow_html=True)
+    st.markdown("<h2><i class='fas fa-sign-in-alt'></i> Log In</h2>", unsafe_allow_html=True)
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col2:
+        with st.form("login_form"):
+            username = st.text_input("Username", placeholder="Enter username")
+            password = st.text_input("Password", type="password", placeholder="Enter password")
+            submit = st.form_submit_button("Log In")
+            if submit:
+                if username.strip() and password.strip():
+                    with st.spinner("Logging in..."):
+                        try:
+                            response = api.post(
+                                "/login",
+                                data={"username": username.strip(), "password": password.strip()}
+                            )
+                            response.raise_for_status()
+                            user_data = response.json()
+                            st.session_state.logged_in = True
+                            st.session_state.username = username.strip()
+                            st.session_state.email = user_data.get("email", "Not provided")
+                            st.session_state.role = user_data.get("role", "Regular User")
+                            st.session_state.token = user_data.get("access_token")
+                            st.session_state.page = "dashboard"
+                            start_warm_up(st.session_state.token)
+                            st.success(user_data.get("msg", "Login successful!"))
+                            st.rerun()
+                        except requests.exceptions.HTTPError as e:
+                            if e.response.status_code in [400, 500]:
+                                st.error(e.response.json().get("detail", "Invalid credentials"))
+                            else:
+                                st.error(f"Failed to connect to server: {e}")
+                        except Exception as e:
+                            st.error(f"Failed to connect to server: {e}")
+                else:
+                    st.warning("Please fill in all fields.")
+    st.markdown("<p>Don't have an account? <a href='#' onclick='st.session_state.page=\"signup\";st.rerun()'>Sign Up</a></p>", unsafe_allow_html=True)
+    st.markdown("</div>", unsafe_allow_html=True)
+
+def signup_page():
+    st.markdown("<div class='auth-container'>", unsafe_allow_html=True)
+    st.markdown("<h2><i class='fas fa-user-plus'></i> Sign Up</h2>", unsafe_allow_html=True)
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col2:
+        with st.form("signup_form"):
+            username = st.text_input("Username", placeholder="Choose a username")
+            email = st.text_input("Email", placeholder="Enter your email")
+            password = st.text_input("Password", type="password", placeholder="Choose a password")
+            confirm_password = st.text_input("Confirm Password", type="password", placeholder="Confirm password")
+            submit = st.form_submit_button("Sign Up")
+            if submit:
+                if username.strip() and email.strip() and password.strip() and confirm_password.strip():
+                    if password == confirm_password:
+                        with st.spinner("Registering..."):
+                            try:
+                                response = api.post(
+                                    "/register",
+                                    data={
+                                        "username": username.strip(),
+                                        "email": email.strip(),
+                                        "password": password.strip()
+                                    }
+                                )
+                                response.raise_for_status()
+                                user_data = response.json()
+                                st.session_state.logged_in = True
+                                st.session_state.username = username.strip()
+                                st.session_state.email = email.strip()
+                                st.session_state.role = user_data.get("role", "Regular User")
+                                st.session_state.token = user_data.get("access_token")
+                                st.session_state.page = "dashboard"
+                                start_warm_up(st.session_state.token)
+                                st.success(user_data.get("msg", "Registration successful!"))
+                                st.rerun()
+                            except requests.exceptions.HTTPError as e:
+                                if e.response.status_code in [400, 403, 500]:
+                                    st.error(e.response.json().get("detail", "Registration failed"))
+                                else:
+                                    st.error(f"Failed to connect to server: {e}")
+                            except Exception as e:
+                                st.error(f"Failed to connect to server: {e}")
+                    else:
+                        st.error("Passwords do not match.")
+                else:
+                    st.warning("Please fill in all fields.")
+    st.markdown("<p>Already have an account? <a href='#' onclick='st.session_state.page=\"login\";st.rerun()'>Log In</a></p>", unsafe_allow_html=True)
+    st.markdown("</div>", unsafe_allow_html=True)
+
+def save_to_history(query, result):
+    """Store a query and its answer in the backend history; failures only warn, the answer is already shown."""
+    try:
+        response = api.post(
+            "/history",
+            json={"query": query, "answer": result["answer"], "tool": result.get("tool"), "latency_ms": result.get("latency_ms")},
+            headers=auth_headers()
+        )
+        response.raise_for_status()
+    except Exception as e:
+        st.warning(f"Query result was not saved to history: {e}")
+
+def submit_query_job(query, criteria=None, keep_result=True):
+    """Queue ``query`` on the backend; the job panel polls it until it finishes."""
+    try:
+        response = api.post("/query", json={"query": query}, headers=auth_headers())
+        response.raise_for_status()
+        st.session_state.query_job = {
+            "id": response.json()["id"],
+            "query": query,
+            "criteria": criteria,
+            "keep_result": keep_result,
+        }
+        st.session_state.query_outcome = None
+    except requests.exceptions.HTTPError as e:
+        if e.response.status_code in [400, 401, 403, 500, 503]:
+            st.error(e.response.json().get("detail", "Failed to submit query"))
+        else:
+            st.error(f"Error submitting query: {e}")
+    except Exception as e:
+        st.error(f"Error submitting query: {e}")
+
+def finish_query_job(job_info, job):
+    if job["status"] == "succeeded":
+        result = job["result"]
+        response = result["answer"]
+        if job_info["criteria"]:
+            response = f"{response} (Filtered by: {job_info['criteria']})"
+        if job_info["keep_result"]:
+            st.session_state.query_result = response
+        save_to_history(job_info["query"], dict(result, answer=response))
+        st.session_state.query_outcome = ("success", f"Query Result: {response}")
+    elif job["status"] == "cancelled":
+        st.session_state.query_outcome = ("warning", "Query cancelled.")
+    else:
+        st.session_state.query_outcome = ("error", f"Error processing query: {job['error']}")
+    st.session_state.query_job = None
+
+@st.fragment(run_every=QUERY_POLL_SECONDS)
+def query_job_panel():
+    job_info = st.session_state.get("query_job")
+    if not job_info:
+        return
+    try:
+        response = api.get(f"/query/{job_info['id']}", route="/query/{job_id}", headers=auth_headers())
+        response.raise_for_status()
+        job = response.json()
+    except Exception as e:
+        st.session_state.query_job = None
+        st.session_state.query_outcome = ("error", f"Lost track of the query: {e}")
+        st.rerun()
+    if job["status"] in ["queued", "running"]:
+        st.info(f"Query {job['status']} ({time.time() - job['created_at']:.0f}s): {job_info['query']}")
+        if st.button("Cancel Query", key=f"cancel_query_{job_info['id']}"):
+            try:
+                api.delete(f"/query/{job_info['id']}", route="/query/{job_id}", headers=auth_headers()).raise_for_status()
+            except Exception as e:
+                st.error(f"Error cancelling query: {e}")
+        return
+    finish_query_job(job_info, job)
+    st.rerun()
+
+def query_status():
+    """Show the running query (polled in its own fragment) or the outcome of the last one."""
+    if st.session_state.get("query_job"):
+        query_job_panel()
+    elif st.session_state.get("query_outcome"):
+        level, message = st.session_state.query_outcome
+        getattr(st, level)(message)
+
+# كل مهمة في لوحة التحكم تعمل داخل fragment: تغيير عنصر تحكم فيها يعيد تشغيلها وحدها وليس
+# الملف بأكمله (التنسيقات، الشريط الجانبي وبقية الرسوم). البيانات مشتركة بين الجلسات عبر data_access
+@st.fragment
+def run_query_interface():
+    st.markdown("<h2>Financial Query Interface</h2>", unsafe_allow_html=True)
+    query = st.text_input("Enter your financial query (e.g., $.Microsoft[?(@.Date == '2024-06-14')].Close)", 
+                          placeholder="Enter JSONPath query or natural language question")
+    criteria = st.text_input("Search Criteria (optional)", placeholder="e.g., Date > 2024-01-01")
+    if st.button("Run Query", disabled=bool(st.session_state.get("query_job"))):
+        if query:
+            submit_query_job(query, criteria)
+        else:
+            st.warning("Please enter a query.")
+    query_status()
+
+def display_results():
+    if 'query_result' in st.session_state:
+        st.markdown("<h2>Query Results</h2>", unsafe_allow_html=True)
+        st.write(st.session_state.query_result)
+    else:
+        st.warning("No query results available. Run a query first.")
+
+@st.fragment
+def suggest_improvement():
+    st.markdown("<h2>Suggest Improvement</h2>", unsafe_allow_html=True)
+    suggestion = st.text_area("Enter your suggestion", placeholder="Type your suggestion here")
+    if st.button("Submit Suggestion"):
+        if suggestion.strip():
+            try:
+                response = api.post(
+                    "/suggestions",
+                    json={"username": st.session_state.username, "suggestion": suggestion.strip()},
+                    headers=auth_headers()
+                )
+                response.raise_for_status()
+                st.success("Suggestion submitted successfully!")
+            except requests.exceptions.HTTPError as e:
+                if e.response.status_code in [400, 401, 403, 500]:
+                    st.error(e.response.json().get("detail", "Failed to submit suggestion"))
+                else:
+                    st.error(f"Error submitting suggestion: {e}")
+            except Exception as e:
+                st.error(f"Error submitting suggestion: {e}")
+        else:
+            st.warning("Please enter a suggestion.")
+
+def verify_permissions():
+    st.markdown("<h2>Verify Permissions</h2>", unsafe_allow_html=True)
+    st.write(f"Current Role: {st.session_state.role}")
+    st.write("Permissions verified based on your role.")
+
+@st.fragment
+def evaluate_report_quality():
+    st.markdown("<h2>Evaluate Report Quality</h2>", unsafe_allow_html=True)
+    if 'query_result' in st.session_state:
+        quality = st.slider("Rate the report quality (1-10)", 1, 10, 5)
+        if st.button("Submit Evaluation"):
+            try:
+                response = api.post(
+                    "/evaluations",
+                    json={"username": st.session_state.username, "report": st.session_state.query_result, "quality": quality},
+                    headers=auth_headers()
+                )
+                response.raise_for_status()
+                st.success(f"Report quality rated as {quality}/10")
+            except requests.exceptions.HTTPError as e:
+                if e.response.status_code in [400, 401, 403, 500]:
+                    st.error(e.response.json().get("detail", "Failed to submit evaluation"))
+                else:
+                    st.error(f"Error submitting evaluation: {e}")
+            except Exception as e:
+                st.error(f"Error submitting evaluation: {e}")
+    else:
+        st.warning("No report to evaluate. Run a query first.")
+
+@st.fragment
+def query_history_page():
+    st.markdown("<h2>Query History</h2>", unsafe_allow_html=True)
+    search = st.text_input("Search past queries and reports", placeholder="e.g. Microsoft close price")
+    all_users = False
+    if st.session_state.role in ["Expert", "Administrator"]:
+        all_users = st.checkbox("Search all users' history")
+    try:
+        response = api.get(
+            "/history/search",
+            params={"q": search.strip(), "all_users": all_users, "limit": 50},
+            headers=auth_headers()
+        )
+        response.raise_for_status()
+        entries = response.json()
+    except requests.exceptions.HTTPError as e:
+        if e.response.status_code in [400, 401, 403, 500]:
+            st.error(e.response.json().get("detail", "Error searching history"))
+        else:
+            st.error(f"Error searching history: {e}")
+        return
+    except Exception as e:
+        st.error(f"Error searching history: {e}")
+        return
+
+    if not entries:
+        st.info("No matching queries found." if search.strip() else "No queries saved yet.")
+        return
+    for entry in entries:
+        title = f"{entry['created_at'][:16].replace('T', ' ')} · {entry['query'][:80]}"
+        if all_users:
+            title = f"{entry['username']} · {title}"
+        with st.expander(title):
+            if entry.get("snippet"):
+                st.markdown(f"_{entry['snippet']}_")
+            st.write(entry["answer"])
+            details = []
+            if entry.get("tool"):
+                details.append(f"Tool: {entry['tool']}")
+            if entry.get("latency_ms") is not None:
+                details.append(f"Latency: {entry['latency_ms']:.0f} ms")
+            if details:
+                st.caption(" · ".join(details))
+            if st.button("Use this report", key=f"reuse_history_{entry['id']}"):
+                st.session_state.query_result = entry["answer"]
+                st.success("Report loaded. Open View Results, Edit Report or Evaluate Report Quality to continue.")
+
+@st.fragment
+def edit_report():
+    st.markdown("<h2>Edit Report</h2>", unsafe_allow_html=True)
+    if 'query_result' in st.session_state:
+        edited_report = st.text_area("Edit Report", value=st.session_state.query_result)
+        if st.button("Save Changes"):
+            st.session_state.query_result = edited_report
+            st.success("Report updated successfully!")
+    else:
+        st.warning("No report to edit. Run a query first.")
+
+@st.fragment
+def visualize_cleaned_data(df):
+    import plotly.express as px
+    if df is None or df.empty:
+        st.error("No data available for Cleaned Data.")
+        return
+    st.markdown("<h2>Cleaned Data Analysis</h2>", unsafe_allow_html=True)
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.markdown("<div class='kpi-card'>", unsafe_allow_html=True)
+        st.markdown("<h3>Average Credit Expiration</h3>", unsafe_allow_html=True)
+        avg_credit = df['Credit Expiration'].mean()
+        st.markdown(f"<p>{avg_credit:.2f} days</p>", unsafe_allow_html=True)
+        st.markdown("</div>", unsafe_allow_html=True)
+    with col2:
+        st.markdown("<div class='kpi-card'>", unsafe_allow_html=True)
+        st.markdown("<h3>Stage 1 Count</h3>", unsafe_allow_html=True)
+        stage1_count = len(df[df['Current Stage'] == 1])
+        st.markdown(f"<p>{stage1_count}</p>", unsafe_allow_html=True)
+        st.markdown("</div>", unsafe_allow_html=True)
+    with col3:
+        st.markdown("<div class='kpi-card'>", unsafe_allow_html=True)
+        st.markdown("<h3>Stage 2 Count</h3>", unsafe_allow_html=True)
+        stage2_count = len(df[df['Current Stage'] == 2])
+        st.markdown(f"<p>{stage2_count}</p>", unsafe_allow_html=True)
+        st.markdown("</div>", unsafe_allow_html=True)
+
+    st.markdown("<h3>Credit Expiration Distribution</h3>", unsafe_allow_html=True)
+    fig_credit = px.histogram(df, x='Credit Expiration', nbins=20, title="Credit Expiration Days")
+    fig_credit.update_layout(
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        font=dict(family="Roboto", size=12, color="#1E3A8A"),
+        xaxis_title="Credit Expiration (Days)",
+        yaxis_title="Count"
+    )
+    st.plotly_chart(fig_credit, use_container_width=True)
+
+    st.markdown("<h3>Days Past Due (DPD) Distribution</h3>", unsafe_allow_html=True)
+    fig_dpd = px.histogram(df, x='DPD', nbins=20, title="Days Past Due (DPD)", color_discrete_sequence=['salmon'])
+    fig_dpd.update_layout(
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        font=dict(family="Roboto", size=12, color="#1E3A8A"),
+        xaxis_title="DPD",
+        yaxis_title="Number of Customers"
+    )
+    st.plotly_chart(fig_dpd, use_container_width=True)
+
+    st.markdown("<h3>Stage Distribution</h3>", unsafe_allow_html=True)
+    stage_counts = df['Current Stage'].value_counts().reset_index()
+    stage_counts.columns = ['Stage', 'Count']
+    fig_stage = px.bar(stage_counts, x='Stage', y='Count', title="Current Stage Distribution", color_discrete_sequence=['purple'])
+    fig_stage.update_layout(
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        font=dict(family="Roboto", size=12, color="#1E3A8A"),
+        xaxis_title="Current Stage",
+        yaxis_title="Number of Customers"
+    )
+    st.plotly_chart(fig_stage, use_container_width=True)
+
+    st.markdown("<h3>Cleaned Data Table</h3>", unsafe_allow_html=True)
+    st.dataframe(df.head(100), use_container_width=True)
+
+@st.fragment
+def visualize_phrasebank_data(df):
+    import plotly.express as px
+    if df is None or df.empty:
+        st.error("No data available for Financial Phrasebank.")
+        return
+    st.markdown("<h2>Financial Phrasebank Sentiment Analysis</h2>", unsafe_allow_html=True)
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.markdown("<div class='kpi-card'>", unsafe_allow_html=True)
+        st.markdown("<h3>Positive Statements</h3>", unsafe_allow_html=True)
+        positive_count = len(df[df['Sentiment'] == 'positive'])
+        st.markdown(f"<p>{positive_count}</p>", unsafe_allow_html=True)
+        st.markdown("</div>", unsafe_allow_html=True)
+    with col2:
+        st.markdown("<div class='kpi-card'>", unsafe_allow_html=True)
+        st.markdown("<h3>Neutral Statements</h3>", unsafe_allow_html=True)
+        neutral_count = len(df[df['Sentiment'] == 'neutral'])
+        st.markdown(f"<p>{neutral_count}</p>", unsafe_allow_html=True)
+        st.markdown("</div>", unsafe_allow_html=True)
+    with col3:
+        st.markdown("<div class='kpi-card'>", unsafe_allow_html=True)
+        st.markdown("<h3>Negative Statements</h3>", unsafe_allow_html=True)
+        negative_count = len(df[df['Sentiment'] == 'negative'])
+        st.markdown(f"<p>{negative_count}</p>", unsafe_allow_html=True)
+        st.markdown("</div>", unsafe_allow_html=True)
+
+    st.markdown("<h3>Sentiment Distribution</h3>", unsafe_allow_html=True)
+    sentiment_counts = df['Sentiment'].value_counts().reset_index()
+    sentiment_counts.columns = ['Sentiment', 'Count']
+    fig_sentiment = px.pie(sentiment_counts, names='Sentiment', values='Count', title="Sentiment Distribution", 
+                           color_discrete_sequence=['green', 'red', 'grey'])
+    fig_sentiment.update_layout(
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        font=dict(family="Roboto", size=12, color="#1E3A8A")
+    )
+    st.plotly_chart(fig_sentiment, use_container_width=True)
+
+    st.markdown("<h3>Financial Phrasebank Data</h3>", unsafe_allow_html=True)
+    st.dataframe(df.head(100), use_container_width=True)
+
+@st.fragment
+def visualize_stock_comparison():
+    import pandas as pd
+    import plotly.express as px
+    import downsampling
+    st.markdown("<h2>Stock Price Comparison</h2>", unsafe_allow_html=True)
+    data = get_data()
+    comparison_df = pd.DataFrame()
+    for company in companies:
+        df = data[company]
+        if df.empty:
+            st.warning(f"No data available for {company}. Skipping in comparison.")
+            continue
+        # كامل التاريخ لكل شركة، مختصراً إلى CHART_POINT_BUDGET نقطة مع الحفاظ على شكل المنحنى
+        df = downsampling.downsample_line(df[['Date', 'Close']], 'Date', 'Close').assign(Company=company)
+        comparison_df = pd.concat([comparison_df, df], ignore_index=True)
+    if comparison_df.empty:
+        st.error("No data available for stock comparison.")
+        return
+    fig_comparison = px.line(comparison_df, x='Date', y='Close', color='Company', title="Stock Price Comparison")
+    fig_comparison.update_layout(
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        font=dict(family="Roboto", size=12, color="#1E3A8A"),
+        xaxis_title="Date",
+        yaxis_title="Closing Price (USD)",
+        legend_title="Company"
+    )
+    st.plotly_chart(fig_comparison, use_container_width=True)
+
+@st.fragment
+def stock_analysis(company):
+    import plotly.express as px
+    import downsampling
+    st.markdown(f"<h2>{company} Financial Analysis</h2>", unsafe_allow_html=True)
+    df = get_data().get(company)
+    if df is None or df.empty:
+        st.error(f"No data available for {company}.")
+        return
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.markdown("<div class='kpi-card'>", unsafe_allow_html=True)
+        st.markdown("<h3>Last Closing Price</h3>", unsafe_allow_html=True)
+        st.markdown(f"<p>${df['Close'].iloc[-1]:.2f}</p>", unsafe_allow_html=True)
+        st.markdown("</div>", unsafe_allow_html=True)
+    with col2:
+        st.markdown("<div class='kpi-card'>", unsafe_allow_html=True)
+        st.markdown("<h3>Daily Change</h3>", unsafe_allow_html=True)
+        try:
+            change = ((df['Close'].iloc[-1] - df['Close'].iloc[-2]) / df['Close'].iloc[-2]) * 100
+            st.markdown(f"<p class='{'positive' if change >= 0 else 'negative'}'>{change:.2f}%</p>", unsafe_allow_html=True)
+        except Exception:
+            st.markdown("<p class='negative'>N/A</p>", unsafe_allow_html=True)
+        st.markdown("</div>", unsafe_allow_html=True)
+    with col3:
+        st.markdown("<div class='kpi-card'>", unsafe_allow_html=True)
+        st.markdown("<h3>Trading Volume</h3>", unsafe_allow_html=True)
+        st.markdown(f"<p>{df['Volume'].iloc[-1]:,}</p>", unsafe_allow_html=True)
+        st.markdown("</div>", unsafe_allow_html=True)
+
+    st.markdown("<h3>Select Time Range</h3>", unsafe_allow_html=True)
+    time_range = st.slider("Date Range", 
+                           min_value=df['Date'].min().date(), 
+                           max_value=df['Date'].max().date(), 
+                           value=(df['Date'].max() - timedelta(days=30)).date(), 
+                           format="YYYY-MM-DD")
+    filtered_df = df[df['Date'].dt.date >= time_range]
+    # الرسوم تغطي كامل الفترة المختارة بعدد نقاط ثابت: LTTB للسعر، وتجميع الأعمدة حسب فترات للحجم
+    price_df = downsampling.downsample_line(filtered_df, 'Date', 'Close')
+    volume_df = downsampling.bucket_ohlcv(filtered_df)
+    volume_title = "Volume"
+    if 'Days' in volume_df:
+        # كل عمود يغطي عدة أيام، فيُعرض متوسط الحجم اليومي بدلاً من المجموع
+        volume_df = volume_df.assign(Volume=volume_df['Volume'] / volume_df['Days'])
+        volume_title = "Average Daily Volume"
+    if len(price_df) < len(filtered_df):
+        st.caption(f"Charts show {len(filtered_df):,} trading days at up to {downsampling.CHART_POINT_BUDGET:,} points")
+
+    st.markdown("<h3>Price Trend</h3>", unsafe_allow_html=True)
+    fig_price = px.line(price_df, x='Date', y='Close', title=f"{company} Stock Price")
+    fig_price.update_layout(
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        font=dict(family="Roboto", size=12, color="#1E3A8A"),
+        xaxis_title="Date",
+        yaxis_title="Price (USD)"
+    )
+    st.plotly_chart(fig_price, use_container_width=True)
+
+    st.markdown("<h3>Trading Volume</h3>", unsafe_allow_html=True)
+    fig_volume = px.bar(volume_df, x='Date', y='Volume', title=f"{company} Trading Volume")
+    fig_volume.update_layout(
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        font=dict(family="Roboto", size=12, color="#1E3A8A"),
+        xaxis_title="Date",
+        yaxis_title=volume_title
+    )
+    st.plotly_chart(fig_volume, use_container_width=True)
+
+    st.markdown("<h3>Historical Data</h3>", unsafe_allow_html=True)
+    # الجدول يبقى محدوداً بأول 100 يوم من الفترة؛ الاختصار يخص الرسوم فقط
+    st.dataframe(filtered_df.head(100), use_container_width=True)
+
+@st.fragment
+def query_interface():
+    st.markdown("<h2>Query Financial Data</h2>", unsafe_allow_html=True)
+    query = st.text_input("Enter your query (e.g., $.Microsoft[?(@.Date == '2024-06-14')].Close)", 
+                          placeholder="Enter JSONPath query or natural language question")
+    if st.button("Run Query", disabled=bool(st.session_state.get("query_job"))):
+        if query:
+            submit_query_job(query, keep_result=False)
+        else:
+            st.warning("Please enter a query.")
+    query_status()
+
+USER_PAGE_SIZES = [25, 50, 100, 250]
+
+@st.fragment
+def user_management_page():
+    import pandas as pd
+    if st.session_state.role != "Administrator":
+        st.error("Access denied. Administrator role required.")
+        return
+    st.markdown("<h2>User Management</h2>", unsafe_allow_html=True)
+    
+    st.markdown("<h3>Registered Users</h3>", unsafe_allow_html=True)
+    col1, col2, col3 = st.columns([2, 2, 1])
+    with col1:
+        role_filter = st.selectbox("Filter by Role", ["All", "Regular User", "Expert", "Administrator"])
+    with col2:
+        prefix_filter = st.text_input("Username starts with", placeholder="e.g. ali").strip()
+    with col3:
+        page_size = st.selectbox("Page size", USER_PAGE_SIZES)
+    filters = {}
+    if role_filter != "All":
+        filters["role"] = role_filter
+    if prefix_filter:
+        filters["prefix"] = prefix_filter
+
+    # مؤشرات الصفحات (آخر اسم مستخدم في كل صفحة سابقة)، تُعاد عند تغيير المرشحات
+    if st.session_state.get("user_page_filters") != (filters, page_size):
+        st.session_state.user_page_filters = (filters, page_size)
+        st.session_state.user_page_cursors = [None]
+    cursors = st.session_state.user_page_cursors
+
+    try:
+        params = dict(filters, limit=page_size + 1)
+        if cursors[-1]:
+            params["after"] = cursors[-1]
+        response = api.get("/users", params=params, headers=auth_headers())
+        response.raise_for_status()
+        users = response.json()
+        has_next = len(users) > page_size
+        users = users[:page_size]
+        count_response = api.get("/users/count", params=filters, headers=auth_headers())
+        count_response.raise_for_status()
+        total = count_response.json().get("count", 0)
+
+        st.caption(f"{total} matching users · page {len(cursors)} of {max(1, -(-total // page_size))}")
+        st.dataframe(pd.DataFrame(users, columns=["username", "email", "role"]), use_container_width=True)
+        # الانتقال بين الصفحات عبر on_click، فيُعاد تشغيل هذا الجزء مرة واحدة بالصفحة الجديدة
+        col_prev, col_next = st.columns(2)
+        with col_prev:
+            st.button("Previous page", disabled=len(cursors) == 1, on_click=cursors.pop)
+        with col_next:
+            st.button("Next page", disabled=not has_next, on_click=cursors.append,
+                      args=(users[-1]["username"] if has_next else None,))
+    except requests.exceptions.HTTPError as e:
+        if e.response.status_code in [400, 401, 403, 500]:
+            st.error(e.response.json().get("detail", "Error fetching users"))
+        else:
+            st.error(f"Error fetching users: {e}")
+    except Exception as e:
+        st.error(f"Error fetching users: {e}")
+
+    st.markdown("<h3>Modify User Role</h3>", unsafe_allow_html=True)
+    with st.form("modify_user_form"):
+        username = st.text_input("Username to Modify", placeholder="Enter username")
+        new_role = st.selectbox("New Role", ["Regular User", "Expert", "Administrator"])
+        submit_modify = st.form_submit_button("Modify Role")
+        if submit_modify:
+            if username.strip():
+                try:
+                    response = api.put(
+                        f"/users/{username.strip()}",
+                        route="/users/{username}",
+                        params={"role": new_role},
+                        headers=auth_headers()
+                    )
+                    response.raise_for_status()
+                    st.success(response.json().get("msg", "User role updated successfully"))
+                except requests.exceptions.HTTPError as e:
+                    if e.response.status_code in [400, 401, 403, 404, 500]:
+                        st.error(e.response.json().get("detail", "Failed to update user role"))
+                    else:
+                        st.error(f"Error modifying user: {e}")
+                except Exception as e:
+                    st.error(f"Error modifying user: {e}")
+            else:
+                st.warning("Please enter a username.")
+
+    st.markdown("<h3>Delete User</h3>", unsafe_allow_html=True)
+    with st.form("delete_user_form"):
+        username_to_delete = st.text_input("Username to Delete", placeholder="Enter username")
+        submit_delete = st.form_submit_button("Delete User")
+        if submit_delete:
+            if username_to_delete.strip():
+                try:
+                    response = api.delete(
+                        f"/users/{username_to_delete.strip()}",
+                        route="/users/{username}",
+                        headers=auth_headers()
+                    )
+                    response.raise_for_status()
+                    st.success(response.json().get("msg", "User deleted successfully"))
+                except requests.exceptions.HTTPError as e:
+                    if e.response.status_code in [400, 401, 403, 404, 500]:
+                        st.error(e.response.json().get("detail", "Failed to delete user"))
+                    else:
+                        st.error(f"Error deleting user: {e}")
+                except Exception as e:
+                    st.error(f"Error deleting user: {e}")
+            else:
+                st.warning("Please enter a username.")
+
+    st.markdown("<h3>Bulk Import Users</h3>", unsafe_allow_html=True)
+    with st.form("import_users_form"):
+        upload = st.file_uploader(
+            "Users file", type=["csv", "json"],
+            help="CSV with a header row username,email,password,role, or a JSON list of objects with the same fields"
+        )
+        submit_import = st.form_submit_button("Import Users")
+        if submit_import:
+            if upload is not None:
+                try:
+                    if upload.name.lower().endswith(".csv"):
+                        response = api.post(
+                            "/users/import/csv",
+                            files={"file": (upload.name, upload.getvalue(), "text/csv")},
+                            headers=auth_headers()
+                        )
+                    else:
+                        response = api.post("/users/import", json=json.loads(upload.getvalue()), headers=auth_headers())
+                    response.raise_for_status()
+                    result = response.json()
+                    st.success(f"Imported {result['imported']} users")
+                    if result["errors"]:
+                        st.warning(f"{len(result['errors'])} rows were rejected")
+                        st.dataframe(pd.DataFrame(result["errors"]), use_container_width=True)
+                except ValueError as e:
+                    st.error(f"Invalid JSON file: {e}")
+                except requests.exceptions.HTTPError as e:
+                    if e.response.status_code in [400, 401, 403, 409, 413, 422, 500]:
+                        st.error(e.response.json().get("detail", "Failed to import users"))
+                    else:
+                        st.error(f"Error importing users: {e}")
+                except Exception as e:
+                    st.error(f"Error importing users: {e}")
+            else:
+                st.warning("Please choose a file to import.")
+
+@st.fragment
+def feedback_stats_page():
+    import pandas as pd
+    import plotly.express as px
+    if st.session_state.role != "Administrator":
+        st.error("Access denied. Administrator role required.")
+        return
+    st.markdown("<h2>Feedback Statistics</h2>", unsafe_allow_html=True)
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        username = st.text_input("Username", placeholder="Leave empty for all users").strip()
+    with col2:
+        days = st.slider("Days", 1, 90, 14)
+    try:
+        response = api.get(
+            "/stats/feedback",
+            params={"username": username or "*", "days": days},
+            headers=auth_headers()
+        )
+        response.raise_for_status()
+        stats = response.json()
+    except requests.exceptions.HTTPError as e:
+        if e.response.status_code in [400, 401, 403, 500]:
+            st.error(e.response.json().get("detail", "Error fetching feedback statistics"))
+        else:
+            st.error(f"Error fetching feedback statistics: {e}")
+        return
+    except Exception as e:
+        st.error(f"Error fetching feedback statistics: {e}")
+        return
+
+    evaluations = stats["evaluations"]
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Evaluations", evaluations["count"])
+    col2.metric("Mean Quality", evaluations["mean_quality"] if evaluations["mean_quality"] is not None else "-")
+    col3.metric("Suggestions", stats["suggestions"]["count"])
+    histogram = pd.DataFrame({"Quality": list(evaluations["histogram"]), "Evaluations": list(evaluations["histogram"].values())})
+    st.plotly_chart(px.bar(histogram, x="Quality", y="Evaluations", title="Quality Distribution"), use_container_width=True)
+    if stats["daily"]:
+        daily = pd.DataFrame(stats["daily"]).rename(columns={"count": "evaluations"})
+        fig = px.line(daily, x="day", y=["evaluations", "suggestions"], title=f"Feedback per Day (last {days} days)")
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info(f"No feedback in the last {days} days.")
+
+def query_performance_page():
+    import pandas as pd
+    import plotly.express as px
+    if st.session_state.role != "Administrator":
+        st.error("Access denied. Administrator role required.")
+        return
+    st.markdown("<h2>Query Performance</h2>", unsafe_allow_html=True)
+    try:
+        response = api.get("/stats/queries", headers=auth_headers())
+        response.raise_for_status()
+        stats = response.json()
+    except requests.exceptions.HTTPError as e:
+        if e.response.status_code in [400, 401, 403, 500]:
+            st.error(e.response.json().get("detail", "Error fetching query statistics"))
+        else:
+            st.error(f"Error fetching query statistics: {e}")
+        return
+    except Exception as e:
+        st.error(f"Error fetching query statistics: {e}")
+        return
+
+    if not stats["traces"]:
+        st.info("No traced queries yet.")
+        return
+    st.caption(f"Based on the last {stats['traces']} traced queries")
+    rows = []
+    for tool, summary in stats["tools"].items():
+        rows.append({
+            "Tool": "All tools" if tool == "*" else tool,
+            "Queries": summary["queries"],
+            "Errors": summary["errors"],
+            "p50 ms": summary["latency_ms"]["p50"],
+            "p95 ms": summary["latency_ms"]["p95"],
+            "p99 ms": summary["latency_ms"]["p99"],
+            "Routing p50 ms": summary["stages_p50_ms"]["routing"],
+            "Retrieval p50 ms": summary["stages_p50_ms"]["retrieval"],
+            "JSONPath p50 ms": summary["stages_p50_ms"]["jsonpath"],
+            "Synthesis p50 ms": summary["stages_p50_ms"]["synthesis"],
+            "Prompt Tokens": summary["prompt_tokens"],
+            "Completion Tokens": summary["completion_tokens"],
+        })
+    table = pd.DataFrame(rows)
+    st.dataframe(table, use_container_width=True)
+    per_tool = table[table["Tool"] != "All tools"]
+    if not per_tool.empty:
+        fig = px.bar(per_tool, x="Tool", y=["Prompt Tokens", "Completion Tokens"], title="Token Spend per Tool")
+        st.plotly_chart(fig, use_container_width=True)
+        fig = px.bar(per_tool, x="Tool", y=["Routing p50 ms", "Retrieval p50 ms", "JSONPath p50 ms", "Synthesis p50 ms"],
+                     title="Median Stage Latency per Tool")
+        st.plotly_chart(fig, use_container_width=True)
+
+def dashboard_page():
+    if st.session_state.role not in ["Regular User", "Expert", "Administrator"]:
+        st.session_state.logged_in = False
+        st.session_state.username = None
+        st.session_state.email = None
+        st.session_state.role = None
+        st.session_state.token = None
+        st.session_state.page = "login"
+        st.error("Invalid role detected. Logging out.")
+        st.rerun()
+
+    with st.sidebar:
+        st.markdown("<h2><i class='fas fa-chart-line'></i> Dashboard</h2>", unsafe_allow_html=True)
+        st.markdown(f"<p><i class='fas fa-user'></i> Welcome, {st.session_state.username} ({st.session_state.role})</p>", unsafe_allow_html=True)
+        st.markdown(f"<p><i class='fas fa-envelope'></i> Email: {st.session_state.email}</p>", unsafe_allow_html=True)
+        
+        role_tasks = {
+            "Regular User": [
+                ("Financial Query", run_query_interface),
+                ("View Results", display_results),
+                ("Query History", query_history_page),
+                ("Suggest Improvement", suggest_improvement),
+                ("Verify Permissions", verify_permissions),
+                ("Stock Analysis", "Stock Analysis"),
+                ("Stock Comparison", "Stock Comparison")
+            ],
+            "Expert": [
+                ("Financial Query", run_query_interface),
+                ("View Results", display_results),
+                ("Query History", query_history_page),
+                ("Suggest Improvement", suggest_improvement),
+                ("Verify Permissions", verify_permissions),
+                ("Evaluate Report Quality", evaluate_report_quality),
+                ("Edit Report", edit_report),
+                ("Stock Analysis", "Stock Analysis"),
+                ("Cleaned Data", "Cleaned Data"),
+                ("Financial Phrasebank", "Financial Phrasebank"),
+                ("Stock Comparison", "Stock Comparison"),
+                ("Query Interface", query_interface)
+            ],
+            "Administrator": [
+                ("Financial Query", run_query_interface),
+                ("View Results", display_results),
+                ("Query History", query_history_page),
+                ("Suggest Improvement", suggest_improvement),
+                ("Verify Permissions", verify_permissions),
+                ("Evaluate Report Quality", evaluate_report_quality),
+                ("Edit Report", edit_report),
+                ("User Management", user_management_page),
+                ("Feedback Statistics", feedback_stats_page),
+                ("Query Performance", query_performance_page),
+                ("Stock Analysis", "Stock Analysis"),
+                ("Cleaned Data", "Cleaned Data"),
+                ("Financial Phrasebank", "Financial Phrasebank"),
+                ("Stock Comparison", "Stock Comparison"),
+                ("Query Interface", query_interface)
+            ]
+        }
+        
+        task_options = [task[0] for task in role_tasks[st.session_state.role]]
+        selected_task = st.selectbox("Select Task", task_options, help="Choose a task")
+        
+        if selected_task == "Stock Analysis":
+            company = st.selectbox("Select Company", companies, help="Choose a company")
+        else:
+            company = None
+        
+        if st.button("Log Out", key="logout_button", type="secondary"):
+            st.session_state.logged_in = False
+            st.session_state.username = None
+            st.session_state.email = None
+            st.session_state.role = None
+            st.session_state.token = None
+            st.session_state.page = "login"
+            st.rerun()
+
+    st.markdown("<h1 class='main-title'><i class='fas fa-chart-line'></i> Financial Insights Dashboard</h1>", unsafe_allow_html=True)
+    st.markdown("<img src='https://via.placeholder.com/100?text=Logo' class='logo' alt='Project Logo'/>", unsafe_allow_html=True)
+    st.markdown("<div class='company-data'>", unsafe_allow_html=True)
+
+    task_dict = {task[0]: task[1] for task in role_tasks[st.session_state.role]}
+    if selected_task in task_dict:
+        task_func = task_dict[selected_task]
+        if isinstance(task_func, str):
+            if task_func == "Stock Analysis":
+                stock_analysis(company)
+            elif task_func == "Cleaned Data":
+                visualize_cleaned_data(get_data()['cleaned'])
+            elif task_func == "Financial Phrasebank":
+                visualize_phrasebank_data(get_data()['financial_phrasebank'])
+            elif task_func == "Stock Comparison":
+                visualize_stock_comparison()
+            elif task_func == "Query Interface":
+                query_interface()
+            elif task_func == "User Management":
+                user_management_page()
+        else:
+            task_func()
+    st.markdown("</div>", unsafe_allow_html=True)
+
+try:
+    if 'logged_in' not in st.session_state or not st.session_state.logged_in:
+        tab1, tab2 = st.tabs(["Sign Up", "Log In"])
+        with tab1:
+            signup_page()
+        with tab2:
+            login_page()
+    else:
+        dashboard_page()
+except Exception as e:
     st.error(f"Error in main interface rendering: {e}")
\ No newline at end of file
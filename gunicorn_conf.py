@@ -0,0 +1,71 @@
+"""
+Multi-worker deployment of the backend with gunicorn and uvicorn workers.
+
+    gunicorn -c gunicorn_conf.py backend:app
+
+The application is imported once in the master (preload_app) and every dataset is
+loaded and parsed there before the workers are forked, so the workers start warm
+and share those pages copy-on-write instead of each holding its own copy. The
+garbage collector is frozen before forking so that collections in the workers do
+not touch (and thereby copy) the shared objects. Each worker then opens its own
+database connections (backend.after_fork).
+
+Every worker signs session tokens with the same SESSION_SECRET (generated here
+if unset). Query job status and token revocations go through the database, so
+any worker answers GET /query/{job_id} and a revocation reaches the other
+workers within REVOCATION_SYNC_SECONDS. Every worker writes its metrics to
+METRICS_MULTIPROC_DIR (a fresh temporary directory unless set; emptied at startup),
+so whichever worker answers a /metrics scrape returns the totals of all of them
+(see instrumentation.py).
+Still per worker, so multiply them by the worker count when sizing:
+- LLM_MAX_CONCURRENCY and the LLM_RATE_PER_SEC rate limit (llm_scheduler.py);
+- the query engine itself;
+- the write-behind buffer (WRITE_BEHIND_ENABLED) and QUERY_WORKERS / QUERY_MAX_PENDING (jobs.py);
+- the database connection pool.
+Set EMBEDDING_SERVICE_URL (see embedding_service.py) so the workers do not each
+load the embedding model.
+
+Configuration (environment variables):
+    BACKEND_BIND           Address to bind (default 0.0.0.0:8002)
+    BACKEND_WORKERS        Number of worker processes (default: one per CPU)
+    SESSION_SECRET         Token signing key; set it explicitly to keep sessions valid across restarts
+    METRICS_MULTIPROC_DIR  Directory for the per-worker metric snapshots (default: a new temporary one)
+"""
+import gc
+import glob
+import multiprocessing
+import os
+import secrets
+import tempfile
+
+
+os.environ.setdefault("SESSION_SECRET", secrets.token_urlsafe(32))
+if not os.environ.get("METRICS_MULTIPROC_DIR"):
+    os.environ["METRICS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="backend-metrics-")
+
+bind = os.environ.get("BACKEND_BIND", "0.0.0.0:8002")
+workers = int(os.environ.get("BACKEND_WORKERS", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = 120
+
+
+def on_starting(server):
+    # Snapshots left by a previous run would be added to this run's totals.
+    for path in glob.glob(os.path.join(os.environ["METRICS_MULTIPROC_DIR"], "metrics-*.json")):
+        os.remove(path)
+
+
+def when_ready(server):
+    import data_access
+
+    errors = data_access.preload()
+    for name, error in errors.items():
+        server.log.warning("Dataset %s not preloaded: %s", name, error)
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import backend
+
+    backend.after_fork()
@@ -0,0 +1,117 @@
+"""
+Pooled HTTP client for calls from the dashboard and query engine to the backend.
+
+A single keep-alive ``requests.Session`` is shared per process, with a sized
+connection pool, default timeouts and bounded retries with exponential backoff.
+Every request's latency is recorded through ``instrumentation``.
+
+Configuration (environment variables):
+    API_URL              Base URL of the backend (default http://127.0.0.1:8002)
+    API_CONNECT_TIMEOUT  Connect timeout in seconds (default 3)
+    API_READ_TIMEOUT     Read timeout in seconds (default 30)
+    API_MAX_RETRIES      Retries for connection errors and 502/503/504 (default 3)
+    API_RETRY_BACKOFF    Backoff factor between retries in seconds (default 0.3)
+    API_POOL_SIZE        Connections kept alive per host (default 10)
+"""
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import instrumentation
+
+
+API_URL = os.environ.get("API_URL", "http://127.0.0.1:8002").rstrip("/")
+CONNECT_TIMEOUT = float(os.environ.get("API_CONNECT_TIMEOUT", "3"))
+READ_TIMEOUT = float(os.environ.get("API_READ_TIMEOUT", "30"))
+MAX_RETRIES = int(os.environ.get("API_MAX_RETRIES", "3"))
+RETRY_BACKOFF = float(os.environ.get("API_RETRY_BACKOFF", "0.3"))
+POOL_SIZE = int(os.environ.get("API_POOL_SIZE", "10"))
+
+
+class BackendClient:
+    """
+    Thin wrapper around a pooled ``requests.Session`` bound to one backend URL.
+    Idempotent methods are retried on connection errors and 502/503/504 responses;
+    POST is only retried when the connection could not be established.
+    """
+
+    def __init__(self, base_url=API_URL, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+                 max_retries=MAX_RETRIES, backoff_factor=RETRY_BACKOFF, pool_size=POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        # Equivalent to the proxies={"http": None, "https": None} the callers used to pass.
+        self.session.trust_env = False
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, path, route=None, timeout=None, **kwargs):
+        """
+        Send a request to ``base_url + path``.
+        Args:
+            method (str): HTTP method.
+            path (str): Path starting with "/".
+            route (str, optional): Low-cardinality label for metrics, e.g. "/users/{username}".
+            timeout (float or tuple, optional): Overrides the default (connect, read) timeout.
+            **kwargs: Passed to ``requests.Session.request`` (data, json, params, headers...).
+        Returns:
+            requests.Response: The response; callers decide whether to ``raise_for_status``.
+        """
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", timeout=timeout or self.timeout, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            instrumentation.observe(
+                "http_client_request_seconds",
+                time.perf_counter() - start,
+                method=method,
+                route=route or path,
+                status=status,
+            )
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request("PUT", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide BackendClient, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = BackendClient()
+    return _client
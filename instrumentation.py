@@ -0,0 +1,334 @@
+"""
+In-process instrumentation shared by the dashboard, the query engine and the API.
+
+Latency samples and counters are recorded per metric name and label set and kept
+in memory; ``summary`` turns the samples into count and p50/p95/p99 figures.
+Every sample also lands in a cumulative histogram (latency buckets by default,
+see ``set_buckets``), and gauges hold point-in-time values such as in-flight
+requests. ``render_prometheus`` exposes all of it in the Prometheus text format.
+
+Everything is per process. When several worker processes serve the same port
+(gunicorn, uvicorn --workers), point METRICS_MULTIPROC_DIR at a directory shared
+by them: each process then writes a snapshot of its counters, gauges and
+histograms there (``start_snapshots``), and ``render_prometheus`` merges the
+snapshots of every process, so any worker answers a scrape with the totals.
+Counters and histograms are summed (including those of exited workers, so they
+never go backwards); gauges are reported per live process with a ``pid`` label.
+Empty the directory when the server (re)starts.
+
+Configuration (environment variables):
+    METRICS_MULTIPROC_DIR     Directory shared by the worker processes (default: unset, per process)
+    METRICS_SNAPSHOT_SECONDS  How often each process writes its snapshot (default 1)
+"""
+import atexit
+import bisect
+import glob
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+
+MAX_SAMPLES = 2048
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (128, 512, 2048, 8192, 32768, 131072, 524288, 2097152, 8388608)
+METRICS_MULTIPROC_DIR = os.environ.get("METRICS_MULTIPROC_DIR")
+METRICS_SNAPSHOT_SECONDS = float(os.environ.get("METRICS_SNAPSHOT_SECONDS", "1"))
+
+_lock = threading.Lock()
+_samples = defaultdict(lambda: deque(maxlen=MAX_SAMPLES))
+_counters = defaultdict(float)
+_gauges = defaultdict(float)
+# key -> [count per bucket (non-cumulative, last one is +Inf), sum, count]
+_histograms = {}
+_buckets = {}
+_collectors = []
+_snapshot_pid = None
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def set_buckets(name, buckets):
+    """Use ``buckets`` (ascending upper bounds) for the histogram of ``name`` instead of LATENCY_BUCKETS."""
+    with _lock:
+        _buckets[name] = tuple(buckets)
+
+
+def observe(name, value, **labels):
+    """Record one sample (e.g. a latency in seconds) for ``name``."""
+    key = _key(name, labels)
+    with _lock:
+        _samples[key].append(value)
+        buckets = _buckets.get(name, LATENCY_BUCKETS)
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+        histogram[0][bisect.bisect_left(buckets, value)] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+
+def increment(name, amount=1, **labels):
+    """Add ``amount`` to the counter ``name``."""
+    with _lock:
+        _counters[_key(name, labels)] += amount
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def add_gauge(name, amount, **labels):
+    """Move the gauge ``name`` by ``amount`` (e.g. +1/-1 around an in-flight request)."""
+    with _lock:
+        _gauges[_key(name, labels)] += amount
+
+
+@contextmanager
+def timer(name, **labels):
+    """Time the enclosed block and record it as a sample of ``name``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def percentile(values, q):
+    """Return the ``q``-th percentile (0-100) of ``values`` using nearest-rank; None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summary(name=None):
+    """
+    Summarize recorded samples.
+    Args:
+        name (str, optional): Only include this metric.
+    Returns:
+        list: One dict per metric/label set with count, mean, p50, p95, p99 and max.
+    """
+    with _lock:
+        items = [(key, list(values)) for key, values in _samples.items() if name is None or key[0] == name]
+    rows = []
+    for (metric, labels), values in items:
+        rows.append({
+            "name": metric,
+            "labels": dict(labels),
+            "count": len(values),
+            "mean": sum(values) / len(values) if values else None,
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": max(values) if values else None,
+        })
+    return rows
+
+
+def counters(name=None):
+    """Return the current counters as a list of dicts with name, labels and value."""
+    with _lock:
+        return [
+            {"name": metric, "labels": dict(labels), "value": value}
+            for (metric, labels), value in _counters.items()
+            if name is None or metric == name
+        ]
+
+
+def _metric_name(name):
+    return re.sub(r"[^a-zA-Z0-9_:]", "_", name)
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        f'{_metric_name(k)}="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def add_collector(callback):
+    """Call ``callback()`` before every render and snapshot, e.g. to refresh gauges read from other objects."""
+    _collectors.append(callback)
+
+
+def _collect():
+    for callback in _collectors:
+        try:
+            callback()
+        except Exception:
+            pass
+
+
+def _snapshot():
+    """Copy of the counters, gauges and histograms, in the JSON-friendly form used by the snapshot files."""
+    _collect()
+    with _lock:
+        return {
+            "counters": [[name, list(labels), value] for (name, labels), value in _counters.items()],
+            "gauges": [[name, list(labels), value] for (name, labels), value in _gauges.items()],
+            "histograms": [[name, list(labels), [*h[0]], h[1], h[2]] for (name, labels), h in _histograms.items()],
+        }
+
+
+def _snapshot_path(directory, pid):
+    return os.path.join(directory, f"metrics-{pid}.json")
+
+
+def write_snapshot(directory=None):
+    """Write this process's metrics to ``directory`` (default METRICS_MULTIPROC_DIR), replacing its previous snapshot."""
+    directory = directory or METRICS_MULTIPROC_DIR
+    path = _snapshot_path(directory, os.getpid())
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(_snapshot(), f)
+    os.replace(tmp_path, path)
+
+
+def start_snapshots(directory=None, interval=None):
+    """
+    Keep this process's snapshot in ``directory`` (default METRICS_MULTIPROC_DIR) current: written every
+    ``interval`` seconds (default METRICS_SNAPSHOT_SECONDS) and at exit. No-op without a directory.
+    Call it in each worker process, after forking.
+    """
+    global _snapshot_pid
+    directory = directory or METRICS_MULTIPROC_DIR
+    interval = interval or METRICS_SNAPSHOT_SECONDS
+    if not directory or _snapshot_pid == os.getpid():
+        return
+    _snapshot_pid = os.getpid()
+    os.makedirs(directory, exist_ok=True)
+
+    def run():
+        while True:
+            try:
+                write_snapshot(directory)
+            except OSError:
+                pass
+            time.sleep(interval)
+
+    threading.Thread(target=run, name="metrics-snapshots", daemon=True).start()
+    atexit.register(write_snapshot, directory)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def _merged(directory):
+    """Merge the snapshots in ``directory`` (this process's taken live) into counters, gauges and histograms."""
+    own = os.getpid()
+    snapshots = {own: _snapshot()}
+    for path in glob.glob(os.path.join(directory, "metrics-*.json")):
+        try:
+            pid = int(os.path.basename(path)[len("metrics-"):-len(".json")])
+            if pid == own:
+                continue
+            with open(path, encoding="utf-8") as f:
+                snapshots[pid] = json.load(f)
+        except (ValueError, OSError):
+            continue
+    counters_, gauges, histograms = defaultdict(float), {}, {}
+    for pid, snapshot in snapshots.items():
+        for name, labels, value in snapshot["counters"]:
+            counters_[(name, tuple(map(tuple, labels)))] += value
+        if pid == own or _alive(pid):
+            for name, labels, value in snapshot["gauges"]:
+                gauges[(name, tuple(sorted([*map(tuple, labels), ("pid", str(pid))])))] = value
+        for name, labels, counts, total, count in snapshot["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.get(key)
+            if merged is None or len(merged[0]) != len(counts):
+                histograms[key] = ([*counts], total, count)
+            else:
+                histograms[key] = ([a + b for a, b in zip(merged[0], counts)], merged[1] + total, merged[2] + count)
+    return counters_, gauges, histograms
+
+
+def render_prometheus(prefix="", directory=None):
+    """
+    Render every counter, gauge and histogram in the Prometheus text exposition format.
+    Args:
+        prefix (str): Prepended to every metric name, e.g. "app_".
+        directory (str, optional): Merge the snapshots of every process in this directory
+            (default METRICS_MULTIPROC_DIR; this process only when neither is set).
+    Returns:
+        str: The exposition text.
+    """
+    directory = directory or METRICS_MULTIPROC_DIR
+    if directory:
+        # _merged takes this process's snapshot, which runs the collectors
+        merged_counters, merged_gauges, merged_histograms = _merged(directory)
+        counters_ = sorted(merged_counters.items())
+        gauges = sorted(merged_gauges.items())
+        histograms = sorted(merged_histograms.items())
+        with _lock:
+            buckets = dict(_buckets)
+    else:
+        _collect()
+        with _lock:
+            counters_ = sorted(_counters.items())
+            gauges = sorted(_gauges.items())
+            histograms = sorted((key, ([*h[0]], h[1], h[2])) for key, h in _histograms.items())
+            buckets = dict(_buckets)
+    lines = []
+    typed = set()
+
+    def declare(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in counters_:
+        metric = _metric_name(prefix + name)
+        metric = metric if metric.endswith("_total") else metric + "_total"
+        declare(metric, "counter")
+        lines.append(f"{metric}{_format_labels(labels)} {_format_value(value)}")
+    for (name, labels), value in gauges:
+        metric = _metric_name(prefix + name)
+        declare(metric, "gauge")
+        lines.append(f"{metric}{_format_labels(labels)} {_format_value(value)}")
+    for (name, labels), (counts, total, count) in histograms:
+        metric = _metric_name(prefix + name)
+        declare(metric, "histogram")
+        cumulative = 0
+        for bound, bucket_count in zip((*buckets.get(name, LATENCY_BUCKETS), math.inf), counts):
+            cumulative += bucket_count
+            lines.append(f"{metric}_bucket{_format_labels(labels, [('le', _format_value(bound))])} {cumulative}")
+        lines.append(f"{metric}_sum{_format_labels(labels)} {_format_value(total)}")
+        lines.append(f"{metric}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    """Clear all samples, counters, gauges and histograms."""
+    with _lock:
+        _samples.clear()
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
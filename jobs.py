@@ -0,0 +1,226 @@
+"""
+Background jobs for slow work such as LLM queries.
+
+``JobManager`` runs jobs on a bounded thread pool, so the worker count caps how
+many run at once (and therefore LLM concurrency). Callers get a job id back
+immediately and poll ``get`` for the status. Every job has a deadline, and queued
+or running jobs can be cancelled. A running Python thread cannot be interrupted,
+so a job that is cancelled or times out while running is marked as such
+immediately and its eventual result is discarded.
+
+Jobs live in the memory of the process that runs them. An ``on_change`` callback
+sees a snapshot of every state change, so the backend can mirror jobs to the
+database and answer polls that reach a different worker process. Snapshots are
+taken under the manager's lock but delivered in order by a separate thread, so a
+slow callback (a busy database) never blocks submit, polling or cancel;
+``wait_notified`` waits for delivery when a caller needs it.
+
+Configuration (environment variables):
+    QUERY_WORKERS       Jobs run concurrently (default 4)
+    QUERY_TIMEOUT       Default and maximum job deadline in seconds (default 120)
+    QUERY_MAX_PENDING   Queued jobs accepted before submit is refused (default 100)
+    JOB_RETENTION       Seconds finished jobs stay available to poll (default 3600)
+"""
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import instrumentation
+
+
+QUERY_WORKERS = int(os.environ.get("QUERY_WORKERS", "4"))
+QUERY_TIMEOUT = float(os.environ.get("QUERY_TIMEOUT", "120"))
+QUERY_MAX_PENDING = int(os.environ.get("QUERY_MAX_PENDING", "100"))
+JOB_RETENTION = float(os.environ.get("JOB_RETENTION", "3600"))
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED, TIMED_OUT = "queued", "running", "succeeded", "failed", "cancelled", "timed_out"
+FINISHED = {SUCCEEDED, FAILED, CANCELLED, TIMED_OUT}
+
+
+class QueueFullError(Exception):
+    """Raised by ``submit`` when QUERY_MAX_PENDING jobs are already waiting."""
+
+
+class Job:
+    def __init__(self, owner, payload, timeout):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.payload = payload
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.deadline = self.created_at + timeout
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "owner": self.owner,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "deadline": self.deadline,
+        }
+
+
+class JobManager:
+    def __init__(self, runner, workers=QUERY_WORKERS, timeout=QUERY_TIMEOUT, max_pending=QUERY_MAX_PENDING,
+                 retention=JOB_RETENTION, on_change=None):
+        """
+        Args:
+            runner: ``runner(payload)`` doing the work in a worker thread; its return value becomes the result.
+            workers (int): Size of the worker pool.
+            timeout (float): Default and maximum deadline, in seconds from submission.
+            max_pending (int): Maximum number of queued (not yet running) jobs.
+            retention (float): Seconds a finished job is kept for polling.
+            on_change: Optional ``on_change(snapshot)`` receiving ``Job.to_dict()`` after the job is queued,
+                starts or finishes. Called on a background thread, in order, without the manager's lock.
+                Errors are counted and otherwise ignored.
+        """
+        self.runner = runner
+        self.on_change = on_change
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._changes = deque()
+        self._changes_ready = threading.Condition()
+        self._changes_queued = 0
+        self._changes_delivered = 0
+        self._notifier = None
+
+    @property
+    def pending(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status == QUEUED)
+
+    def submit(self, owner, payload, timeout=None):
+        """
+        Queue a job for ``owner`` and return it.
+        Raises:
+            QueueFullError: If max_pending jobs are already queued.
+        """
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        job = Job(owner, payload, timeout)
+        with self._lock:
+            self._prune()
+            if sum(1 for queued in self._jobs.values() if queued.status == QUEUED) >= self.max_pending:
+                instrumentation.increment("query_jobs_rejected")
+                raise QueueFullError("Too many queued queries, try again later")
+            self._jobs[job.id] = job
+            self._notify(job)
+        job.future = self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        """Return the job (with its deadline applied), or None if unknown or expired."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._check_deadline(job)
+            return job
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; finished jobs are returned unchanged. Returns None if unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            self._check_deadline(job)
+            if not job.finished:
+                if job.future is not None:
+                    job.future.cancel()
+                self._finish(job, CANCELLED, error="Cancelled by user")
+            return job
+
+    def _run(self, job):
+        with self._lock:
+            self._check_deadline(job)
+            if job.finished:
+                return
+            job.status = RUNNING
+            job.started_at = time.time()
+            self._notify(job)
+        instrumentation.observe("query_job_wait_seconds", job.started_at - job.created_at)
+        try:
+            result, error, status = self.runner(job.payload), None, SUCCEEDED
+        except Exception as e:
+            result, error, status = None, str(e), FAILED
+        with self._lock:
+            self._check_deadline(job)
+            if not job.finished:
+                job.result = result
+                self._finish(job, status, error=error)
+
+    def _check_deadline(self, job):
+        if not job.finished and time.time() > job.deadline:
+            self._finish(job, TIMED_OUT, error="Query exceeded its deadline")
+
+    def _finish(self, job, status, error=None):
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        instrumentation.increment("query_jobs_finished", status=status)
+        if job.started_at is not None:
+            instrumentation.observe("query_job_run_seconds", job.finished_at - job.started_at, status=status)
+        self._notify(job)
+
+    def _notify(self, job):
+        if self.on_change is None:
+            return
+        with self._changes_ready:
+            self._changes.append(job.to_dict())
+            self._changes_queued += 1
+            self._changes_ready.notify_all()
+            # Started lazily, and again in a forked worker process (threads do not survive fork).
+            if self._notifier is None or not self._notifier.is_alive():
+                self._notifier = threading.Thread(target=self._deliver, name="query-job-notifier", daemon=True)
+                self._notifier.start()
+
+    def _deliver(self):
+        while True:
+            with self._changes_ready:
+                while not self._changes:
+                    self._changes_ready.wait()
+                snapshot = self._changes.popleft()
+            try:
+                self.on_change(snapshot)
+            except Exception:
+                instrumentation.increment("query_job_notify_errors")
+            with self._changes_ready:
+                self._changes_delivered += 1
+                self._changes_ready.notify_all()
+
+    def wait_notified(self, timeout=None):
+        """Wait until every state change so far has been passed to ``on_change``. Returns False on timeout."""
+        with self._changes_ready:
+            target = self._changes_queued
+            return self._changes_ready.wait_for(lambda: self._changes_delivered >= target, timeout)
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id in [job.id for job in self._jobs.values() if job.finished and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        """Cancel queued jobs and stop accepting work; running jobs are left to finish in the background."""
+        with self._lock:
+            for job in self._jobs.values():
+                if job.status == QUEUED:
+                    self._finish(job, CANCELLED, error="Server shutting down")
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,166 @@
+"""
+Admission control for calls to the LLM provider.
+
+Every provider call takes a slot from the process-wide ``scheduler`` first:
+- at most LLM_MAX_CONCURRENCY calls are in flight at once;
+- a token bucket limits the start rate to LLM_RATE_PER_SEC (bursts up to LLM_BURST);
+- waiting calls are admitted by role priority (Administrator, then Expert, then
+  Regular User), first come first served within a role.
+
+The role of the user a query runs for is carried in a context variable set with
+``for_role``, so the LLM wrapper does not need it passed through llama-index.
+Provider calls share one keep-alive HTTP client (``http_client``) so TLS
+connections are reused instead of re-established per request.
+
+Configuration (environment variables):
+    LLM_MAX_CONCURRENCY  Provider calls in flight at once (default 4)
+    LLM_RATE_PER_SEC     Sustained call starts per second, 0 disables the limit (default 2)
+    LLM_BURST            Token bucket size (default 4)
+    LLM_QUEUE_TIMEOUT    Seconds a call may wait for a slot (default 60)
+    LLM_HTTP_TIMEOUT     Provider request timeout in seconds (default 60)
+    LLM_HTTP_KEEPALIVE   Idle keep-alive connections kept to the provider (default 8)
+"""
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import httpx
+
+import instrumentation
+
+
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "4"))
+LLM_RATE_PER_SEC = float(os.environ.get("LLM_RATE_PER_SEC", "2"))
+LLM_BURST = int(os.environ.get("LLM_BURST", "4"))
+LLM_QUEUE_TIMEOUT = float(os.environ.get("LLM_QUEUE_TIMEOUT", "60"))
+LLM_HTTP_TIMEOUT = float(os.environ.get("LLM_HTTP_TIMEOUT", "60"))
+LLM_HTTP_KEEPALIVE = int(os.environ.get("LLM_HTTP_KEEPALIVE", "8"))
+
+ROLE_PRIORITY = {"Administrator": 0, "Expert": 1, "Regular User": 2}
+DEFAULT_PRIORITY = max(ROLE_PRIORITY.values())
+
+# Queue depth is a count of waiting calls, not a duration, so it gets integer buckets.
+instrumentation.set_buckets("llm_queue_depth", (0, 1, 2, 4, 8, 16, 32, 64, 128, 256))
+
+current_role = contextvars.ContextVar("llm_role", default=None)
+
+
+class SchedulerTimeoutError(TimeoutError):
+    """Raised when a call waits longer than the queue timeout for a slot."""
+
+
+@contextmanager
+def for_role(role):
+    """Run the enclosed LLM calls with ``role``'s priority."""
+    token = current_role.set(role)
+    try:
+        yield
+    finally:
+        current_role.reset(token)
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, rate=LLM_RATE_PER_SEC, burst=LLM_BURST,
+                 queue_timeout=LLM_QUEUE_TIMEOUT):
+        """
+        Args:
+            max_concurrency (int): Calls allowed in flight at once.
+            rate (float): Token refill rate per second; 0 or less disables rate limiting.
+            burst (int): Token bucket capacity.
+            queue_timeout (float): Default maximum wait for a slot, in seconds.
+        """
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._active = 0
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+
+    def _refill(self, now):
+        if self.rate > 0:
+            self._tokens = min(float(self.burst), self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def _token_delay(self):
+        """Seconds until a token is available (0 when one is available now)."""
+        if self.rate <= 0 or self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def acquire(self, role=None, timeout=None):
+        """
+        Block until the caller may start a provider call; pair with ``release``.
+        Raises:
+            SchedulerTimeoutError: If no slot is granted within ``timeout`` (default queue_timeout) seconds.
+        """
+        role = current_role.get() if role is None else role
+        ticket = (ROLE_PRIORITY.get(role, DEFAULT_PRIORITY), next(self._sequence))
+        timeout = self.queue_timeout if timeout is None else timeout
+        start = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            instrumentation.observe("llm_queue_depth", len(self._waiting))
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    delay = self._token_delay()
+                    if self._waiting[0] == ticket and self._active < self.max_concurrency and delay == 0:
+                        break
+                    remaining = start + timeout - now
+                    if remaining <= 0:
+                        raise SchedulerTimeoutError(f"No LLM slot available after {timeout:g}s")
+                    # Only the head of the queue waits on the bucket; everyone else waits for a notify.
+                    self._cond.wait(min(remaining, delay) if self._waiting[0] == ticket and delay else remaining)
+            except BaseException:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                instrumentation.increment("llm_requests_rejected", role=role or "unknown")
+                raise
+            heapq.heappop(self._waiting)
+            if self.rate > 0:
+                self._tokens -= 1
+            self._active += 1
+            self._cond.notify_all()
+        instrumentation.observe("llm_queue_wait_seconds", time.monotonic() - start, role=role or "unknown")
+        instrumentation.increment("llm_requests", role=role or "unknown")
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, role=None, timeout=None):
+        """Context manager holding a slot for the duration of one provider call."""
+        self.acquire(role, timeout)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release()
+            instrumentation.observe("llm_call_seconds", time.perf_counter() - start)
+
+    def stats(self):
+        """Current in-flight calls, queued calls and available rate tokens."""
+        with self._cond:
+            self._refill(time.monotonic())
+            return {"active": self._active, "queued": len(self._waiting), "tokens": round(self._tokens, 2)}
+
+
+scheduler = LLMScheduler()
+
+_http_limits = httpx.Limits(
+    max_keepalive_connections=LLM_HTTP_KEEPALIVE,
+    max_connections=max(LLM_MAX_CONCURRENCY, LLM_HTTP_KEEPALIVE),
+)
+http_client = httpx.Client(limits=_http_limits, timeout=LLM_HTTP_TIMEOUT)
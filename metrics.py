@@ -0,0 +1,80 @@
+"""
+HTTP metrics for the FastAPI backend, exposed at ``/metrics`` in the Prometheus text format.
+
+``MetricsMiddleware`` is a plain ASGI middleware (so streaming and SSE responses
+are measured without being buffered) that records for every HTTP request:
+- http_requests_total{method, route, status}
+- http_request_duration_seconds{method, route, status} (histogram)
+- http_request_size_bytes / http_response_size_bytes{method, route} (histograms)
+- http_requests_in_flight (gauge)
+The route label is the path template ("/query/{job_id}"), not the raw path, so
+job ids and usernames do not explode the number of series; unmatched paths are
+reported as "unmatched".
+
+Database statement timings (database.py), dataset cache hits (data_access.py) and
+the other in-process samples from instrumentation.py are rendered alongside them.
+"""
+import time
+
+import instrumentation
+
+
+instrumentation.set_buckets("http_request_size_bytes", instrumentation.SIZE_BUCKETS)
+instrumentation.set_buckets("http_response_size_bytes", instrumentation.SIZE_BUCKETS)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def route_template(scope):
+    """Return the matched route's path template, or "unmatched"."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    def __init__(self, app, skip_paths=("/metrics",)):
+        """
+        Args:
+            app: The ASGI application to wrap.
+            skip_paths (tuple): Raw paths that are not measured (the scrape endpoint itself).
+        """
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+        request_bytes = 0
+        response_bytes = 0
+        status = 500
+
+        async def counting_receive():
+            nonlocal request_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                request_bytes += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal response_bytes, status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        method = scope["method"]
+        instrumentation.add_gauge("http_requests_in_flight", 1)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            seconds = time.perf_counter() - start
+            instrumentation.add_gauge("http_requests_in_flight", -1)
+            # Routing fills in scope["route"] while handling, so read it afterwards.
+            route = route_template(scope)
+            instrumentation.increment("http_requests", method=method, route=route, status=status)
+            instrumentation.observe("http_request_duration_seconds", seconds, method=method, route=route, status=status)
+            instrumentation.observe("http_request_size_bytes", request_bytes, method=method, route=route)
+            instrumentation.observe("http_response_size_bytes", response_bytes, method=method, route=route)
@@ -0,0 +1,178 @@
+"""
+Versioned schema migrations for the backend database.
+
+Every migration runs once, inside a transaction, and is recorded in the
+``schema_version`` table. On startup ``migrate`` only reads the recorded version
+and applies whatever is newer, so a current database costs a single query and
+no rows are copied. Migrations are written to be idempotent so databases created
+before versioning existed are brought up to date safely.
+
+To change the schema, append a new ``(version, description, function)`` entry to
+MIGRATIONS; never edit one that has already shipped.
+"""
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+
+def _columns(connection, table):
+    """Return {column name: PRAGMA table_info row} for ``table``."""
+    return {row[1]: row for row in connection.execute(text(f"PRAGMA table_info({table})"))}
+
+
+def _create_tables(connection, metadata, *names):
+    for name in names:
+        metadata.tables[name].create(bind=connection, checkfirst=True)
+
+
+def _base_tables(connection, metadata):
+    _create_tables(connection, metadata, "users", "suggestions", "evaluations")
+
+
+def _users_role_column(connection, metadata):
+    if "role" not in _columns(connection, "users"):
+        connection.execute(text("ALTER TABLE users ADD COLUMN role TEXT DEFAULT 'Regular User'"))
+
+
+def _users_email_column(connection, metadata):
+    if "email" not in _columns(connection, "users"):
+        connection.execute(text("ALTER TABLE users ADD COLUMN email TEXT"))
+    connection.execute(text("UPDATE users SET email = username || '@default.com' WHERE email IS NULL"))
+
+
+def _users_email_not_null(connection, metadata):
+    # SQLite cannot add NOT NULL to an existing column, so rebuild the table once if needed.
+    email = _columns(connection, "users")["email"]
+    if email[3]:
+        return
+    connection.execute(text("ALTER TABLE users RENAME TO users_old"))
+    connection.execute(text("""
+        CREATE TABLE users (
+            id INTEGER PRIMARY KEY,
+            username TEXT UNIQUE,
+            email TEXT UNIQUE NOT NULL,
+            hashed_password TEXT,
+            role TEXT DEFAULT 'Regular User'
+        )
+    """))
+    connection.execute(text(
+        "INSERT INTO users (id, username, email, hashed_password, role) "
+        "SELECT id, username, email, hashed_password, role FROM users_old"
+    ))
+    connection.execute(text("DROP TABLE users_old"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_users_id ON users (id)"))
+
+
+def _feedback_created_at(connection, metadata):
+    for table in ("suggestions", "evaluations"):
+        if "created_at" not in _columns(connection, table):
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN created_at VARCHAR"))
+
+
+def _users_role_username_index(connection, metadata):
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_users_role_username ON users (role, username)"))
+
+
+def _rollup_source(table, columns):
+    # Every row counts towards (user, day), (user, "*"), ("*", day) and ("*", "*").
+    user = "COALESCE(username, '')"
+    day = "COALESCE(substr(created_at, 1, 10), 'unknown')"
+    return " UNION ALL ".join(
+        f"SELECT {u} AS username, {d} AS day{columns} FROM {table}"
+        for u, d in ((user, day), (user, "'*'"), ("'*'", day), ("'*'", "'*'"))
+    )
+
+
+def _feedback_rollups(connection, metadata):
+    _create_tables(connection, metadata, "evaluation_rollups", "suggestion_rollups")
+    connection.execute(text("DELETE FROM evaluation_rollups"))
+    connection.execute(text("DELETE FROM suggestion_rollups"))
+    histogram = ", ".join(f"SUM(quality = {level})" for level in range(1, 6))
+    connection.execute(text(
+        "INSERT INTO evaluation_rollups (username, day, count, quality_sum, q1, q2, q3, q4, q5) "
+        f"SELECT username, day, COUNT(*), SUM(quality), {histogram} "
+        f"FROM ({_rollup_source('evaluations', ', quality')}) GROUP BY username, day"
+    ))
+    connection.execute(text(
+        "INSERT INTO suggestion_rollups (username, day, count) "
+        f"SELECT username, day, COUNT(*) FROM ({_rollup_source('suggestions', '')}) GROUP BY username, day"
+    ))
+
+
+def _query_history(connection, metadata):
+    # External-content FTS5 index kept in sync with query_history by triggers.
+    _create_tables(connection, metadata, "query_history")
+    connection.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS query_history_fts "
+        "USING fts5(query, answer, content='query_history', content_rowid='id')"
+    ))
+    connection.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS query_history_ai AFTER INSERT ON query_history BEGIN
+            INSERT INTO query_history_fts (rowid, query, answer) VALUES (new.id, new.query, new.answer);
+        END
+    """))
+    connection.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS query_history_ad AFTER DELETE ON query_history BEGIN
+            INSERT INTO query_history_fts (query_history_fts, rowid, query, answer) VALUES ('delete', old.id, old.query, old.answer);
+        END
+    """))
+    connection.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS query_history_au AFTER UPDATE ON query_history BEGIN
+            INSERT INTO query_history_fts (query_history_fts, rowid, query, answer) VALUES ('delete', old.id, old.query, old.answer);
+            INSERT INTO query_history_fts (rowid, query, answer) VALUES (new.id, new.query, new.answer);
+        END
+    """))
+    connection.execute(text("INSERT INTO query_history_fts (query_history_fts) VALUES ('rebuild')"))
+
+
+def _shared_worker_state(connection, metadata):
+    _create_tables(connection, metadata, "query_jobs", "token_revocations")
+
+
+MIGRATIONS = [
+    (1, "create users, suggestions and evaluations tables", _base_tables),
+    (2, "add users.role", _users_role_column),
+    (3, "add users.email and backfill defaults", _users_email_column),
+    (4, "make users.email NOT NULL", _users_email_not_null),
+    (5, "add created_at to suggestions and evaluations", _feedback_created_at),
+    (6, "index users by (role, username) for filtered pagination", _users_role_username_index),
+    (7, "add evaluation and suggestion rollup tables and backfill them", _feedback_rollups),
+    (8, "add query_history with an FTS5 search index", _query_history),
+    (9, "add query_jobs and token_revocations shared by worker processes", _shared_worker_state),
+]
+
+
+def current_version(connection):
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, description TEXT NOT NULL, applied_at TEXT NOT NULL)"
+    ))
+    return connection.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar()
+
+
+def migrate(engine, metadata):
+    """
+    Apply pending migrations.
+    Args:
+        engine: SQLAlchemy engine for the database.
+        metadata: The declarative metadata holding the table definitions.
+    Returns:
+        list: Descriptions of the migrations applied by this call (empty when already current).
+    """
+    applied = []
+    with engine.begin() as connection:
+        if engine.dialect.name == "sqlite":
+            # Take the write lock up front: several worker processes may start at once,
+            # and only the first should see (and apply) the pending migrations.
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+        version = current_version(connection)
+        for number, description, migration in MIGRATIONS:
+            if number <= version:
+                continue
+            migration(connection, metadata)
+            connection.execute(
+                text("INSERT INTO schema_version (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {"v": number, "d": description, "t": datetime.now(timezone.utc).isoformat()},
+            )
+            applied.append(f"{number}: {description}")
+    return applied
@@ -0,0 +1,115 @@
+"""
+Deterministic local stand-ins for the OpenRouter LLM and the bge-small embedding model.
+
+They let ``initialize_query_engine`` and ``run_query`` run without network access or
+model downloads, so the query pipeline can be benchmarked and regressions caught
+offline. Answers are not meaningful, but they are stable for a given input, and the
+stand-ins speak just enough of llama-index's prompt formats for the router selector
+and the JSONPath engines to work:
+- selector prompts get the numbered choice whose description best overlaps the question;
+- JSONPath prompts get the query back if it already is one, else a small slice;
+- everything else gets a short digest of the prompt.
+
+Set QUERY_ENGINE_OFFLINE=1 to make ``query_engine`` use them.
+
+Configuration (environment variables):
+    OFFLINE_LLM_LATENCY_MS    Simulated provider latency per LLM call (default 0)
+    OFFLINE_EMBED_DIM         Embedding dimension (default 384, like bge-small)
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import time
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.llms import CompletionResponse, CompletionResponseGen, CustomLLM, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+
+
+OFFLINE_LLM_LATENCY_MS = float(os.environ.get("OFFLINE_LLM_LATENCY_MS", "0"))
+OFFLINE_EMBED_DIM = int(os.environ.get("OFFLINE_EMBED_DIM", "384"))
+
+_WORD = re.compile(r"[a-z0-9]+")
+_CHOICE = re.compile(r"^\((\d+)\)\s*(.*)$", re.MULTILINE)
+_QUESTION = re.compile(r"question:\s*'(.*?)'\s*$", re.MULTILINE | re.DOTALL)
+_TASK = re.compile(r"Task:\s*(.*?)\s*Response:\s*$", re.DOTALL)
+
+
+def _words(text):
+    return set(_WORD.findall(text.lower()))
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class OfflineLLM(CustomLLM):
+    """Deterministic LLM that answers router, JSONPath and synthesis prompts without a provider."""
+
+    context_window: int = 4096
+    num_output: int = 256
+    latency_ms: float = OFFLINE_LLM_LATENCY_MS
+    model_name: str = "offline-deterministic"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(context_window=self.context_window, num_output=self.num_output, model_name=self.model_name)
+
+    def _respond(self, prompt: str) -> str:
+        choices = _CHOICE.findall(prompt)
+        question = _QUESTION.search(prompt)
+        if choices and question:
+            asked = _words(question.group(1))
+            number, _ = max(choices, key=lambda choice: (len(asked & _words(choice[1])), -int(choice[0])))
+            return json.dumps([{"choice": int(number), "reason": "Highest keyword overlap with the question."}])
+        if "JSONPath:" in prompt:
+            task = _TASK.search(prompt)
+            query = task.group(1).strip() if task else ""
+            return f"JSONPath: {query}" if query.startswith("$") else "JSONPath: $.*[0:5]"
+        return f"Offline answer {_digest(prompt)[:12]} based on {len(prompt)} characters of context."
+
+    def _simulate_latency(self):
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000)
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs) -> CompletionResponse:
+        self._simulate_latency()
+        return CompletionResponse(text=self._respond(prompt))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs) -> CompletionResponseGen:
+        self._simulate_latency()
+        text = ""
+        for word in self._respond(prompt).split(" "):
+            delta = word if not text else f" {word}"
+            text += delta
+            yield CompletionResponse(text=text, delta=delta)
+
+
+class HashEmbedding(BaseEmbedding):
+    """Feature-hashing bag-of-words embedding: similar texts share dimensions, no model download needed."""
+
+    dimension: int = OFFLINE_EMBED_DIM
+
+    def _embed(self, text: str) -> list:
+        vector = [0.0] * self.dimension
+        for word in _WORD.findall(text.lower()):
+            value = int(_digest(word)[:8], 16)
+            vector[value % self.dimension] += 1.0 if value & 1 << 31 else -1.0
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def _get_query_embedding(self, query: str) -> list:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> list:
+        return self._embed(text)
+
+    def _get_text_embeddings(self, texts: list) -> list:
+        return [self._embed(text) for text in texts]
+
+    async def _aget_query_embedding(self, query: str) -> list:
+        return self._embed(query)
@@ -1,245 +1,376 @@
-import json
-import os
-import requests
-import streamlit as st
-from llama_index.llms.openrouter import OpenRouter
-from llama_index.core import Settings, Document
-from llama_index.core.query_engine import RouterQueryEngine
-from llama_index.core.tools import QueryEngineTool
-from llama_index.core.selectors import LLMSingleSelector
-from llama_index.core.indices.vector_store import VectorStoreIndex
-from llama_index.core.indices.struct_store import JSONQueryEngine
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-
-
-API_URL = "http://127.0.0.1:8002"
-
-def initialize_query_engine(companies_paths):
-    """
-    Initialize a RouterQueryEngine to handle financial queries for stock data, cleaned data, and financial phrasebank.
-    Fetches data from FastAPI endpoints and falls back to local JSON files if API fails.
-    Args:
-        companies_paths (dict): Dictionary containing file paths for stock data, cleaned data, and financial phrasebank.
-    Returns:
-        RouterQueryEngine or None: Returns the initialized query engine or None if initialization fails.
-    """
-    try:
-       
-        os.environ["OPENROUTER_API_KEY"] = "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"
-        llm = OpenRouter(
-            api_key=os.environ["OPENROUTER_API_KEY"],
-            model="mistralai/mixtral-8x7b-instruct",
-            max_tokens=512,
-            context_window=4096,
-        )
-        Settings.llm = llm
-        Settings.chunk_size = 1024
-        embed_model = HuggingFaceEmbedding(model_name="BAAI/bge-small-en-v1.5")
-        Settings.embed_model = embed_model
-
-     
-        try:
-            response = requests.get(f"{API_URL}/data/financial_phrasebank", proxies={"http": None, "https": None})
-            response.raise_for_status()
-            phrase_data = response.json()
-            phrase_docs = [Document(text=f"{item.split('@')[0]} (Sentiment: {item.split('@')[1]})") for item in phrase_data]
-           
-
-            phrase_index = VectorStoreIndex.from_documents(phrase_docs)
-            phrase_engine = phrase_index.as_query_engine(similarity_top_k=3)
-        except Exception as e:
-            st.error(f"Error fetching financial_phrasebank data from API: {e}. Trying local file.")
-            try:
-                if not os.path.exists(companies_paths["financial_phrasebank"]):
-                    st.error(f"Local file not found: {companies_paths['financial_phrasebank']}")
-                    phrase_engine = None
-                else:
-                    with open(companies_paths["financial_phrasebank"], "r", encoding="utf-8") as f:
-                        phrase_data = json.load(f)
-                    phrase_docs = [Document(text=f"{item.split('@')[0]} (Sentiment: {item.split('@')[1]})") for item in phrase_data]
-                   
-                    phrase_index = VectorStoreIndex.from_documents(phrase_docs)
-                    phrase_engine = phrase_index.as_query_engine(similarity_top_k=3)
-            except Exception as e:
-                st.error(f"Error loading local financial_phrasebank data: {e}")
-                phrase_engine = None
-
-        
-        try:
-            response = requests.get(f"{API_URL}/data/cleaned", proxies={"http": None, "https": None})
-            response.raise_for_status()
-            stage_data = response.json()
-
-            stage_schema = {
-                "type": "array",
-                "items": {
-                    "type": "object",
-                    "properties": {
-                        "Index": {"type": "integer"},
-                        "Credit Expiration": {"type": "integer"},
-                        "DPD": {"type": "integer"},
-                        "FS": {"type": "string"},
-                        "CDR": {"type": "string"},
-                        "SICR": {"type": "string"},
-                        "Follow Up": {"type": "string"},
-                        "Rescheduled": {"type": "string"},
-                        "Restructuring": {"type": "string"},
-                        "Covenant": {"type": "string"},
-                        "Turnover": {"type": "string"},
-                        "Group Reason": {"type": "string"},
-                        "Current Stage": {"type": "integer"},
-                        "Stage As last Month": {"type": "integer"}
-                    },
-                    "required": ["Credit Expiration", "Current Stage", "DPD"]
-                }
-            }
-            stage_engine = JSONQueryEngine(json_value=stage_data, json_schema=stage_schema)
-        except Exception as e:
-            st.error(f"Error fetching cleaned data from API: {e}. Trying local file.")
-            try:
-                if not os.path.exists(companies_paths["cleaned"]):
-                    st.error(f"Local file not found: {companies_paths['cleaned']}")
-                    stage_engine = None
-                else:
-                    with open(companies_paths["cleaned"], "r", encoding="utf-8") as f:
-                        stage_data = json.load(f)
-                    stage_engine = JSONQueryEngine(json_value=stage_data, json_schema=stage_schema)
-            except Exception as e:
-                st.error(f"Error loading local cleaned data: {e}")
-                stage_engine = None
-
-      
-        stock_schema = {
-            "type": "object",
-            "properties": {
-                "Apple": {
-                    "type": "array",
-                    "items": {
-                        "type": "object",
-                        "properties": {
-                            "Date": {"type": "string"},
-                            "Close": {"type": "number"},
-                            "Open": {"type": "number"},
-                            "High": {"type": "number"},
-                            "Low": {"type": "number"},
-                            "Volume": {"type": "integer"}
-                        },
-                        "required": ["Date", "Close"]
-                    }
-                },
-                "Meta": {
-                    "type": "array",
-                    "items": {
-                        "type": "object",
-                        "properties": {
-                            "Date": {"type": "string"},
-                            "Close": {"type": "number"},
-                            "Open": {"type": "number"},
-                            "High": {"type": "number"},
-                            "Low": {"type": "number"},
-                            "Volume": {"type": "integer"}
-                        },
-                        "required": ["Date", "Close"]
-                    }
-                },
-                "Microsoft": {
-                    "type": "array",
-                    "items": {
-                        "type": "object",
-                        "properties": {
-                            "Date": {"type": "string"},
-                            "Close": {"type": "number"},
-                            "Open": {"type": "number"},
-                            "High": {"type": "number"},
-                            "Low": {"type": "number"},
-                            "Volume": {"type": "integer"}
-                        },
-                        "required": ["Date", "Close"]
-                    }
-                }
-            }
-        }
-
-        # Load stock data from local files
-        try:
-            apple_data = json.load(open(companies_paths["Apple"], "r", encoding="utf-8"))
-            meta_data = json.load(open(companies_paths["Meta"], "r", encoding="utf-8"))
-            msft_data = json.load(open(companies_paths["Microsoft"], "r", encoding="utf-8"))
-            apple_engine = JSONQueryEngine(json_value=apple_data, json_schema=stock_schema)
-            meta_engine = JSONQueryEngine(json_value=meta_data, json_schema=stock_schema)
-            msft_engine = JSONQueryEngine(json_value=msft_data, json_schema=stock_schema)
-        except Exception as e:
-            st.error(f"Error loading stock data: {e}")
-            apple_engine, meta_engine, msft_engine = None, None, None
-
-        # Initialize Llama-Index tools
-        tools = [
-            QueryEngineTool.from_defaults(
-                query_engine=apple_engine,
-                name="Apple_Financials",
-                description="Use this for questions about Apple's financial data."
-            ) if apple_engine else None,
-            QueryEngineTool.from_defaults(
-                query_engine=meta_engine,
-                name="Meta_Financials",
-                description="Use this for questions about Meta's financial data."
-            ) if meta_engine else None,
-            QueryEngineTool.from_defaults(
-                query_engine=msft_engine,
-                name="Microsoft_Financials",
-                description="Use this for questions about Microsoft's financial data."
-            ) if msft_engine else None,
-            QueryEngineTool.from_defaults(
-                query_engine=phrase_engine,
-                name="Phrasebank_Tool",
-                description="Use this to search phrases and sentiments in the financial phrasebank."
-            ) if phrase_engine else None,
-            QueryEngineTool.from_defaults(
-                query_engine=stage_engine,
-                name="Stage_Tool",
-                description="Use this for questions about company credit and maturity stages."
-            ) if stage_engine else None,
-        ]
-        tools = [tool for tool in tools if tool is not None]
-        
-        if not tools:
-            st.error("No valid query engines available. Please check data sources.")
-            return None
-
-       
-        try:
-            selector = LLMSingleSelector.from_defaults(llm=llm)
-            router_engine = RouterQueryEngine.from_defaults(
-                selector=selector,
-                query_engine_tools=tools,
-                llm=llm
-            )
-            return router_engine
-        except Exception as e:
-            st.error(f"Error initializing RouterQueryEngine: {e}")
-            return None
-    except Exception as e:
-        st.error(f"Error initializing query engine: {e}")
-        return None
-
-def run_query(query, router_engine):
-    """
-    Run a query using the provided RouterQueryEngine.
-    Args:
-        query (str): The query string (JSONPath or natural language).
-        router_engine (RouterQueryEngine): The initialized query engine.
-    Returns:
-        str: The query result as a string.
-    Raises:
-        Exception: If the query engine is not initialized, the query is empty, or an error occurs during processing.
-    """
-    if not router_engine:
-        raise Exception("Query engine is not initialized.")
-    if not query:
-        raise Exception("Query is empty.")
-    try:
-        response = router_engine.query(query)
-        return str(response)
-    except Exception as e:
-        raise Exception(f"Error processing query: {e}")
-
+import asyncio
+import os
+import time
+import streamlit as st
+import data_access
+import http_client
+import llm_scheduler
+import tracing
+from llama_index.llms.openrouter import OpenRouter
+from llama_index.core import Settings, Document
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.callbacks import CallbackManager
+from llama_index.core.query_engine import RouterQueryEngine
+from llama_index.core.tools import QueryEngineTool
+from llama_index.core.selectors import LLMSingleSelector
+from llama_index.core.indices.vector_store import VectorStoreIndex
+from llama_index.core.indices.struct_store import JSONQueryEngine
+from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+
+API_URL = http_client.API_URL
+# Deterministic local stand-ins instead of OpenRouter and bge-small (offline benchmarking)
+QUERY_ENGINE_OFFLINE = os.environ.get("QUERY_ENGINE_OFFLINE", "0").lower() in ("1", "true", "yes")
+
+
+class ScheduledOpenRouter(OpenRouter):
+    """OpenRouter LLM whose provider calls go through llm_scheduler (concurrency cap, rate limit, role priority)."""
+
+    def chat(self, messages, **kwargs):
+        with llm_scheduler.scheduler.slot():
+            return super().chat(messages, **kwargs)
+
+    def complete(self, prompt, formatted=False, **kwargs):
+        with llm_scheduler.scheduler.slot():
+            return super().complete(prompt, formatted=formatted, **kwargs)
+
+    def stream_chat(self, messages, **kwargs):
+        with llm_scheduler.scheduler.slot():
+            yield from super().stream_chat(messages, **kwargs)
+
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        with llm_scheduler.scheduler.slot():
+            yield from super().stream_complete(prompt, formatted=formatted, **kwargs)
+
+    async def achat(self, messages, **kwargs):
+        await asyncio.to_thread(llm_scheduler.scheduler.acquire, llm_scheduler.current_role.get())
+        try:
+            return await super().achat(messages, **kwargs)
+        finally:
+            llm_scheduler.scheduler.release()
+
+    async def acomplete(self, prompt, formatted=False, **kwargs):
+        await asyncio.to_thread(llm_scheduler.scheduler.acquire, llm_scheduler.current_role.get())
+        try:
+            return await super().acomplete(prompt, formatted=formatted, **kwargs)
+        finally:
+            llm_scheduler.scheduler.release()
+
+class RemoteEmbedding(BaseEmbedding):
+    """Embeddings from the shared embedding_service process, so this process never loads the model itself."""
+
+    url: str = ""
+    _client: object = PrivateAttr()
+
+    def __init__(self, url=None, timeout=None, **kwargs):
+        # Imported here: embedding_service pulls in FastAPI and uvicorn, which only the remote embedder needs.
+        import embedding_service
+
+        url = url or embedding_service.EMBEDDING_SERVICE_URL
+        timeout = embedding_service.EMBEDDING_SERVICE_TIMEOUT if timeout is None else timeout
+        kwargs.setdefault("model_name", f"remote:{url}")
+        # Index builds send this many texts per request; the service batches them together with other callers.
+        kwargs.setdefault("embed_batch_size", embedding_service.EMBED_MAX_BATCH)
+        super().__init__(url=url, **kwargs)
+        self._client = embedding_service.ServiceClient(url, timeout=timeout)
+
+    def _get_query_embedding(self, query):
+        return self._client.embed([query], kind="query")[0]
+
+    def _get_text_embedding(self, text):
+        return self._client.embed([text])[0]
+
+    def _get_text_embeddings(self, texts):
+        return self._client.embed(texts)
+
+    async def _aget_query_embedding(self, query):
+        return await asyncio.to_thread(self._get_query_embedding, query)
+
+    async def _aget_text_embedding(self, text):
+        return await asyncio.to_thread(self._get_text_embedding, text)
+
+def load_shared_dataset(name):
+    """
+    Return the process-wide parsed copy of a dataset, shared with the dashboard.
+    If this process has not loaded it yet, fetches it from the FastAPI endpoint and falls back to the local file.
+    Args:
+        name (str): Dataset name as used by data_access (e.g. "cleaned", "financial_phrasebank").
+    Returns:
+        data_access.Dataset: The parsed dataset.
+    """
+    dataset = data_access.get_cached(name)
+    if dataset is not None:
+        return dataset
+    try:
+        return data_access.fetch_from_api(name)
+    except Exception as e:
+        st.error(f"Error fetching {name} data from API: {e}. Trying local file.")
+        return data_access.load_dataset(name)
+
+def build_llm():
+    """Return the LLM for the router: OpenRouter behind the scheduler, or the offline stand-in."""
+    if QUERY_ENGINE_OFFLINE:
+        from offline_models import OfflineLLM
+        return OfflineLLM()
+    os.environ["OPENROUTER_API_KEY"] = "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"
+    return ScheduledOpenRouter(
+        api_key=os.environ["OPENROUTER_API_KEY"],
+        model="mistralai/mixtral-8x7b-instruct",
+        max_tokens=512,
+        context_window=4096,
+        http_client=llm_scheduler.http_client,
+    )
+
+def build_embed_model():
+    """Return the embedding model: the shared embedding service when EMBEDDING_SERVICE_URL is set, else a local one."""
+    if os.environ.get("EMBEDDING_SERVICE_URL"):
+        return RemoteEmbedding()
+    if QUERY_ENGINE_OFFLINE:
+        from offline_models import HashEmbedding
+        return HashEmbedding()
+    return HuggingFaceEmbedding(model_name="BAAI/bge-small-en-v1.5")
+
+def initialize_query_engine(companies_paths):
+    """
+    Initialize a RouterQueryEngine to handle financial queries for stock data, cleaned data, and financial phrasebank.
+    Reuses the datasets already parsed by data_access, fetching them from FastAPI endpoints or local files if needed.
+    Args:
+        companies_paths (dict): Dictionary containing file paths for stock data, cleaned data, and financial phrasebank.
+            Paths are resolved by data_access; the argument is kept for compatibility.
+    Returns:
+        RouterQueryEngine or None: Returns the initialized query engine or None if initialization fails.
+    """
+    try:
+       
+        Settings.callback_manager = CallbackManager([tracing.get_handler()])
+        llm = build_llm()
+        Settings.llm = llm
+        Settings.chunk_size = 1024
+        Settings.embed_model = build_embed_model()
+
+     
+        try:
+            dataset = load_shared_dataset("financial_phrasebank")
+            phrase_docs = [Document(text=f"{text} (Sentiment: {sentiment})") for text, sentiment in zip(dataset.texts, dataset.sentiments)]
+
+            phrase_index = VectorStoreIndex.from_documents(phrase_docs)
+            phrase_engine = phrase_index.as_query_engine(similarity_top_k=3)
+        except Exception as e:
+            st.error(f"Error loading financial_phrasebank data: {e}")
+            phrase_engine = None
+
+        stage_schema = {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "Index": {"type": "integer"},
+                    "Credit Expiration": {"type": "integer"},
+                    "DPD": {"type": "integer"},
+                    "FS": {"type": "string"},
+                    "CDR": {"type": "string"},
+                    "SICR": {"type": "string"},
+                    "Follow Up": {"type": "string"},
+                    "Rescheduled": {"type": "string"},
+                    "Restructuring": {"type": "string"},
+                    "Covenant": {"type": "string"},
+                    "Turnover": {"type": "string"},
+                    "Group Reason": {"type": "string"},
+                    "Current Stage": {"type": "integer"},
+                    "Stage As last Month": {"type": "integer"}
+                },
+                "required": ["Credit Expiration", "Current Stage", "DPD"]
+            }
+        }
+
+        try:
+            stage_data = load_shared_dataset("cleaned").records
+            stage_engine = JSONQueryEngine(json_value=stage_data, json_schema=stage_schema)
+        except Exception as e:
+            st.error(f"Error loading cleaned data: {e}")
+            stage_engine = None
+
+      
+        stock_schema = {
+            "type": "object",
+            "properties": {
+                "Apple": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "Date": {"type": "string"},
+                            "Close": {"type": "number"},
+                            "Open": {"type": "number"},
+                            "High": {"type": "number"},
+                            "Low": {"type": "number"},
+                            "Volume": {"type": "integer"}
+                        },
+                        "required": ["Date", "Close"]
+                    }
+                },
+                "Meta": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "Date": {"type": "string"},
+                            "Close": {"type": "number"},
+                            "Open": {"type": "number"},
+                            "High": {"type": "number"},
+                            "Low": {"type": "number"},
+                            "Volume": {"type": "integer"}
+                        },
+                        "required": ["Date", "Close"]
+                    }
+                },
+                "Microsoft": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "Date": {"type": "string"},
+                            "Close": {"type": "number"},
+                            "Open": {"type": "number"},
+                            "High": {"type": "number"},
+                            "Low": {"type": "number"},
+                            "Volume": {"type": "integer"}
+                        },
+                        "required": ["Date", "Close"]
+                    }
+                }
+            }
+        }
+
+        # Load stock data from the shared local datasets
+        try:
+            apple_data = {"Apple": data_access.get_records("Apple")}
+            meta_data = {"Meta": data_access.get_records("Meta")}
+            msft_data = {"Microsoft": data_access.get_records("Microsoft")}
+            apple_engine = JSONQueryEngine(json_value=apple_data, json_schema=stock_schema)
+            meta_engine = JSONQueryEngine(json_value=meta_data, json_schema=stock_schema)
+            msft_engine = JSONQueryEngine(json_value=msft_data, json_schema=stock_schema)
+        except Exception as e:
+            st.error(f"Error loading stock data: {e}")
+            apple_engine, meta_engine, msft_engine = None, None, None
+
+        # Initialize Llama-Index tools
+        tools = [
+            QueryEngineTool.from_defaults(
+                query_engine=apple_engine,
+                name="Apple_Financials",
+                description="Use this for questions about Apple's financial data."
+            ) if apple_engine else None,
+            QueryEngineTool.from_defaults(
+                query_engine=meta_engine,
+                name="Meta_Financials",
+                description="Use this for questions about Meta's financial data."
+            ) if meta_engine else None,
+            QueryEngineTool.from_defaults(
+                query_engine=msft_engine,
+                name="Microsoft_Financials",
+                description="Use this for questions about Microsoft's financial data."
+            ) if msft_engine else None,
+            QueryEngineTool.from_defaults(
+                query_engine=phrase_engine,
+                name="Phrasebank_Tool",
+                description="Use this to search phrases and sentiments in the financial phrasebank."
+            ) if phrase_engine else None,
+            QueryEngineTool.from_defaults(
+                query_engine=stage_engine,
+                name="Stage_Tool",
+                description="Use this for questions about company credit and maturity stages."
+            ) if stage_engine else None,
+        ]
+        tools = [tool for tool in tools if tool is not None]
+        
+        if not tools:
+            st.error("No valid query engines available. Please check data sources.")
+            return None
+
+       
+        try:
+            selector = LLMSingleSelector.from_defaults(llm=llm)
+            router_engine = RouterQueryEngine.from_defaults(
+                selector=selector,
+                query_engine_tools=tools,
+                llm=llm
+            )
+            return router_engine
+        except Exception as e:
+            st.error(f"Error initializing RouterQueryEngine: {e}")
+            return None
+    except Exception as e:
+        st.error(f"Error initializing query engine: {e}")
+        return None
+
+def run_query(query, router_engine):
+    """
+    Run a query using the provided RouterQueryEngine.
+    Args:
+        query (str): The query string (JSONPath or natural language).
+        router_engine (RouterQueryEngine): The initialized query engine.
+    Returns:
+        str: The query result as a string.
+    Raises:
+        Exception: If the query engine is not initialized, the query is empty, or an error occurs during processing.
+    """
+    if not router_engine:
+        raise Exception("Query engine is not initialized.")
+    if not query:
+        raise Exception("Query is empty.")
+    try:
+        response = router_engine.query(query)
+        return str(response)
+    except Exception as e:
+        raise Exception(f"Error processing query: {e}")
+
+
+def selected_tool(router_engine, response):
+    """
+    Return the name(s) of the tool(s) the router picked for ``response``, or None if unknown.
+    RouterQueryEngine records its selector result in ``response.metadata["selector_result"]``.
+    """
+    result = (getattr(response, "metadata", None) or {}).get("selector_result")
+    metadatas = getattr(router_engine, "_metadatas", None) or []
+    try:
+        names = [metadatas[index].name for index in result.inds]
+    except (AttributeError, IndexError, TypeError):
+        return None
+    return ", ".join(names) or None
+
+
+def run_query_detailed(query, router_engine, role=None):
+    """
+    Run a query like ``run_query`` and report how it was answered.
+    Every call is traced (see tracing.py).
+    Args:
+        query (str): The query string (JSONPath or natural language).
+        router_engine (RouterQueryEngine): The initialized query engine.
+        role (str, optional): Role of the requesting user; sets the LLM scheduler priority.
+    Returns:
+        dict: {"answer": str, "tool": str or None, "latency_ms": float,
+        "stages_ms": {stage: ms}, "tokens": {"prompt", "completion"}}.
+    Raises:
+        Exception: Same conditions as ``run_query``.
+    """
+    if not router_engine:
+        raise Exception("Query engine is not initialized.")
+    if not query:
+        raise Exception("Query is empty.")
+    start = time.perf_counter()
+    with tracing.trace_query(query, role=role) as trace:
+        try:
+            with llm_scheduler.for_role(role):
+                response = router_engine.query(query)
+        except Exception as e:
+            raise Exception(f"Error processing query: {e}")
+        trace.tool = selected_tool(router_engine, response)
+        return {
+            "answer": str(response),
+            "tool": trace.tool,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+            "stages_ms": trace.stage_ms(),
+            "tokens": trace.tokens(),
+        }
@@ -0,0 +1,66 @@
+"""
+Append-only JSON Lines log of the queries the backend answers.
+
+Each line records one query with the requesting role, the tool the router chose,
+the latency and whether it succeeded, which is what ``benchmarks.replay_queries``
+needs to replay real traffic offline. Recording is off unless QUERY_LOG_ENABLED is set.
+
+Configuration (environment variables):
+    QUERY_LOG_ENABLED   Record answered queries (default 0)
+    QUERY_LOG_PATH      Log file (default <repo>/query_log.jsonl)
+"""
+import json
+import os
+import threading
+import time
+
+
+QUERY_LOG_ENABLED = os.environ.get("QUERY_LOG_ENABLED", "0").lower() in ("1", "true", "yes")
+QUERY_LOG_PATH = os.environ.get(
+    "QUERY_LOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_log.jsonl")
+)
+
+_lock = threading.Lock()
+
+
+def record(query, role=None, result=None, error=None, path=None):
+    """
+    Append one query to the log (no-op unless QUERY_LOG_ENABLED or an explicit ``path`` is given).
+    Args:
+        query (str): The query text.
+        role (str, optional): Role of the requesting user.
+        result (dict, optional): ``run_query_detailed`` output; tool and latency are kept, not the answer.
+        error (str, optional): Error message if the query failed.
+        path (str, optional): Overrides QUERY_LOG_PATH.
+    """
+    if not (QUERY_LOG_ENABLED or path):
+        return
+    entry = {
+        "ts": time.time(),
+        "query": query,
+        "role": role,
+        "tool": (result or {}).get("tool"),
+        "latency_ms": (result or {}).get("latency_ms"),
+        "ok": error is None,
+    }
+    if error is not None:
+        entry["error"] = error
+    line = json.dumps(entry, ensure_ascii=False) + "\n"
+    with _lock:
+        with open(path or QUERY_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+def load(path=None):
+    """Return the logged entries from ``path`` (default QUERY_LOG_PATH), skipping malformed lines."""
+    entries = []
+    with open(path or QUERY_LOG_PATH, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    return entries
@@ -0,0 +1,193 @@
+"""
+Password hashing and session tokens for the API.
+
+bcrypt is deliberately slow (about 100-300 ms per call at the default cost), so the
+async route handlers must not call it directly. Hashing and verification run in a
+bounded thread pool instead (bcrypt releases the GIL), which keeps the event loop
+free and caps how many cores sign-ins can occupy at once.
+
+Login checks the password once and issues an HMAC-signed session token carrying
+the username, role and expiry. Protected routes validate the token instead of
+re-checking the password or loading the user, and verified tokens are kept in a
+small in-process cache so repeat requests skip the HMAC and JSON work too.
+
+Bulk imports hash many passwords at once, so ``hash_passwords_parallel`` spreads
+them over a process pool sized to every core instead of the bounded thread pool.
+
+Configuration (environment variables):
+    BCRYPT_ROUNDS       bcrypt cost factor for new hashes (default 12)
+    HASH_WORKERS        Size of the hashing thread pool (default min(4, CPU count))
+    IMPORT_HASH_WORKERS Size of the bulk-import hashing process pool (default CPU count)
+    SESSION_SECRET      Key used to sign session tokens (default: random per process, so
+                        multi-worker deployments must set it; see gunicorn_conf.py)
+    SESSION_TTL         Token lifetime in seconds (default 28800)
+    TOKEN_CACHE_SIZE    Verified tokens kept in memory (default 10000)
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+IMPORT_HASH_WORKERS = int(os.environ.get("IMPORT_HASH_WORKERS", str(os.cpu_count() or 1)))
+SESSION_SECRET = os.environ.get("SESSION_SECRET") or secrets.token_urlsafe(32)
+SESSION_TTL = int(os.environ.get("SESSION_TTL", str(8 * 60 * 60)))
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "10000"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+_hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+# Created on first bulk import so ordinary API processes never fork workers.
+_import_executor = None
+_import_executor_lock = threading.Lock()
+
+
+def get_password_hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+async def hash_password_async(password: str) -> str:
+    """Hash ``password`` on the hashing pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, get_password_hash, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify ``plain_password`` on the hashing pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, verify_password, plain_password, hashed_password)
+
+
+def hash_passwords(passwords: list) -> list:
+    """Hash every password in ``passwords``; runs inside the bulk-import worker processes."""
+    return [pwd_context.hash(password) for password in passwords]
+
+
+def _get_import_executor() -> ProcessPoolExecutor:
+    global _import_executor
+    with _import_executor_lock:
+        if _import_executor is None:
+            _import_executor = ProcessPoolExecutor(max_workers=IMPORT_HASH_WORKERS)
+        return _import_executor
+
+
+async def hash_passwords_parallel(passwords: list) -> list:
+    """
+    Hash ``passwords`` across the import process pool, one chunk per worker.
+    Args:
+        passwords (list): Plain-text passwords.
+    Returns:
+        list: Hashes in the same order as ``passwords``.
+    """
+    if not passwords:
+        return []
+    loop = asyncio.get_running_loop()
+    executor = _get_import_executor()
+    size = -(-len(passwords) // IMPORT_HASH_WORKERS)
+    chunks = [passwords[i:i + size] for i in range(0, len(passwords), size)]
+    results = await asyncio.gather(*(loop.run_in_executor(executor, hash_passwords, chunk) for chunk in chunks))
+    return [hashed for chunk in results for hashed in chunk]
+
+
+class InvalidTokenError(Exception):
+    """Raised when a session token is malformed, forged, expired or revoked."""
+
+
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
+# username -> time before which that user's tokens are no longer accepted
+_revoked_before = {}
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(SESSION_SECRET.encode("utf-8"), payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def create_session_token(username: str, role: str) -> str:
+    """Issue a signed token for ``username`` valid for SESSION_TTL seconds."""
+    now = time.time()
+    claims = {"sub": username, "role": role, "iat": now, "exp": now + SESSION_TTL}
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return f"{payload}.{_sign(payload)}"
+
+
+def _check_claims(claims: dict) -> dict:
+    if claims["exp"] <= time.time():
+        raise InvalidTokenError("Session expired")
+    if claims["iat"] < _revoked_before.get(claims["sub"], 0):
+        raise InvalidTokenError("Session revoked")
+    return claims
+
+
+def decode_session_token(token: str) -> dict:
+    """
+    Validate a session token and return its claims (sub, role, iat, exp).
+    Raises:
+        InvalidTokenError: If the token is malformed, has a bad signature, or is expired or revoked.
+    """
+    with _token_cache_lock:
+        claims = _token_cache.get(token)
+        if claims is not None:
+            _token_cache.move_to_end(token)
+    if claims is not None:
+        return _check_claims(claims)
+
+    try:
+        payload, signature = token.split(".", 1)
+        valid = hmac.compare_digest(signature.encode("ascii"), _sign(payload).encode("ascii"))
+    except (AttributeError, ValueError):
+        raise InvalidTokenError("Malformed session token")
+    if not valid:
+        raise InvalidTokenError("Invalid session token")
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        raise InvalidTokenError("Malformed session token")
+    _check_claims(claims)
+
+    with _token_cache_lock:
+        _token_cache[token] = claims
+        if len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    return claims
+
+
+def revoke_user_tokens(username: str, revoked_at: float = None):
+    """
+    Reject every token issued to ``username`` before ``revoked_at`` (default now), e.g. after a role
+    change or deletion. Revocations made by other worker processes are applied with their own timestamp.
+    """
+    revoked_at = time.time() if revoked_at is None else revoked_at
+    _revoked_before[username] = max(_revoked_before.get(username, 0), revoked_at)
+    with _token_cache_lock:
+        for token in [t for t, claims in _token_cache.items() if claims["sub"] == username]:
+            del _token_cache[token]
+
+
+def shutdown():
+    """Stop the hashing pools; called when the API shuts down."""
+    _hash_executor.shutdown(wait=False, cancel_futures=True)
+    if _import_executor is not None:
+        _import_executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,50 @@
+import mmap
+import os
+
+import numpy as np
+
+import columnar
+
+
+RECORDS = [
+    {"Date": f"2024-01-0{day}", "Close": 100.0 + day, "Open": 99.0 + day, "Volume": 1000 * day, "Note": "x"}
+    for day in range(1, 8)
+]
+
+
+def _mapped_file(array):
+    """Return the file a column's memory is mapped from, or None if it lives on the heap."""
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return array.filename
+        if isinstance(array, mmap.mmap):
+            return "<mmap>"
+        array = getattr(array, "base", None)
+    return None
+
+
+def test_read_frame_shares_mapped_memory(tmp_path, monkeypatch):
+    monkeypatch.setattr(columnar, "COLUMNAR_DIR", str(tmp_path))
+    columnar.write_dataset("Apple", RECORDS)
+
+    frame = columnar.read_frame("Apple")
+
+    assert len(frame) == len(RECORDS)
+    for column in ("Date", "Close", "Open", "Volume"):
+        values = frame[column].to_numpy()
+        assert _mapped_file(values) is not None, column
+        assert not values.flags.writeable
+    assert list(frame["Note"]) == ["x"] * len(RECORDS)
+
+
+def test_read_frame_columns_are_views_of_the_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(columnar, "COLUMNAR_DIR", str(tmp_path))
+    columnar.write_dataset("Apple", RECORDS)
+    arrays, _ = columnar.open_dataset("Apple")
+    monkeypatch.setattr(columnar, "open_dataset", lambda name, source_path=None: (arrays, {}))
+
+    frame = columnar.read_frame("Apple")
+
+    for column in ("Date", "Close", "Open", "Volume"):
+        assert np.shares_memory(frame[column].to_numpy(), arrays[column]), column
+    assert os.path.samefile(_mapped_file(frame["Close"].to_numpy()), os.path.join(tmp_path, "Apple", "c1.npy"))
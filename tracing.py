@@ -0,0 +1,317 @@
+"""
+Per-stage tracing of query answering.
+
+``trace_query`` opens a trace for one query and, when it ends, appends it as one
+JSON line to the trace log: total latency, chosen tool, prompt/completion
+tokens and spans for each pipeline stage. The spans come from a llama-index
+callback handler (``get_handler``, registered by query_engine), which attributes
+callback events to the trace of the calling thread:
+- routing: the router's selector LLM call (the first LLM call directly under
+  the router's QUERY event);
+- retrieval: RETRIEVE and EMBEDDING events;
+- jsonpath: the JSON engines' path-generation LLM calls, recognised by their
+  prompt, which asks for the answer in the "JSONPath: <path>" format;
+- synthesis: every other LLM call and SYNTHESIZE event.
+Nested events of the same stage count once. Token counts come from the
+provider's usage report when present, otherwise they are estimated as
+characters / 4 and flagged as estimated.
+
+The log lives outside the repository and is rotated once it reaches
+TRACE_LOG_MAX_BYTES (the previous log is kept as <path>.1). ``read_traces``
+keeps the tail it has parsed and only reads lines appended since the last call.
+
+Configuration (environment variables):
+    TRACE_LOG_ENABLED    Write traces to the log (default 1)
+    TRACE_LOG_PATH       Trace log file (default $XDG_STATE_HOME/financial-insights/trace_log.jsonl,
+                         i.e. ~/.local/state/financial-insights/trace_log.jsonl)
+    TRACE_LOG_MAX_BYTES  Size at which the log is rotated (default 10 MB)
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import instrumentation
+
+
+TRACE_LOG_ENABLED = os.environ.get("TRACE_LOG_ENABLED", "1").lower() in ("1", "true", "yes")
+TRACE_LOG_PATH = os.environ.get("TRACE_LOG_PATH") or os.path.join(
+    os.environ.get("XDG_STATE_HOME") or os.path.join(os.path.expanduser("~"), ".local", "state"),
+    "financial-insights",
+    "trace_log.jsonl",
+)
+TRACE_LOG_MAX_BYTES = int(os.environ.get("TRACE_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+STAGES = ["routing", "retrieval", "jsonpath", "synthesis"]
+# JSONQueryEngine's path prompt asks for the answer in the "JSONPath: <path>" format
+JSONPATH_PROMPT_MARKER = "JSONPath:"
+
+_current = contextvars.ContextVar("query_trace", default=None)
+_write_lock = threading.Lock()
+_read_lock = threading.Lock()
+_tails = {}  # path -> {"inode", "offset", "traces": deque}
+_handler = None
+_handler_lock = threading.Lock()
+
+
+class QueryTrace:
+    def __init__(self, query, role=None):
+        self.id = uuid.uuid4().hex
+        self.query = query
+        self.role = role
+        self.tool = None
+        self.started_at = time.time()
+        self.spans = []
+        self.tokens_estimated = False
+        # Callback bookkeeping: event id -> {"stage", "within", "parent", "start", "prompt"}
+        self.events = {}
+        self.root_query = None
+        self.routed = False
+
+    def add_span(self, stage, seconds, prompt_tokens=0, completion_tokens=0):
+        self.spans.append({
+            "stage": stage,
+            "ms": round(seconds * 1000, 2),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+        })
+
+    def stage_ms(self):
+        """Total milliseconds per stage."""
+        totals = dict.fromkeys(STAGES, 0.0)
+        for span in self.spans:
+            totals[span["stage"]] = round(totals[span["stage"]] + span["ms"], 2)
+        return totals
+
+    def tokens(self):
+        return {
+            "prompt": sum(span["prompt_tokens"] for span in self.spans),
+            "completion": sum(span["completion_tokens"] for span in self.spans),
+        }
+
+    def to_dict(self, seconds, error=None):
+        return {
+            "id": self.id,
+            "ts": self.started_at,
+            "query": self.query,
+            "role": self.role,
+            "tool": self.tool,
+            "ok": error is None,
+            "error": error,
+            "latency_ms": round(seconds * 1000, 2),
+            "stages_ms": self.stage_ms(),
+            "tokens": self.tokens(),
+            "tokens_estimated": self.tokens_estimated,
+            "spans": self.spans,
+        }
+
+
+def current_trace():
+    return _current.get()
+
+
+@contextmanager
+def trace_query(query, role=None):
+    """Trace the enclosed query answering and log it when the block exits."""
+    trace = QueryTrace(query, role)
+    token = _current.set(trace)
+    start = time.perf_counter()
+    error = None
+    try:
+        yield trace
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        _current.reset(token)
+        seconds = time.perf_counter() - start
+        instrumentation.observe("query_seconds", seconds, tool=trace.tool or "unknown")
+        if TRACE_LOG_ENABLED:
+            write_trace(trace.to_dict(seconds, error))
+
+
+def write_trace(entry, path=None):
+    """Append ``entry`` to the trace log, rotating it to ``<path>.1`` once it exceeds TRACE_LOG_MAX_BYTES."""
+    path = path or TRACE_LOG_PATH
+    line = json.dumps(entry, ensure_ascii=False) + "\n"
+    with _write_lock:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+            size = f.tell()
+        if TRACE_LOG_MAX_BYTES > 0 and size >= TRACE_LOG_MAX_BYTES:
+            os.replace(path, path + ".1")
+
+
+def _parse_lines(lines, traces):
+    for line in lines:
+        try:
+            traces.append(json.loads(line))
+        except ValueError:
+            continue
+
+
+def read_traces(path=None, limit=5000):
+    """
+    Return the last ``limit`` traces from the log and its rotated predecessor (empty if there is no log yet).
+    The parsed tail is kept between calls, so only lines appended since the previous call are read,
+    unless the log was rotated or a larger ``limit`` is asked for.
+    """
+    path = path or TRACE_LOG_PATH
+    with _read_lock:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            _tails.pop(path, None)
+            stat = None
+        tail = _tails.get(path)
+        if tail is None or stat is None or tail["inode"] != stat.st_ino or stat.st_size < tail["offset"] \
+                or tail["traces"].maxlen < limit:
+            tail = {"inode": stat.st_ino if stat else None, "offset": 0, "traces": deque(maxlen=limit)}
+            try:
+                with open(path + ".1", encoding="utf-8") as f:
+                    _parse_lines(deque(f, maxlen=limit), tail["traces"])
+            except FileNotFoundError:
+                pass
+            if stat is not None:
+                _tails[path] = tail
+        if stat is not None and stat.st_size > tail["offset"]:
+            with open(path, "rb") as f:
+                f.seek(tail["offset"])
+                chunk = f.read(stat.st_size - tail["offset"])
+            # Only complete lines are consumed; a line still being written is read next time.
+            complete = chunk[:chunk.rfind(b"\n") + 1]
+            tail["offset"] += len(complete)
+            _parse_lines(complete.decode("utf-8", errors="replace").splitlines(), tail["traces"])
+        traces = list(tail["traces"])
+    return traces[-limit:]
+
+
+def summarize(traces):
+    """
+    Aggregate traces per tool.
+    Returns:
+        dict: tool (or "*" for all) -> {queries, errors, latency_ms {p50, p95, p99},
+        stages_p50_ms, prompt_tokens, completion_tokens}.
+    """
+    groups = defaultdict(list)
+    for trace in traces:
+        groups["*"].append(trace)
+        groups[trace.get("tool") or "unknown"].append(trace)
+
+    def percentiles(values):
+        return {f"p{q}": instrumentation.percentile(values, q) for q in (50, 95, 99)}
+
+    summary = {}
+    for tool, group in groups.items():
+        summary[tool] = {
+            "queries": len(group),
+            "errors": sum(1 for trace in group if not trace.get("ok", True)),
+            "latency_ms": percentiles([trace["latency_ms"] for trace in group]),
+            "stages_p50_ms": {
+                stage: instrumentation.percentile([trace["stages_ms"].get(stage, 0) for trace in group], 50)
+                for stage in STAGES
+            },
+            "prompt_tokens": sum(trace["tokens"]["prompt"] for trace in group),
+            "completion_tokens": sum(trace["tokens"]["completion"] for trace in group),
+        }
+    return summary
+
+
+def _estimate_tokens(text):
+    return max(1, len(text) // 4) if text else 0
+
+
+def _usage(response):
+    raw = getattr(response, "raw", None)
+    usage = raw.get("usage") if isinstance(raw, dict) else getattr(raw, "usage", None)
+    if usage is None:
+        return None
+    if not isinstance(usage, dict):
+        usage = {"prompt_tokens": getattr(usage, "prompt_tokens", 0), "completion_tokens": getattr(usage, "completion_tokens", 0)}
+    return usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0
+
+
+def get_handler():
+    """Return the process-wide llama-index callback handler that feeds ``current_trace``."""
+    global _handler
+    with _handler_lock:
+        if _handler is None:
+            _handler = _make_handler()
+        return _handler
+
+
+def _make_handler():
+    from llama_index.core.callbacks import CBEventType, EventPayload
+    from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+
+    def stage_of(trace, event_type, parent_id, prompt):
+        if event_type in (CBEventType.RETRIEVE, CBEventType.EMBEDDING):
+            return "retrieval"
+        if event_type == CBEventType.SYNTHESIZE:
+            return "synthesis"
+        if event_type == CBEventType.LLM:
+            if parent_id == trace.root_query and not trace.routed:
+                trace.routed = True
+                return "routing"
+            if prompt and JSONPATH_PROMPT_MARKER in prompt:
+                return "jsonpath"
+            return "synthesis"
+        return None
+
+    class TraceHandler(BaseCallbackHandler):
+        def __init__(self):
+            super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+
+        def start_trace(self, trace_id=None):
+            pass
+
+        def end_trace(self, trace_id=None, trace_map=None):
+            pass
+
+        def on_event_start(self, event_type, payload=None, event_id="", parent_id="", **kwargs):
+            trace = _current.get()
+            if trace is None:
+                return event_id
+            if event_type == CBEventType.QUERY and trace.root_query is None:
+                trace.root_query = event_id
+            prompt = None
+            if event_type == CBEventType.LLM and payload:
+                prompt = payload.get(EventPayload.PROMPT) or "\n".join(
+                    str(message) for message in payload.get(EventPayload.MESSAGES) or []
+                )
+            stage = within = stage_of(trace, event_type, parent_id, prompt)
+            ancestor = parent_id
+            while stage and ancestor in trace.events:
+                if trace.events[ancestor]["stage"] == stage:
+                    stage = None
+                ancestor = trace.events[ancestor]["parent"]
+            trace.events[event_id] = {
+                "stage": stage, "within": within, "parent": parent_id, "start": time.perf_counter(), "prompt": prompt,
+            }
+            return event_id
+
+        def on_event_end(self, event_type, payload=None, event_id="", **kwargs):
+            trace = _current.get()
+            event = trace.events.get(event_id) if trace is not None else None
+            if event is None:
+                return
+            seconds = time.perf_counter() - event["start"]
+            prompt_tokens = completion_tokens = 0
+            if event_type == CBEventType.LLM and payload:
+                response = payload.get(EventPayload.RESPONSE) or payload.get(EventPayload.COMPLETION)
+                usage = _usage(response)
+                if usage is None:
+                    trace.tokens_estimated = True
+                    usage = _estimate_tokens(event["prompt"]), _estimate_tokens(str(response or ""))
+                prompt_tokens, completion_tokens = usage
+            if event["stage"]:
+                trace.add_span(event["stage"], seconds, prompt_tokens, completion_tokens)
+            elif event["within"] and (prompt_tokens or completion_tokens):
+                # An LLM call nested in a stage already being timed: count its tokens, not its time.
+                trace.add_span(event["within"], 0.0, prompt_tokens, completion_tokens)
+
+    return TraceHandler()
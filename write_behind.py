@@ -0,0 +1,150 @@
+"""
+Write-behind buffer for high-volume inserts (suggestions and evaluations).
+
+Rows are queued in memory and group-committed by a background task every
+``interval_ms`` milliseconds or as soon as ``max_rows`` rows are pending, so a
+burst of feedback costs one transaction per batch instead of one per row.
+``stop`` flushes whatever is still pending, and is called on API shutdown.
+
+Queued rows have already been acknowledged to the client, so a failed flush
+does not lose them: the batch goes back to the front of the queue and is retried
+with exponential backoff. A row is only dropped, and logged, once it has failed
+``max_attempts`` flushes. The queue is bounded by ``max_pending`` rows; ``add``
+raises ``BufferFullError`` beyond that so the API can answer 503 instead of
+growing memory while the database is slow or locked.
+"""
+import asyncio
+import json
+from collections import defaultdict
+
+import instrumentation
+
+
+class BufferFullError(Exception):
+    """Raised by ``WriteBehindBuffer.add`` when accepting the rows would exceed ``max_pending``."""
+
+
+class WriteBehindBuffer:
+    def __init__(self, session_factory, writer, interval_ms=200, max_rows=500, max_pending=10000,
+                 max_attempts=5, retry_backoff_ms=100, max_backoff_ms=5000):
+        """
+        Args:
+            session_factory: Callable returning an async session context manager.
+            writer: ``async def writer(db, model, rows)`` that inserts ``rows`` (dicts) for ``model``
+                inside the caller's transaction.
+            interval_ms (int): Maximum time a row waits before being flushed.
+            max_rows (int): Pending row count that triggers an immediate flush.
+            max_pending (int): Maximum number of queued rows, including rows waiting for a retry.
+            max_attempts (int): Failed flushes after which a row is dropped and logged.
+            retry_backoff_ms (int): Delay before the first retry; doubled after each consecutive failure.
+            max_backoff_ms (int): Upper bound for the retry delay.
+        """
+        self.session_factory = session_factory
+        self.writer = writer
+        self.interval = interval_ms / 1000
+        self.max_rows = max_rows
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff_ms / 1000
+        self.max_backoff = max_backoff_ms / 1000
+        # (model, row, failed attempts so far)
+        self._pending = []
+        self._failures = 0
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._stopping = False
+        self._task = None
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def add(self, model, rows):
+        """
+        Queue ``rows`` (list of column dicts) for insertion into ``model``'s table.
+        Raises:
+            BufferFullError: If the queue cannot take all of ``rows``; none of them are queued.
+        """
+        if len(self._pending) + len(rows) > self.max_pending:
+            instrumentation.increment("write_behind_rows_rejected", len(rows))
+            raise BufferFullError(f"Write-behind queue is full ({self.max_pending} rows)")
+        self._pending.extend((model, row, 0) for row in rows)
+        if len(self._pending) >= self.max_rows:
+            self._wakeup.set()
+
+    def _retry_delay(self):
+        return min(self.retry_backoff * 2 ** (self._failures - 1), self.max_backoff)
+
+    async def _run(self):
+        while not self._stopping:
+            if self._failures:
+                # Back off after a failed flush, even if new rows keep arriving.
+                await asyncio.sleep(self._retry_delay())
+            else:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Write-behind flush failed: {str(e)}")
+
+    async def flush(self):
+        """Insert every pending row in one transaction; returns the number of rows written."""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, []
+            grouped = defaultdict(list)
+            for model, row, _ in batch:
+                grouped[model].append(row)
+            try:
+                with instrumentation.timer("write_behind_flush_seconds"):
+                    async with self.session_factory() as db:
+                        for model, rows in grouped.items():
+                            await self.writer(db, model, rows)
+                        await db.commit()
+            except Exception:
+                self._failures += 1
+                self._requeue(batch)
+                raise
+            self._failures = 0
+            instrumentation.increment("write_behind_rows_flushed", len(batch))
+            return len(batch)
+
+    def _requeue(self, batch):
+        """Put a failed batch back at the front of the queue, dropping (and logging) rows out of attempts."""
+        retry, dropped = [], []
+        for model, row, attempts in batch:
+            if attempts + 1 >= self.max_attempts:
+                dropped.append((model, row))
+            else:
+                retry.append((model, row, attempts + 1))
+        self._pending[:0] = retry
+        instrumentation.increment("write_behind_flush_failures")
+        if dropped:
+            instrumentation.increment("write_behind_rows_dropped", len(dropped))
+            print(f"Write-behind dropped {len(dropped)} rows after {self.max_attempts} failed flushes:")
+            for model, row in dropped:
+                print(f"  {model.__tablename__}: {json.dumps(row, default=str)}")
+
+    async def stop(self):
+        """Stop the background task and flush the remaining rows."""
+        self._stopping = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        while self._pending:
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Write-behind flush failed: {str(e)}")
+                if self._pending:
+                    await asyncio.sleep(self._retry_delay())